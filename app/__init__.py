@@ -1,18 +1,16 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, abort, jsonify, render_template, request, redirect, stream_with_context, url_for, flash
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timezone, timedelta
 from flask import request
 import pandas as pd
 import io
 from flask import send_file
-from sqlalchemy import extract
+from sqlalchemy import event, extract
 from sqlalchemy.orm import joinedload, load_only
 from sqlalchemy.exc import IntegrityError
 from flask import session
 from werkzeug.security import check_password_hash, generate_password_hash
 from functools import wraps
-from decimal import Decimal
-from statistics import median
 import logging
 
 def login_required(f):
@@ -242,6 +240,8 @@ class Contrato(db.Model):
     contrato = db.Column(db.String(50), unique=True)
     vendedor_id = db.Column(db.Integer, db.ForeignKey('vendedores.id'))
     dias_atraso = db.Column(db.Integer, nullable=True)
+    # Dia em que a automação volta a verificar o contrato (NULL = recalcular)
+    proxima_checagem = db.Column(db.Date, nullable=True, index=True)
     
     # NOTA: "Cliente Morto" é um STATUS (não um campo booleano)
     # Contratos mortos: 63+ dias de atraso SEM multa
@@ -253,6 +253,16 @@ class Contrato(db.Model):
 
     vendedor = db.relationship('Vendedor', backref=db.backref('contratos', lazy=True))
 
+
+def _invalidar_proxima_checagem(contrato, valor, anterior, iniciador):
+    """Status, vigência ou data de checagem mudaram: a automação recalcula a agenda."""
+    if valor != anterior:
+        contrato.proxima_checagem = None
+
+
+for _coluna in (Contrato.status, Contrato.data_vigencia, Contrato.data_checagem):
+    event.listen(_coluna, "set", _invalidar_proxima_checagem)
+
 # Modelo Vendedor
 class Vendedor(db.Model):
     __tablename__ = 'vendedores'
@@ -270,10 +280,36 @@ class AcaoCobranca(db.Model):
     mensagem = db.Column(db.Text)
     dia_atraso = db.Column(db.Integer)
     parcela = db.Column(db.Integer)
-    enviada_em = db.Column(db.DateTime)
+    enviada_em = db.Column(db.DateTime, index=True)
     status_envio = db.Column(db.String(50))
     usuario = db.Column(db.String(255), nullable=True)
 
+    __table_args__ = (
+        # Uma ação da automação por contrato e dia de atraso (as manuais podem repetir)
+        db.Index(
+            "uq_acoes_cobranca_robo_contrato_dia", "contrato_id", "dia_atraso", unique=True,
+            postgresql_where=db.text("status_envio = 'Enviado'"),
+            sqlite_where=db.text("status_envio = 'Enviado'"),
+        ),
+    )
+
+
+class FaturaSnapshot(db.Model):
+    """
+    Faturas lidas no portal pela automação. Uma linha por versão do conteúdo
+    (hash): enquanto as faturas não mudam, só ultima_checagem avança.
+    """
+    __tablename__ = "faturas_snapshot"
+    id = db.Column(db.Integer, primary_key=True)
+    contrato_id = db.Column(db.Integer, db.ForeignKey("contratos.id"), nullable=False, index=True)
+    primeira_checagem = db.Column(db.Date, nullable=False)
+    ultima_checagem = db.Column(db.Date, nullable=False)
+    hash = db.Column(db.String(64), nullable=False)
+    # Mês, vigência, D+3 e faturas vencidas na última análise (scripts/faturas.py)
+    contexto = db.Column(db.String(40))
+    status = db.Column(db.String(50))
+    quantidade = db.Column(db.Integer)
+    faturas = db.Column(db.JSON, nullable=False)
 
 
 class ResponsavelCobranca(db.Model):
@@ -290,6 +326,45 @@ class Usuario(db.Model):
     senha = db.Column(db.String(255), nullable=False)
     tipo = db.Column(db.String(20), nullable=False)  # admin ou usuario
 
+class VersaoDados(db.Model):
+    """Contador de versão por tabela, avançado a cada escrita (usado para invalidar caches)."""
+    __tablename__ = "versao_dados"
+    tabela = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.BigInteger, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime)
+
+# Módulos auxiliares (importados após os modelos por dependerem deles)
+from app.relatorios import metricas_vivos_sql
+from app.analise_carteira import metricas_vivos
+from app.cache_relatorios import cache_relatorios
+from app.exportacao import (
+    escrever_base_completa, TABELAS_POR_NOME, FORMATOS_BRUTOS, transmitir_tabela_gzip
+)
+from app.jobs_exportacao import ServicoExportacao, PRONTO
+
+import tempfile
+
+import threading
+
+# Criado na primeira exportação: a automação importa `app` e não precisa do pool de threads
+_servico_exportacao = None
+_lock_servico_exportacao = threading.Lock()
+
+
+def servico_exportacao():
+    global _servico_exportacao
+    if _servico_exportacao is None:
+        with _lock_servico_exportacao:
+            if _servico_exportacao is None:
+                _servico_exportacao = ServicoExportacao(
+                    app,
+                    pasta=os.getenv("EXPORTACAO_DIR") or os.path.join(tempfile.gettempdir(), "bree_artefatos"),
+                    max_trabalhadores=int(os.getenv("EXPORTACAO_TRABALHADORES", "2")),
+                    idade_maxima=int(os.getenv("EXPORTACAO_IDADE_MAX_HORAS", "24")) * 3600,
+                    max_bytes=int(os.getenv("EXPORTACAO_MAX_MB", "1024")) * 1024 * 1024,
+                )
+    return _servico_exportacao
+
 
 
 # Rota do dashboard inicial (página principal do sistema)
@@ -673,11 +748,25 @@ def toggle_critico(contrato_id):
     flash(f"Cliente {'marcado como CRÍTICO' if contrato.cliente_critico else 'removido de críticos'}.")
     return redirect(f"/historico/{contrato_id}")
 
+@app.route("/verificar_agora/<int:contrato_id>", methods=["POST"])
+@login_required
+def verificar_agora(contrato_id):
+    """Agenda o contrato para hoje: a automação acorda na próxima leitura da agenda (scripts/agendador.py)."""
+    contrato = Contrato.query.get_or_404(contrato_id)
+    if contrato.status not in ("Em dia", "Pago", "Em atraso", "Cliente Morto"):
+        flash(f"Contratos com status '{contrato.status}' não são verificados pela automação.")
+        return redirect(f"/historico/{contrato_id}")
+    contrato.proxima_checagem = agora_brasil().date()
+    db.session.commit()
+    flash("Contrato enviado para verificação. A automação consulta o portal no próximo ciclo, em poucos minutos.")
+    return redirect(f"/historico/{contrato_id}")
+
 @app.route("/historico/<int:contrato_id>")
 def historico_cobranca(contrato_id):
     contrato = Contrato.query.get_or_404(contrato_id)
     acoes = AcaoCobranca.query.filter_by(contrato_id=contrato_id).order_by(AcaoCobranca.dia_atraso).all()
-    return render_template("historico.html", contrato=contrato, acoes=acoes)
+    snapshots = FaturaSnapshot.query.filter_by(contrato_id=contrato_id).order_by(FaturaSnapshot.id.desc()).all()
+    return render_template("historico.html", contrato=contrato, acoes=acoes, snapshots=snapshots)
 
 from flask import request, jsonify
 
@@ -785,13 +874,25 @@ def editar_contrato(contrato_id):
 @admin_required
 def relatorio_cobranca():
     from datetime import datetime
-    from sqlalchemy import extract, func, case
 
     mes = request.args.get("mes", datetime.today().month, type=int)
     ano = request.args.get("ano", datetime.today().year, type=int)
     usuario_filtro = request.args.get("usuario", "")
 
-    hoje = datetime.today()
+    # OTIMIZAÇÃO: Resultado em cache por (mês, ano, usuário, versão dos dados)
+    contexto = cache_relatorios.obter_ou_calcular(
+        "relatorio_cobranca",
+        {"mes": mes, "ano": ano, "usuario": usuario_filtro},
+        ("contratos", "acoes_cobranca", "responsaveis_cobranca"),
+        lambda: _calcular_relatorio_cobranca(mes, ano, usuario_filtro)
+    )
+    return render_template("relatorio_cobranca.html", **contexto)
+
+
+def _calcular_relatorio_cobranca(mes, ano, usuario_filtro):
+    from datetime import datetime
+    from sqlalchemy import extract, func, case
+
     primeiro_dia = datetime(ano, mes, 1)
     if mes == 12:
         proximo_mes = datetime(ano + 1, 1, 1)
@@ -918,8 +1019,7 @@ def relatorio_cobranca():
             "cancelados": cancelados_usuario
         })
 
-    return render_template(
-        "relatorio_cobranca.html",
+    return dict(
         total=total,
         pagos=pagos,
         cancelados=cancelados,
@@ -937,70 +1037,77 @@ def relatorio_cobranca():
 @app.route("/exportar_relatorio")
 def exportar_relatorio():
     from datetime import datetime
-    from sqlalchemy import extract
 
     mes = request.args.get("mes", datetime.today().month, type=int)
     ano = request.args.get("ano", datetime.today().year, type=int)
     usuario = request.args.get("usuario", "")
+    hoje = datetime.today().date()
 
-    subquery = db.session.query(
-        AcaoCobranca.contrato_id,
-        db.func.max(AcaoCobranca.enviada_em).label("ultima_data")
-    ).group_by(AcaoCobranca.contrato_id).subquery()
-
-    acoes = db.session.query(AcaoCobranca).join(
-        subquery,
-        (AcaoCobranca.contrato_id == subquery.c.contrato_id) &
-        (AcaoCobranca.enviada_em == subquery.c.ultima_data)
-    ).filter(
-        extract("month", AcaoCobranca.enviada_em) == mes,
-        extract("year", AcaoCobranca.enviada_em) == ano
+    job = servico_exportacao().enfileirar(
+        "exportar_relatorio",
+        {"mes": mes, "ano": ano, "usuario": usuario},
+        ("contratos", "vendedores", "acoes_cobranca"),
+        lambda caminho: _gravar_arquivo(caminho, _gerar_exportar_relatorio(mes, ano, usuario)),
+        ".xlsx",
+        f"relatorio_cobranca_{hoje.strftime('%Y_%m_%d')}.xlsx"
     )
+    return _responder_job(job)
 
-    if usuario:
-        acoes = acoes.filter(AcaoCobranca.usuario == usuario)
 
-    acoes = acoes.all()
-    hoje = datetime.today().date()
+def _gravar_arquivo(caminho, conteudo):
+    with open(caminho, "wb") as f:
+        f.write(conteudo)
 
-    # OTIMIZAÇÃO: Carregar todos os contratos de uma vez com eager loading
-    if acoes:
-        contratos_ids = [acao.contrato_id for acao in acoes]
-        contratos_dict = {
-            c.id: c for c in Contrato.query.options(joinedload(Contrato.vendedor)).filter(
-                Contrato.id.in_(contratos_ids)
-            ).all()
-        }
-    else:
-        contratos_dict = {}
+
+def _gerar_exportar_relatorio(mes, ano, usuario):
+    """Planilha da última ação de cobrança de cada contrato no mês (bytes .xlsx)."""
+    from datetime import datetime
+
+    # OTIMIZAÇÃO: Intervalo do mês (usa o índice de enviada_em) em vez de extract(),
+    # última ação escolhida por janela/DISTINCT ON (sem duplicar empates de horário)
+    # e contrato + vendedor na mesma consulta
+    inicio = datetime(ano, mes, 1)
+    fim = datetime(ano + 1, 1, 1) if mes == 12 else datetime(ano, mes + 1, 1)
+    ultimas = _ultimas_acoes_no_periodo(inicio, fim)
+
+    consulta = db.session.query(
+        AcaoCobranca.tipo, AcaoCobranca.usuario, AcaoCobranca.enviada_em, AcaoCobranca.mensagem,
+        Contrato.contrato, Contrato.proposta, Contrato.razao_social, Contrato.cnpj_cpf,
+        Contrato.cliente_critico, Contrato.atividade_economica, Contrato.celular, Contrato.email,
+        Contrato.cidade, Contrato.data_vigencia, Contrato.vidas, Contrato.valor_parcela,
+        Contrato.parcela_atual, Contrato.dias_atraso, Contrato.status, Contrato.mes_cancelamento,
+        Vendedor.nome.label("vendedor")
+    ).join(ultimas, AcaoCobranca.id == ultimas.c.id) \
+     .join(Contrato, AcaoCobranca.contrato_id == Contrato.id) \
+     .outerjoin(Vendedor, Contrato.vendedor_id == Vendedor.id)
+
+    if usuario:
+        consulta = consulta.filter(AcaoCobranca.usuario == usuario)
 
     dados = []
-    for acao in acoes:
-        contrato = contratos_dict.get(acao.contrato_id)
-        if not contrato:
-            continue
+    for linha in consulta.order_by(AcaoCobranca.enviada_em.desc(), AcaoCobranca.id.desc()):
         dados.append({
-            "Contrato": contrato.contrato,
-            "Proposta": contrato.proposta,
-            "Razão Social": contrato.razao_social,
-            "CNPJ/CPF": contrato.cnpj_cpf,
-            "Cliente Crítico": "Sim" if contrato.cliente_critico else "Não",
-            "Atividade Econômica": contrato.atividade_economica or "",
-            "Celular": contrato.celular,
-            "E-mail": contrato.email,
-            "Cidade": contrato.cidade,
-            "Data de Vigência": contrato.data_vigencia.strftime("%d/%m/%Y") if contrato.data_vigencia else "",
-            "Vidas": contrato.vidas,
-            "Valor da Parcela": contrato.valor_parcela,
-            "Parcela Atual": contrato.parcela_atual,
-            "Dias de Atraso": contrato.dias_atraso,
-            "Status Atual": contrato.status,
-            "Mês de Cancelamento": contrato.mes_cancelamento.strftime("%m/%Y") if contrato.mes_cancelamento else "",
-            "Vendedor": contrato.vendedor.nome if contrato.vendedor else "",
-            "Última Ação": acao.tipo,
-            "Responsável": acao.usuario or "-",
-            "Data da Ação": acao.enviada_em.strftime("%d/%m/%Y %H:%M"),
-            "Mensagem Enviada": acao.mensagem
+            "Contrato": linha.contrato,
+            "Proposta": linha.proposta,
+            "Razão Social": linha.razao_social,
+            "CNPJ/CPF": linha.cnpj_cpf,
+            "Cliente Crítico": "Sim" if linha.cliente_critico else "Não",
+            "Atividade Econômica": linha.atividade_economica or "",
+            "Celular": linha.celular,
+            "E-mail": linha.email,
+            "Cidade": linha.cidade,
+            "Data de Vigência": linha.data_vigencia.strftime("%d/%m/%Y") if linha.data_vigencia else "",
+            "Vidas": linha.vidas,
+            "Valor da Parcela": linha.valor_parcela,
+            "Parcela Atual": linha.parcela_atual,
+            "Dias de Atraso": linha.dias_atraso,
+            "Status Atual": linha.status,
+            "Mês de Cancelamento": linha.mes_cancelamento.strftime("%m/%Y") if linha.mes_cancelamento else "",
+            "Vendedor": linha.vendedor or "",
+            "Última Ação": linha.tipo,
+            "Responsável": linha.usuario or "-",
+            "Data da Ação": linha.enviada_em.strftime("%d/%m/%Y %H:%M"),
+            "Mensagem Enviada": linha.mensagem
         })
 
     df = pd.DataFrame(dados)
@@ -1009,24 +1116,55 @@ def exportar_relatorio():
     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
         df.to_excel(writer, index=False, sheet_name="Relatório")
 
-    output.seek(0)
-    return send_file(
-        output,
-        download_name=f"relatorio_cobranca_{hoje.strftime('%Y_%m_%d')}.xlsx",
-        as_attachment=True
-    )
+    return output.getvalue()
+
+
+def _ultimas_acoes_no_periodo(inicio, fim):
+    """
+    Subconsulta com o id da última ação de cada contrato em [inicio, fim).
+    Empates de horário são desempatados pelo maior id (uma linha por contrato).
+    """
+    no_periodo = (AcaoCobranca.enviada_em >= inicio, AcaoCobranca.enviada_em < fim)
+
+    if db.engine.dialect.name == "postgresql":
+        return db.session.query(AcaoCobranca.id) \
+            .filter(*no_periodo) \
+            .distinct(AcaoCobranca.contrato_id) \
+            .order_by(AcaoCobranca.contrato_id, AcaoCobranca.enviada_em.desc(), AcaoCobranca.id.desc()) \
+            .subquery()
+
+    ordem = db.func.row_number().over(
+        partition_by=AcaoCobranca.contrato_id,
+        order_by=(AcaoCobranca.enviada_em.desc(), AcaoCobranca.id.desc())
+    ).label("ordem")
+    ranking = db.session.query(AcaoCobranca.id, ordem).filter(*no_periodo).subquery()
+    return db.session.query(ranking.c.id).filter(ranking.c.ordem == 1).subquery()
 
 
 @app.route("/exportar_relatorio_atendentes")
 def exportar_relatorio_atendentes():
     from datetime import datetime
-    from sqlalchemy import extract, func, case
 
     hoje = datetime.today().date()
     mes = request.args.get("mes", hoje.month, type=int)
     ano = request.args.get("ano", hoje.year, type=int)
     usuario_filtro = request.args.get("usuario", "")
 
+    job = servico_exportacao().enfileirar(
+        "exportar_relatorio_atendentes",
+        {"mes": mes, "ano": ano, "usuario": usuario_filtro},
+        ("contratos", "acoes_cobranca", "responsaveis_cobranca"),
+        lambda caminho: _gravar_arquivo(caminho, _gerar_exportar_relatorio_atendentes(mes, ano, usuario_filtro)),
+        ".xlsx",
+        f"relatorio_atendentes_{hoje.strftime('%Y_%m_%d')}.xlsx"
+    )
+    return _responder_job(job)
+
+
+def _gerar_exportar_relatorio_atendentes(mes, ano, usuario_filtro):
+    """Planilha de produtividade por atendente no mês (bytes .xlsx)."""
+    from sqlalchemy import extract, func
+
     usuarios = db.session.query(ResponsavelCobranca.usuario).distinct().all()
     if usuario_filtro:
         usuarios = [(usuario_filtro,)]
@@ -1089,12 +1227,7 @@ def exportar_relatorio_atendentes():
     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
         df.to_excel(writer, index=False, sheet_name="Atendentes")
 
-    output.seek(0)
-    return send_file(
-        output,
-        download_name=f"relatorio_atendentes_{hoje.strftime('%Y_%m_%d')}.xlsx",
-        as_attachment=True
-    )
+    return output.getvalue()
 
 @app.route("/editar_contrato", methods=["GET", "POST"])
 def editar_contrato_busca():
@@ -1192,115 +1325,13 @@ def relatorio_vivos():
     if session.get("usuario_tipo") != "admin":
         flash("Acesso restrito ao administrador.")
         return redirect("/")
-    # OTIMIZAÇÃO: Carregar vendedores junto com contratos (eager loading)
-    contratos_vivos = Contrato.query.options(joinedload(Contrato.vendedor)).filter(
-        Contrato.status.in_(["Em dia", "Pago", "Em atraso"])
-    ).all()
-    
-    total_contratos = len(contratos_vivos)
-    total_vidas = sum(c.vidas or 0 for c in contratos_vivos)
-    total_faturamento = sum(c.valor_parcela or Decimal(0) for c in contratos_vivos)
-    
-    def calcular_comissao(contrato):
-        if contrato.parcela_atual in [1, 2, 3]:
-            return contrato.valor_parcela or Decimal(0)  # agenciamento = 100%
-        elif contrato.parcela_atual and contrato.parcela_atual >= 4:
-            return (contrato.valor_parcela or Decimal(0)) * Decimal("0.04")  # vitalício = 4%
-        return 0
-
-    total_agenciamento = sum(c.valor_parcela or Decimal(0) for c in contratos_vivos if c.parcela_atual in [1, 2, 3])
-    total_vitalicio = sum((c.valor_parcela or Decimal(0)) * Decimal("0.04") for c in contratos_vivos if c.parcela_atual and c.parcela_atual >= 4)
-
-    # agrupamentos
-    from collections import defaultdict, Counter
-
-    vidas_por_produto = defaultdict(int)
-    agenciamento_por_produto = defaultdict(lambda: Decimal(0))
-    vitalicio_por_produto = defaultdict(lambda: Decimal(0))
-    vidas_por_vendedora = defaultdict(int)
-    contratos_por_vendedora = defaultdict(int)
-    atividades = Counter()
-    cidades = Counter()
-    vidas_por_contrato_total = []
-    ticket_por_contrato = []
-    ticket_por_vida = []
-    comissao_total = []
-
-    for c in contratos_vivos:
-        nome_plano = c.nome_plano.strip() if c.nome_plano and c.nome_plano.strip().lower() != "nan" else "Não informado"
-        vidas_por_produto[nome_plano] += c.vidas or 0
-        if c.parcela_atual in [1, 2, 3]:
-            agenciamento_por_produto[nome_plano] += c.valor_parcela or Decimal(0)
-        elif c.parcela_atual and c.parcela_atual >= 4:
-            vitalicio_por_produto[nome_plano] += (c.valor_parcela or Decimal(0)) * Decimal("0.04")
-        
-        # Vendedor já está carregado, não precisa query adicional
-        if c.vendedor:
-            vidas_por_vendedora[c.vendedor.nome] += c.vidas or 0
-            contratos_por_vendedora[c.vendedor.nome] += 1
-
-        atividades[c.atividade_economica or "-"] += 1
-        cidades[c.cidade or "-"] += 1
-
-        vidas_por_contrato_total.append(c.vidas or 0)
-        ticket_por_contrato.append(c.valor_parcela or Decimal(0))
-        if c.vidas:
-            ticket_por_vida.append((c.valor_parcela or Decimal(0)) / c.vidas)
-            comissao_total.append(calcular_comissao(c))
-
-    from statistics import mean, mode
-
-    try:
-        moda_vidas = mode(vidas_por_contrato_total)
-    except:
-        moda_vidas = "Sem valor único"
-
-    percentual_por_produto = {}
-    for produto, vidas in vidas_por_produto.items():
-        percentual = (vidas / total_vidas * 100) if total_vidas else 0
-        percentual_por_produto[produto] = round(percentual, 1)
-
-    total_vidas_com_comissao = sum(c.vidas for c in contratos_vivos if c.vidas)
-    comissao_total_somada = sum(comissao_total)
-    comissao_media_vida = round(comissao_total_somada / total_vidas_com_comissao, 2) if total_vidas_com_comissao else 0
-
-    media_vidas_por_contrato = round(total_vidas / total_contratos, 2) if total_contratos else 0
-
-    parcela_media = round(mean([c.valor_parcela for c in contratos_vivos if c.valor_parcela]), 2) if contratos_vivos else 0
-
-    parcelas_ativas = [c.parcela_atual for c in contratos_vivos if c.parcela_atual]
-
-    parcela_mediana = round(median(parcelas_ativas), 2) if parcelas_ativas else "-"
-
-    parcela_maxima = max(parcelas_ativas) if parcelas_ativas else "-"
-
-    return render_template("relatorio_vivos.html",
-        total_contratos=total_contratos,
-        total_vidas=total_vidas,
-        media_vidas_por_contrato=media_vidas_por_contrato,
-        total_faturamento=round(total_faturamento, 2),
-        total_agenciamento=round(total_agenciamento, 2),
-        total_vitalicio=round(total_vitalicio, 2),
-        vidas_por_produto=dict(vidas_por_produto),
-        parcela_mediana=parcela_mediana,
-        parcela_maxima=parcela_maxima,
-        percentual_por_produto=percentual_por_produto,
-        agenciamento_por_produto=dict(agenciamento_por_produto),
-        vitalicio_por_produto=dict(vitalicio_por_produto),
-        vidas_por_vendedora=dict(vidas_por_vendedora),
-        contratos_por_vendedora=dict(contratos_por_vendedora),
-        vidas_por_contrato_total=vidas_por_contrato_total,
-        parcela_media=parcela_media,
-        parcela_moda=moda_vidas,
-        ticket_medio_contrato=round(mean(ticket_por_contrato), 2) if ticket_por_contrato else 0,
-        ticket_medio_vida=round(mean(ticket_por_vida), 2) if ticket_por_vida else 0,
-        comissao_media_contrato=round(mean(comissao_total), 2) if comissao_total else 0,
-        comissao_media_vida=comissao_media_vida,
-        comissao_agenciamento=round(total_agenciamento, 2),
-        comissao_vitalicio=round(total_vitalicio, 2),
-        top_atividades=atividades.most_common(10),
-        top_cidades=cidades.most_common(10)
+    # OTIMIZAÇÃO: Métricas calculadas pelo motor colunar (NumPy) com cache por versão dos dados.
+    # RELATORIO_VIVOS_MOTOR=sql calcula tudo por agregação no banco.
+    calcular = metricas_vivos_sql if os.getenv("RELATORIO_VIVOS_MOTOR", "numpy") == "sql" else metricas_vivos
+    metricas = cache_relatorios.obter_ou_calcular(
+        "relatorio_vivos", {}, ("contratos", "vendedores"), calcular
     )
+    return render_template("relatorio_vivos.html", **metricas)
 
 @app.route("/logout")
 def logout():
@@ -1319,137 +1350,88 @@ def limpar_filtros_cobranca():
 def exportar_base_completa():
     """Exporta toda a base de dados em um arquivo Excel com múltiplas abas"""
     from datetime import datetime
-    
-    try:
-        hoje = datetime.today().date()
-        
-        # Criar um buffer em memória para o Excel
-        output = io.BytesIO()
-        
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            # Aba 1: Contratos (com eager loading do vendedor)
-            contratos = Contrato.query.options(joinedload(Contrato.vendedor)).all()
-            dados_contratos = []
-            for c in contratos:
-                try:
-                    dados_contratos.append({
-                        "ID": c.id,
-                        "Proposta": c.proposta or "",
-                        "Contrato": c.contrato or "",
-                        "Data Checagem": c.data_checagem.strftime("%d/%m/%Y") if c.data_checagem else "",
-                        "Razão Social": c.razao_social or "",
-                        "CNPJ/CPF": c.cnpj_cpf or "",
-                        "Celular": c.celular or "",
-                        "E-mail": c.email or "",
-                        "Atividade Econômica": c.atividade_economica or "",
-                        "Cidade": c.cidade or "",
-                        "Nome do Plano": c.nome_plano or "",
-                        "Data de Vigência": c.data_vigencia.strftime("%d/%m/%Y") if c.data_vigencia else "",
-                        "Vidas": c.vidas if c.vidas is not None else "",
-                        "Valor da Parcela": float(c.valor_parcela) if c.valor_parcela is not None else "",
-                        "Parcela Atual": c.parcela_atual if c.parcela_atual is not None else "",
-                        "Status": c.status or "",
-                        "Mês de Cancelamento": c.mes_cancelamento.strftime("%m/%Y") if c.mes_cancelamento else "",
-                        "Verificado": "Sim" if c.verificado else "Não",
-                        "Dias de Atraso": c.dias_atraso if c.dias_atraso is not None else "",
-                        "Vendedor": c.vendedor.nome if c.vendedor else "",
-                        "Envio SMS": "Sim" if c.envio_sms else "Não",
-                        "Cliente Crítico": "Sim" if c.cliente_critico else "Não"
-                    })
-                except Exception as e:
-                    logging.error(f"Erro ao processar contrato ID {c.id}: {e}")
-                    continue
-            
-            if dados_contratos:
-                df_contratos = pd.DataFrame(dados_contratos)
-                df_contratos.to_excel(writer, index=False, sheet_name="Contratos")
-            
-            # Aba 2: Vendedores
-            vendedores = Vendedor.query.all()
-            dados_vendedores = []
-            for v in vendedores:
-                dados_vendedores.append({
-                    "ID": v.id,
-                    "Nome": v.nome or "",
-                    "CPF/CNPJ": v.cpf_cnpj or "",
-                    "Celular": v.celular or "",
-                    "E-mail": v.email or ""
-                })
-            if dados_vendedores:
-                df_vendedores = pd.DataFrame(dados_vendedores)
-                df_vendedores.to_excel(writer, index=False, sheet_name="Vendedores")
-            
-            # Aba 3: Ações de Cobrança (com eager loading do contrato)
-            acoes = AcaoCobranca.query.options(joinedload(AcaoCobranca.contrato)).all()
-            dados_acoes = []
-            for a in acoes:
-                try:
-                    contrato_num = ""
-                    if a.contrato:
-                        contrato_num = a.contrato.contrato or ""
-                    dados_acoes.append({
-                        "ID": a.id,
-                        "Contrato ID": a.contrato_id,
-                        "Contrato": contrato_num,
-                        "Tipo": a.tipo or "",
-                        "Mensagem": a.mensagem or "",
-                        "Dia de Atraso": a.dia_atraso if a.dia_atraso is not None else "",
-                        "Parcela": a.parcela if a.parcela is not None else "",
-                        "Enviada em": a.enviada_em.strftime("%d/%m/%Y %H:%M") if a.enviada_em else "",
-                        "Status Envio": a.status_envio or "",
-                        "Usuário": a.usuario or ""
-                    })
-                except Exception as e:
-                    logging.error(f"Erro ao processar ação ID {a.id}: {e}")
-                    continue
-            
-            if dados_acoes:
-                df_acoes = pd.DataFrame(dados_acoes)
-                df_acoes.to_excel(writer, index=False, sheet_name="Ações de Cobrança")
-            
-            # Aba 4: Responsáveis de Cobrança
-            responsaveis = ResponsavelCobranca.query.all()
-            # OTIMIZAÇÃO: Usar contratos já carregados em vez de nova query
-            contratos_dict = {c.id: c.contrato for c in contratos}
-            
-            dados_responsaveis = []
-            for r in responsaveis:
-                contrato_num = contratos_dict.get(r.contrato_id, "")
-                dados_responsaveis.append({
-                    "ID": r.id,
-                    "Contrato ID": r.contrato_id,
-                    "Contrato": contrato_num,
-                    "Usuário": r.usuario or ""
-                })
-            if dados_responsaveis:
-                df_responsaveis = pd.DataFrame(dados_responsaveis)
-                df_responsaveis.to_excel(writer, index=False, sheet_name="Responsáveis")
-            
-            # Aba 5: Usuários (sem senhas)
-            usuarios = Usuario.query.all()
-            dados_usuarios = []
-            for u in usuarios:
-                dados_usuarios.append({
-                    "ID": u.id,
-                    "Nome": u.nome or "",
-                    "E-mail": u.email or "",
-                    "Tipo": u.tipo or ""
-                })
-            if dados_usuarios:
-                df_usuarios = pd.DataFrame(dados_usuarios)
-                df_usuarios.to_excel(writer, index=False, sheet_name="Usuários")
-        
-        output.seek(0)
-        return send_file(
-            output,
-            download_name=f"base_completa_{hoje.strftime('%Y_%m_%d')}.xlsx",
-            as_attachment=True,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-    except Exception as e:
-        logging.error(f"Erro ao exportar base completa: {e}", exc_info=True)
-        flash(f"Erro ao exportar base: {str(e)}")
-        return redirect(url_for("dashboard"))
+
+    hoje = datetime.today().date()
+
+    # OTIMIZAÇÃO: Gerada em segundo plano (cursor no servidor + xlsxwriter constant_memory)
+    # e reaproveitada enquanto nenhuma tabela mudar
+    job = servico_exportacao().enfileirar(
+        "exportar_base_completa",
+        {},
+        ("contratos", "vendedores", "acoes_cobranca", "responsaveis_cobranca", "usuarios"),
+        escrever_base_completa,
+        ".xlsx",
+        f"base_completa_{hoje.strftime('%Y_%m_%d')}.xlsx",
+        requer_admin=True
+    )
+    return _responder_job(job)
+
+
+def _responder_job(job):
+    """Envia o artefato se já estiver pronto; senão, vai para a página de espera."""
+    if job.estado == PRONTO:
+        return redirect(url_for("baixar_exportacao", job_id=job.id))
+    return redirect(url_for("acompanhar_exportacao", job_id=job.id))
+
+
+def _obter_job_autorizado(job_id):
+    job = servico_exportacao().obter(job_id)
+    if job is None:
+        abort(404)
+    if job.requer_admin and session.get("usuario_tipo") != "admin":
+        abort(403)
+    return job
+
+
+@app.route("/exportacoes/<job_id>")
+@login_required
+def acompanhar_exportacao(job_id):
+    job = _obter_job_autorizado(job_id)
+    return render_template("exportacao.html", job=job)
+
+
+@app.route("/exportacoes/<job_id>/estado")
+@login_required
+def estado_exportacao(job_id):
+    job = _obter_job_autorizado(job_id)
+    return jsonify(job.como_dict())
+
+
+@app.route("/exportacoes/<job_id>/baixar")
+@login_required
+def baixar_exportacao(job_id):
+    job = _obter_job_autorizado(job_id)
+    if job.estado != PRONTO:
+        return redirect(url_for("acompanhar_exportacao", job_id=job.id))
+    return send_file(
+        servico_exportacao().caminho(job),
+        download_name=job.nome_download,
+        as_attachment=True
+    )
+
+@app.route("/exportar_tabela/<tabela>.<formato>.gz")
+@login_required
+@admin_required
+def exportar_tabela(tabela, formato):
+    """
+    Exportação bruta de uma tabela para BI (CSV ou NDJSON), comprimida em gzip
+    durante o envio. Ex.: /exportar_tabela/contratos.csv.gz
+    """
+    from datetime import datetime
+
+    definicao = TABELAS_POR_NOME.get(tabela)
+    if definicao is None or formato not in FORMATOS_BRUTOS:
+        abort(404)
+
+    hoje = datetime.today().date()
+    return Response(
+        stream_with_context(transmitir_tabela_gzip(definicao, formato)),
+        mimetype="application/gzip",
+        headers={
+            "Content-Disposition": f"attachment; filename={tabela}_{hoje.strftime('%Y_%m_%d')}.{formato}.gz",
+            "X-Accel-Buffering": "no",
+        }
+    )
 
 @app.route("/importar_contratos", methods=["GET", "POST"])
 @login_required
@@ -1515,6 +1497,23 @@ def sobrepor_status_view():
     return render_template("sobrepor_status.html")
 
 
+@app.route("/cache_relatorios")
+@login_required
+@admin_required
+def cache_relatorios_view():
+    """Taxa de acerto e ocupação do cache de relatórios/exportações."""
+    return render_template("cache_relatorios.html", resumo=cache_relatorios.resumo())
+
+
+@app.route("/cache_relatorios/limpar", methods=["POST"])
+@login_required
+@admin_required
+def limpar_cache_relatorios():
+    cache_relatorios.limpar()
+    flash("Cache de relatórios limpo.", "success")
+    return redirect(url_for("cache_relatorios_view"))
+
+
 if __name__ == '__main__':
     import sys
     # Detecta se está rodando como executável (PyInstaller)
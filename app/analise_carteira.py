@@ -0,0 +1,337 @@
+"""
+Motor colunar (NumPy) para análises da carteira de contratos.
+
+As colunas necessárias de `Contrato` são lidas como tuplas tipadas (sem montar
+objetos do ORM), transpostas para arrays NumPy e guardadas em cache enquanto a
+versão dos dados (`versao_dados`) não mudar. Somas, médias, medianas e modas
+agrupadas são calculadas de forma vetorizada com `bincount`/`unique`.
+
+Os valores monetários são somados em float64 e convertidos para Decimal com
+2 casas apenas no final (a precisão do float64 cobre com folga a carteira).
+"""
+
+import threading
+from decimal import Decimal
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db, Contrato, Vendedor
+from app.relatorios import (
+    STATUS_VIVOS, PARCELAS_AGENCIAMENTO, PARCELA_INICIO_VITALICIO,
+    plano_normalizado, texto_ou_traco
+)
+from app.versao_dados import versao_atual
+
+TAXA_VITALICIO = 0.04
+
+
+def _moeda(valor):
+    """float -> Decimal com 2 casas (formato exibido nos templates)."""
+    return Decimal(f"{float(valor):.2f}")
+
+
+class Categoria:
+    """Coluna categórica: códigos inteiros (-1 = sem valor) e rótulos ordenados."""
+
+    def __init__(self, codigos, rotulos):
+        self.codigos = codigos
+        self.rotulos = rotulos
+
+    @classmethod
+    def de_valores(cls, valores):
+        # Codificação por dicionário (hash) é bem mais rápida que np.unique sobre
+        # objetos; depois os rótulos são ordenados e os códigos remapeados.
+        mapa = {None: -1}
+        codigos = np.fromiter(
+            (mapa.setdefault(v, len(mapa) - 1) for v in valores),
+            dtype=np.int64, count=len(valores)
+        )
+        del mapa[None]
+        rotulos = np.array(list(mapa), dtype=object)
+        ordem = np.argsort(rotulos, kind="stable") if len(rotulos) else np.array([], dtype=np.int64)
+        remapear = np.empty(len(rotulos) + 1, dtype=np.int64)
+        remapear[ordem] = np.arange(len(rotulos))
+        remapear[-1] = -1  # código -1 continua -1
+        return cls(remapear[codigos], rotulos[ordem])
+
+    def filtrar(self, mascara):
+        return Categoria(self.codigos[mascara], self.rotulos)
+
+    def codigos_de(self, rotulos):
+        return [i for i, r in enumerate(self.rotulos) if r in rotulos]
+
+
+def _inteiros(valores):
+    """Coluna inteira anulável -> (array int64 com nulos = 0, máscara de nulos)."""
+    nulos = np.fromiter((v is None for v in valores), dtype=bool, count=len(valores))
+    dados = np.fromiter((v or 0 for v in valores), dtype=np.int64, count=len(valores))
+    return dados, nulos
+
+
+def _reais(valores):
+    """Coluna numérica anulável -> (array float64 com nulos = 0, máscara de nulos)."""
+    nulos = np.fromiter((v is None for v in valores), dtype=bool, count=len(valores))
+    dados = np.fromiter((float(v or 0) for v in valores), dtype=np.float64, count=len(valores))
+    return dados, nulos
+
+
+class CarteiraColunar:
+    """Colunas da carteira de contratos em arrays NumPy alinhados por posição."""
+
+    # (nome do atributo, expressão SQL, conversor)
+    COLUNAS = (
+        ("id", Contrato.id, "inteiro"),
+        ("status", Contrato.status, "categoria"),
+        ("plano", plano_normalizado, "categoria"),
+        ("cidade", texto_ou_traco(Contrato.cidade), "categoria"),
+        ("atividade", texto_ou_traco(Contrato.atividade_economica), "categoria"),
+        ("vendedor", Vendedor.nome, "categoria"),
+        ("vidas", Contrato.vidas, "inteiro"),
+        ("parcela", Contrato.parcela_atual, "inteiro"),
+        ("valor", Contrato.valor_parcela, "real"),
+    )
+
+    def __init__(self, colunas, nulos, versao=None):
+        self.colunas = colunas
+        self.nulos = nulos
+        self.versao = versao
+        self.tamanho = len(colunas["id"])
+
+    def __len__(self):
+        return self.tamanho
+
+    def __getattr__(self, nome):
+        try:
+            return self.__dict__["colunas"][nome]
+        except KeyError:
+            raise AttributeError(nome)
+
+    @classmethod
+    def do_banco(cls, versao=None, filtro=None):
+        """Lê as colunas de todos os contratos (uma única consulta, sem ORM)."""
+        consulta = select(*(expr for _, expr, _ in cls.COLUNAS)) \
+            .select_from(Contrato) \
+            .outerjoin(Vendedor, Contrato.vendedor_id == Vendedor.id)
+        if filtro is not None:
+            consulta = consulta.where(filtro)
+        # Core direto na conexão: sem a camada de resultados do ORM
+        linhas = db.session.connection().execute(consulta).all()
+        return cls.de_linhas(linhas, versao)
+
+    @classmethod
+    def de_linhas(cls, linhas, versao=None):
+        """Monta a carteira a partir de tuplas na ordem de `COLUNAS`."""
+        transpostas = list(zip(*linhas)) if linhas else [() for _ in cls.COLUNAS]
+        colunas, nulos = {}, {}
+        for (nome, _, tipo), valores in zip(cls.COLUNAS, transpostas):
+            if tipo == "categoria":
+                colunas[nome] = Categoria.de_valores(valores)
+            elif tipo == "inteiro":
+                colunas[nome], nulos[nome] = _inteiros(valores)
+            else:
+                colunas[nome], nulos[nome] = _reais(valores)
+        return cls(colunas, nulos, versao)
+
+    def filtrar(self, mascara):
+        """Nova carteira apenas com as posições selecionadas pela máscara booleana."""
+        colunas = {
+            nome: col.filtrar(mascara) if isinstance(col, Categoria) else col[mascara]
+            for nome, col in self.colunas.items()
+        }
+        nulos = {nome: col[mascara] for nome, col in self.nulos.items()}
+        return CarteiraColunar(colunas, nulos, self.versao)
+
+    def com_status(self, status):
+        return np.isin(self.status.codigos, self.status.codigos_de(status))
+
+    # ------------------------------------------------------------------
+    # Colunas derivadas
+    # ------------------------------------------------------------------
+
+    def presente(self, nome):
+        """Máscara de valores não nulos e diferentes de zero (truthy)."""
+        return ~self.nulos[nome] & (self.colunas[nome] != 0)
+
+    @property
+    def eh_agenciamento(self):
+        return ~self.nulos["parcela"] & np.isin(self.parcela, PARCELAS_AGENCIAMENTO)
+
+    @property
+    def eh_vitalicio(self):
+        return ~self.nulos["parcela"] & (self.parcela >= PARCELA_INICIO_VITALICIO)
+
+    @property
+    def agenciamento(self):
+        return np.where(self.eh_agenciamento, self.valor, 0.0)
+
+    @property
+    def vitalicio(self):
+        return np.where(self.eh_vitalicio, self.valor * TAXA_VITALICIO, 0.0)
+
+    @property
+    def comissao(self):
+        return self.agenciamento + self.vitalicio
+
+    # ------------------------------------------------------------------
+    # Agregações
+    # ------------------------------------------------------------------
+
+    def agrupar(self, categoria, pesos=None, mascara=None):
+        """
+        Soma e contagem por grupo. Retorna (rótulos, somas, contagens) apenas
+        dos grupos com pelo menos uma linha.
+        """
+        codigos = categoria.codigos
+        validos = codigos >= 0
+        if mascara is not None:
+            validos &= mascara
+        n = len(categoria.rotulos)
+        contagens = np.bincount(codigos[validos], minlength=n)
+        if pesos is None:
+            somas = contagens.astype(np.float64)
+        else:
+            somas = np.bincount(codigos[validos], weights=pesos[validos], minlength=n)
+        usados = contagens > 0
+        return categoria.rotulos[usados], somas[usados], contagens[usados]
+
+    def soma_por(self, categoria, pesos, mascara=None):
+        rotulos, somas, _ = self.agrupar(categoria, pesos, mascara)
+        return dict(zip(rotulos.tolist(), somas.tolist()))
+
+    def contagem_por(self, categoria, mascara=None):
+        rotulos, _, contagens = self.agrupar(categoria, None, mascara)
+        return dict(zip(rotulos.tolist(), contagens.tolist()))
+
+    def media_por(self, categoria, valores, mascara=None):
+        rotulos, somas, contagens = self.agrupar(categoria, valores, mascara)
+        return dict(zip(rotulos.tolist(), (somas / contagens).tolist()))
+
+    def top(self, categoria, limite=10):
+        """Rótulos mais frequentes (empates em ordem alfabética)."""
+        rotulos, _, contagens = self.agrupar(categoria)
+        ordem = np.argsort(-contagens, kind="stable")[:limite]
+        return [(rotulos[i], int(contagens[i])) for i in ordem]
+
+    @staticmethod
+    def mediana(valores):
+        return float(np.median(valores)) if len(valores) else None
+
+    @staticmethod
+    def moda(valores):
+        """Valor mais frequente (empates: o menor)."""
+        if not len(valores):
+            return None
+        unicos, contagens = np.unique(valores, return_counts=True)
+        return unicos[np.argmax(contagens)].item()
+
+
+# ----------------------------------------------------------------------
+# Cache por versão dos dados
+# ----------------------------------------------------------------------
+
+_cache = {"versao": None, "carteira": None}
+_lock_cache = threading.Lock()
+
+
+def carregar_carteira():
+    """Carteira completa em colunas, recarregada só quando os dados mudam."""
+    # A versão é lida antes dos dados: no pior caso o cache fica marcado com uma
+    # versão mais antiga que o conteúdo e é recarregado uma vez a mais.
+    versao = versao_atual("contratos", "vendedores")
+    with _lock_cache:
+        if _cache["versao"] == versao and _cache["carteira"] is not None:
+            return _cache["carteira"]
+    carteira = CarteiraColunar.do_banco(versao)
+    with _lock_cache:
+        _cache["versao"] = versao
+        _cache["carteira"] = carteira
+    return carteira
+
+
+def carteira_viva(carteira=None):
+    carteira = carteira if carteira is not None else carregar_carteira()
+    return carteira.filtrar(carteira.com_status(STATUS_VIVOS))
+
+
+# ----------------------------------------------------------------------
+# Cortes da carteira
+# ----------------------------------------------------------------------
+
+def comissao_por_plano(carteira=None):
+    vivos = carteira_viva(carteira)
+    return {p: _moeda(v) for p, v in vivos.soma_por(vivos.plano, vivos.comissao).items()}
+
+
+def ticket_medio_vida_por_plano(carteira=None):
+    vivos = carteira_viva(carteira)
+    com_vidas = vivos.presente("vidas")
+    ticket = np.divide(vivos.valor, vivos.vidas, out=np.zeros(len(vivos)), where=com_vidas)
+    return {p: _moeda(v) for p, v in vivos.media_por(vivos.plano, ticket, com_vidas).items()}
+
+
+def vidas_por_vendedor(carteira=None):
+    vivos = carteira_viva(carteira)
+    return {v: int(s) for v, s in vivos.soma_por(vivos.vendedor, vivos.vidas).items()}
+
+
+def metricas_vivos(carteira=None):
+    """
+    Métricas do relatório de contratos vivos sobre a carteira colunar.
+
+    Retorna as mesmas chaves de `app.relatorios.metricas_vivos_sql`.
+    """
+    vivos = carteira_viva(carteira)
+    total_contratos = len(vivos)
+    total_vidas = int(vivos.vidas.sum())
+    total_faturamento = float(vivos.valor.sum())
+    total_agenciamento = float(vivos.agenciamento.sum())
+    total_vitalicio = float(vivos.vitalicio.sum())
+
+    com_vidas = vivos.presente("vidas")
+    comissao_com_vidas = float(vivos.comissao[com_vidas].sum())
+    ticket_vida = vivos.valor[com_vidas] / vivos.vidas[com_vidas]
+    valores_presentes = vivos.valor[vivos.presente("valor")]
+    parcelas_ativas = vivos.parcela[vivos.presente("parcela")]
+
+    vidas_por_produto = {p: int(v) for p, v in vivos.soma_por(vivos.plano, vivos.vidas).items()}
+    agenciamento_por_produto = {
+        p: _moeda(v) for p, v in vivos.soma_por(vivos.plano, vivos.agenciamento, vivos.eh_agenciamento).items()
+    }
+    vitalicio_por_produto = {
+        p: _moeda(v) for p, v in vivos.soma_por(vivos.plano, vivos.vitalicio, vivos.eh_vitalicio).items()
+    }
+    percentual_por_produto = {
+        produto: round((vidas / total_vidas * 100) if total_vidas else 0, 1)
+        for produto, vidas in vidas_por_produto.items()
+    }
+
+    mediana = vivos.mediana(parcelas_ativas)
+    moda = vivos.moda(vivos.vidas)
+
+    return {
+        "total_contratos": total_contratos,
+        "total_vidas": total_vidas,
+        "media_vidas_por_contrato": round(total_vidas / total_contratos, 2) if total_contratos else 0,
+        "total_faturamento": _moeda(total_faturamento),
+        "total_agenciamento": _moeda(total_agenciamento),
+        "total_vitalicio": _moeda(total_vitalicio),
+        "vidas_por_produto": vidas_por_produto,
+        "parcela_mediana": round(mediana, 2) if mediana is not None else "-",
+        "parcela_maxima": int(parcelas_ativas.max()) if len(parcelas_ativas) else "-",
+        "percentual_por_produto": percentual_por_produto,
+        "agenciamento_por_produto": agenciamento_por_produto,
+        "vitalicio_por_produto": vitalicio_por_produto,
+        "vidas_por_vendedora": {v: int(s) for v, s in vivos.soma_por(vivos.vendedor, vivos.vidas).items()},
+        "contratos_por_vendedora": vivos.contagem_por(vivos.vendedor),
+        "parcela_media": _moeda(valores_presentes.mean()) if len(valores_presentes) else _moeda(0),
+        "parcela_moda": moda if moda is not None else "Sem valor único",
+        "ticket_medio_contrato": _moeda(total_faturamento / total_contratos) if total_contratos else 0,
+        "ticket_medio_vida": _moeda(ticket_vida.mean()) if len(ticket_vida) else 0,
+        "comissao_media_contrato": _moeda(comissao_com_vidas / com_vidas.sum()) if com_vidas.any() else 0,
+        "comissao_media_vida": _moeda(comissao_com_vidas / total_vidas) if total_vidas else 0,
+        "comissao_agenciamento": _moeda(total_agenciamento),
+        "comissao_vitalicio": _moeda(total_vitalicio),
+        "top_atividades": vivos.top(vivos.atividade),
+        "top_cidades": vivos.top(vivos.cidade),
+    }
@@ -0,0 +1,225 @@
+"""
+Cache de resultados de relatórios.
+
+Chave = (nome do relatório, parâmetros normalizados, carimbo de versão dos
+dados). Como toda escrita avança a versão (ver `app.versao_dados`), uma entrada
+antiga nunca é reaproveitada: ela só ocupa espaço até ser despejada.
+
+- Memória: LRU limitado por número de entradas e por tamanho total (bytes).
+- Disco (opcional, RELATORIO_CACHE_DIR): cópia das entradas para sobreviver
+  à reinicialização do executável; também limitada por tamanho.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from app.versao_dados import versao_atual
+
+
+def normalizar_parametros(parametros):
+    """Parâmetros como tupla ordenada de pares texto (vazios são descartados)."""
+    return tuple(sorted(
+        (str(chave), str(valor)) for chave, valor in (parametros or {}).items()
+        if valor not in (None, "")
+    ))
+
+
+class EstatisticasRelatorio:
+    def __init__(self):
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.tempo_calculo = 0.0
+
+    @property
+    def total(self):
+        return self.hits_memoria + self.hits_disco + self.misses
+
+    @property
+    def taxa_acerto(self):
+        return round((self.hits_memoria + self.hits_disco) / self.total * 100, 1) if self.total else 0.0
+
+
+class CacheRelatorios:
+    """LRU em memória com persistência opcional em disco."""
+
+    def __init__(self, max_entradas=64, max_bytes=128 * 1024 * 1024, pasta=None, max_bytes_disco=512 * 1024 * 1024):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.pasta = pasta
+        self.max_bytes_disco = max_bytes_disco
+        self._entradas = OrderedDict()  # chave -> bytes (pickle)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.estatisticas = {}
+        if self.pasta:
+            os.makedirs(self.pasta, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Memória
+    # ------------------------------------------------------------------
+
+    def _guardar_memoria(self, chave, dados):
+        if len(dados) > self.max_bytes:
+            return
+        antigo = self._entradas.pop(chave, None)
+        if antigo is not None:
+            self._bytes -= len(antigo)
+        self._entradas[chave] = dados
+        self._bytes += len(dados)
+        while self._entradas and (len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes):
+            _, removido = self._entradas.popitem(last=False)
+            self._bytes -= len(removido)
+
+    # ------------------------------------------------------------------
+    # Disco
+    # ------------------------------------------------------------------
+
+    def _arquivo(self, chave):
+        nome = hashlib.sha256(repr(chave).encode("utf-8")).hexdigest()
+        return os.path.join(self.pasta, f"{nome}.pkl")
+
+    def _ler_disco(self, chave):
+        if not self.pasta:
+            return None
+        caminho = self._arquivo(chave)
+        try:
+            with open(caminho, "rb") as f:
+                dados = f.read()
+            os.utime(caminho)  # mantém a ordem LRU também no disco
+            return dados
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logging.warning(f"[CACHE] Falha ao ler {caminho}: {e}")
+            return None
+
+    def _gravar_disco(self, chave, dados):
+        if not self.pasta:
+            return
+        caminho = self._arquivo(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporario, "wb") as f:
+                f.write(dados)
+            os.replace(temporario, caminho)
+            self._limitar_disco()
+        except OSError as e:
+            logging.warning(f"[CACHE] Falha ao gravar {caminho}: {e}")
+
+    def _limitar_disco(self):
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if nome.endswith(".pkl"):
+                caminho = os.path.join(self.pasta, nome)
+                try:
+                    st = os.stat(caminho)
+                    arquivos.append((st.st_mtime, st.st_size, caminho))
+                except OSError:
+                    pass
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except OSError:
+                pass
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def _stats(self, nome):
+        if nome not in self.estatisticas:
+            self.estatisticas[nome] = EstatisticasRelatorio()
+        return self.estatisticas[nome]
+
+    def obter_ou_calcular(self, nome, parametros, tabelas, calcular):
+        """
+        Retorna o resultado em cache para (nome, parâmetros, versão das tabelas)
+        ou executa `calcular()` e guarda o resultado.
+        """
+        chave = (nome, normalizar_parametros(parametros), versao_atual(*tabelas))
+
+        with self._lock:
+            dados = self._entradas.get(chave)
+            if dados is not None:
+                self._entradas.move_to_end(chave)
+                self._stats(nome).hits_memoria += 1
+                return pickle.loads(dados)
+
+        dados = self._ler_disco(chave)
+        if dados is not None:
+            try:
+                valor = pickle.loads(dados)
+            except Exception as e:
+                logging.warning(f"[CACHE] Entrada corrompida em disco para {nome}: {e}")
+            else:
+                with self._lock:
+                    self._guardar_memoria(chave, dados)
+                    self._stats(nome).hits_disco += 1
+                return valor
+
+        inicio = time.perf_counter()
+        valor = calcular()
+        duracao = time.perf_counter() - inicio
+        dados = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self._lock:
+            self._guardar_memoria(chave, dados)
+            stats = self._stats(nome)
+            stats.misses += 1
+            stats.tempo_calculo += duracao
+        self._gravar_disco(chave, dados)
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+            self.estatisticas = {}
+        if self.pasta:
+            for nome in os.listdir(self.pasta):
+                if nome.endswith(".pkl"):
+                    try:
+                        os.remove(os.path.join(self.pasta, nome))
+                    except OSError:
+                        pass
+
+    def resumo(self):
+        """Dados para a página de administração do cache."""
+        with self._lock:
+            relatorios = [
+                {
+                    "nome": nome,
+                    "hits_memoria": s.hits_memoria,
+                    "hits_disco": s.hits_disco,
+                    "misses": s.misses,
+                    "taxa_acerto": s.taxa_acerto,
+                    "tempo_medio_calculo": round(s.tempo_calculo / s.misses, 3) if s.misses else 0,
+                }
+                for nome, s in sorted(self.estatisticas.items())
+            ]
+            return {
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "megabytes": round(self._bytes / 1024 / 1024, 2),
+                "max_megabytes": round(self.max_bytes / 1024 / 1024, 2),
+                "pasta": self.pasta,
+                "relatorios": relatorios,
+            }
+
+
+cache_relatorios = CacheRelatorios(
+    max_entradas=int(os.getenv("RELATORIO_CACHE_MAX_ENTRADAS", "64")),
+    max_bytes=int(os.getenv("RELATORIO_CACHE_MAX_MB", "128")) * 1024 * 1024,
+    pasta=os.getenv("RELATORIO_CACHE_DIR") or None,
+    max_bytes_disco=int(os.getenv("RELATORIO_CACHE_DISCO_MB", "512")) * 1024 * 1024,
+)
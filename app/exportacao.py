@@ -0,0 +1,367 @@
+"""
+Exportação da base completa em fluxo (memória constante).
+
+Cada aba é lida com um cursor do lado do servidor (`stream_results` +
+`yield_per`), selecionando só as colunas exportadas, e escrita linha a linha
+pelo xlsxwriter em modo `constant_memory` direto num arquivo temporário, que
+depois é transmitido ao cliente em blocos. O pico de memória não depende do
+número de linhas.
+
+As abas são consultadas e formatadas em paralelo (uma thread, sessão e conexão
+por aba), cada uma gravando uma parte intermediária em disco; a thread
+principal monta o .xlsx a partir das partes, na ordem das abas, assim que
+cada uma fica pronta.
+
+Para BI há também a exportação bruta por tabela em CSV ou NDJSON, comprimida
+em gzip durante o próprio envio (sem arquivo intermediário).
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+
+import xlsxwriter
+from flask import current_app
+from sqlalchemy import select
+
+from app import db, Contrato, Vendedor, AcaoCobranca, ResponsavelCobranca, Usuario
+
+LINHAS_POR_LOTE = 2000
+PASTA_TEMPORARIA = os.path.join(tempfile.gettempdir(), "bree_exportacoes")
+IDADE_MAXIMA_TEMPORARIOS = 24 * 3600  # segundos
+THREADS_ABAS = int(os.getenv("EXPORTACAO_THREADS_ABAS", "4"))
+
+
+# ----------------------------------------------------------------------
+# Formatadores de célula (mesmo formato da exportação anterior via pandas)
+# ----------------------------------------------------------------------
+
+def _texto(valor):
+    return valor or ""
+
+
+def _numero(valor):
+    return valor if valor is not None else ""
+
+
+def _real(valor):
+    return float(valor) if valor is not None else ""
+
+
+def _data(valor):
+    return valor.strftime("%d/%m/%Y") if valor else ""
+
+
+def _mes_ano(valor):
+    return valor.strftime("%m/%Y") if valor else ""
+
+
+def _data_hora(valor):
+    return valor.strftime("%d/%m/%Y %H:%M") if valor else ""
+
+
+def _sim_nao(valor):
+    return "Sim" if valor else "Não"
+
+
+def _bruto(valor):
+    return valor
+
+
+class TabelaExportacao:
+    """Definição de uma tabela exportada: colunas (cabeçalho, expressão, formatador) e joins."""
+
+    def __init__(self, nome, aba, origem, colunas, joins=()):
+        self.nome = nome
+        self.aba = aba
+        self.origem = origem
+        self.colunas = colunas
+        self.joins = joins
+
+    @property
+    def cabecalhos(self):
+        return [cabecalho for cabecalho, _, _ in self.colunas]
+
+    @property
+    def nomes_brutos(self):
+        """Nomes das colunas no banco; colunas de joins levam o nome da tabela (ex.: vendedores.nome)."""
+        origem = self.origem.__tablename__
+        return [
+            expr.name if expr.table.name == origem else f"{expr.table.name}.{expr.name}"
+            for _, expr, _ in self.colunas
+        ]
+
+    def consulta(self):
+        consulta = select(*(expr.label(f"c{i}") for i, (_, expr, _) in enumerate(self.colunas))) \
+            .select_from(self.origem)
+        for alvo, condicao in self.joins:
+            consulta = consulta.outerjoin(alvo, condicao)
+        return consulta.order_by(self.origem.id)
+
+    def linhas_brutas(self, tamanho_lote=LINHAS_POR_LOTE):
+        """Tuplas do banco via cursor do lado do servidor, em lotes."""
+        conexao = db.session.connection().execution_options(stream_results=True, yield_per=tamanho_lote)
+        for linha in conexao.execute(self.consulta()):
+            yield linha
+
+    def linhas(self, tamanho_lote=LINHAS_POR_LOTE):
+        """Linhas já formatadas para a planilha."""
+        formatadores = [formatador for _, _, formatador in self.colunas]
+        for linha in self.linhas_brutas(tamanho_lote):
+            try:
+                yield [f(v) for f, v in zip(formatadores, linha)]
+            except Exception as e:
+                logging.error(f"Erro ao processar {self.nome} ID {linha[0]}: {e}")
+
+
+TABELAS_BASE_COMPLETA = [
+    TabelaExportacao("contratos", "Contratos", Contrato, [
+        ("ID", Contrato.id, _bruto),
+        ("Proposta", Contrato.proposta, _texto),
+        ("Contrato", Contrato.contrato, _texto),
+        ("Data Checagem", Contrato.data_checagem, _data),
+        ("Razão Social", Contrato.razao_social, _texto),
+        ("CNPJ/CPF", Contrato.cnpj_cpf, _texto),
+        ("Celular", Contrato.celular, _texto),
+        ("E-mail", Contrato.email, _texto),
+        ("Atividade Econômica", Contrato.atividade_economica, _texto),
+        ("Cidade", Contrato.cidade, _texto),
+        ("Nome do Plano", Contrato.nome_plano, _texto),
+        ("Data de Vigência", Contrato.data_vigencia, _data),
+        ("Vidas", Contrato.vidas, _numero),
+        ("Valor da Parcela", Contrato.valor_parcela, _real),
+        ("Parcela Atual", Contrato.parcela_atual, _numero),
+        ("Status", Contrato.status, _texto),
+        ("Mês de Cancelamento", Contrato.mes_cancelamento, _mes_ano),
+        ("Verificado", Contrato.verificado, _sim_nao),
+        ("Dias de Atraso", Contrato.dias_atraso, _numero),
+        ("Vendedor", Vendedor.nome, _texto),
+        ("Envio SMS", Contrato.envio_sms, _sim_nao),
+        ("Cliente Crítico", Contrato.cliente_critico, _sim_nao),
+    ], joins=[(Vendedor, Contrato.vendedor_id == Vendedor.id)]),
+
+    TabelaExportacao("vendedores", "Vendedores", Vendedor, [
+        ("ID", Vendedor.id, _bruto),
+        ("Nome", Vendedor.nome, _texto),
+        ("CPF/CNPJ", Vendedor.cpf_cnpj, _texto),
+        ("Celular", Vendedor.celular, _texto),
+        ("E-mail", Vendedor.email, _texto),
+    ]),
+
+    TabelaExportacao("acoes_cobranca", "Ações de Cobrança", AcaoCobranca, [
+        ("ID", AcaoCobranca.id, _bruto),
+        ("Contrato ID", AcaoCobranca.contrato_id, _bruto),
+        ("Contrato", Contrato.contrato, _texto),
+        ("Tipo", AcaoCobranca.tipo, _texto),
+        ("Mensagem", AcaoCobranca.mensagem, _texto),
+        ("Dia de Atraso", AcaoCobranca.dia_atraso, _numero),
+        ("Parcela", AcaoCobranca.parcela, _numero),
+        ("Enviada em", AcaoCobranca.enviada_em, _data_hora),
+        ("Status Envio", AcaoCobranca.status_envio, _texto),
+        ("Usuário", AcaoCobranca.usuario, _texto),
+    ], joins=[(Contrato, AcaoCobranca.contrato_id == Contrato.id)]),
+
+    TabelaExportacao("responsaveis_cobranca", "Responsáveis", ResponsavelCobranca, [
+        ("ID", ResponsavelCobranca.id, _bruto),
+        ("Contrato ID", ResponsavelCobranca.contrato_id, _bruto),
+        ("Contrato", Contrato.contrato, _texto),
+        ("Usuário", ResponsavelCobranca.usuario, _texto),
+    ], joins=[(Contrato, ResponsavelCobranca.contrato_id == Contrato.id)]),
+
+    # Usuários: sem a coluna de senha
+    TabelaExportacao("usuarios", "Usuários", Usuario, [
+        ("ID", Usuario.id, _bruto),
+        ("Nome", Usuario.nome, _texto),
+        ("E-mail", Usuario.email, _texto),
+        ("Tipo", Usuario.tipo, _texto),
+    ]),
+]
+
+
+TABELAS_POR_NOME = {tabela.nome: tabela for tabela in TABELAS_BASE_COMPLETA}
+
+
+def gerar_parte(app, tabela, caminho, tamanho_lote=LINHAS_POR_LOTE):
+    """
+    Consulta e formata uma tabela gravando as linhas em `caminho` (lotes em
+    pickle). Roda numa thread própria, com app context e sessão próprios.
+    Retorna (total de linhas, segundos).
+    """
+    inicio = time.perf_counter()
+    total = 0
+    with app.app_context():
+        with open(caminho, "wb") as f:
+            lote = []
+            for linha in tabela.linhas(tamanho_lote):
+                lote.append(linha)
+                if len(lote) >= tamanho_lote:
+                    pickle.dump(lote, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    total += len(lote)
+                    lote = []
+            if lote:
+                pickle.dump(lote, f, protocol=pickle.HIGHEST_PROTOCOL)
+                total += len(lote)
+    return total, time.perf_counter() - inicio
+
+
+def ler_parte(caminho):
+    """Linhas de uma parte gravada por `gerar_parte`, lote a lote."""
+    with open(caminho, "rb") as f:
+        while True:
+            try:
+                lote = pickle.load(f)
+            except EOFError:
+                return
+            yield from lote
+
+
+def escrever_aba(workbook, tabela, linhas, formato_cabecalho):
+    """Escreve uma aba linha a linha. A aba só é criada se houver dados."""
+    planilha = None
+    total = 0
+    for total, linha in enumerate(linhas, start=1):
+        if planilha is None:
+            planilha = workbook.add_worksheet(tabela.aba)
+            planilha.write_row(0, 0, tabela.cabecalhos, formato_cabecalho)
+        planilha.write_row(total, 0, linha)
+    return total
+
+
+def escrever_base_completa(caminho, threads=THREADS_ABAS):
+    """Gera o .xlsx da base completa em `caminho` com memória constante."""
+    app = current_app._get_current_object()
+    os.makedirs(PASTA_TEMPORARIA, exist_ok=True)
+    limpar_temporarios()
+    partes = []
+    for _ in TABELAS_BASE_COMPLETA:
+        descritor, parte = tempfile.mkstemp(suffix=".parte", dir=PASTA_TEMPORARIA)
+        os.close(descritor)
+        partes.append(parte)
+
+    inicio = time.perf_counter()
+    workbook = xlsxwriter.Workbook(caminho, {"constant_memory": True, "tmpdir": PASTA_TEMPORARIA})
+    formato_cabecalho = workbook.add_format({"bold": True, "border": 1, "align": "center"})
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="aba") as executor:
+            futuros = [
+                executor.submit(gerar_parte, app, tabela, parte)
+                for tabela, parte in zip(TABELAS_BASE_COMPLETA, partes)
+            ]
+            try:
+                # A montagem segue a ordem das abas; as demais continuam sendo geradas
+                for tabela, parte, futuro in zip(TABELAS_BASE_COMPLETA, partes, futuros):
+                    total, tempo_consulta = futuro.result()
+                    inicio_escrita = time.perf_counter()
+                    escrever_aba(workbook, tabela, ler_parte(parte), formato_cabecalho)
+                    logging.info(
+                        f"[EXPORTAÇÃO] Aba '{tabela.aba}': {total} linhas | consulta+formatação "
+                        f"{tempo_consulta:.2f}s | escrita {time.perf_counter() - inicio_escrita:.2f}s"
+                    )
+            except Exception:
+                for futuro in futuros:
+                    futuro.cancel()
+                raise
+    finally:
+        workbook.close()
+        for parte in partes:
+            try:
+                os.remove(parte)
+            except OSError:
+                pass
+    logging.info(f"[EXPORTAÇÃO] Base completa gerada em {time.perf_counter() - inicio:.2f}s ({threads} threads)")
+
+
+def limpar_temporarios():
+    """Remove partes e temporários esquecidos (ex.: processo encerrado no meio da geração)."""
+    limite = time.time() - IDADE_MAXIMA_TEMPORARIOS
+    for nome in os.listdir(PASTA_TEMPORARIA):
+        caminho = os.path.join(PASTA_TEMPORARIA, nome)
+        try:
+            if os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+
+# ----------------------------------------------------------------------
+# CSV / NDJSON comprimidos em gzip durante o envio
+# ----------------------------------------------------------------------
+
+FORMATOS_BRUTOS = ("csv", "ndjson")
+
+
+def _valor_json(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return valor
+
+
+def _valor_csv(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def _blocos_texto(tabela, formato, tamanho_lote):
+    """Texto da tabela em blocos de `tamanho_lote` linhas (o primeiro bloco é o cabeçalho)."""
+    nomes = tabela.nomes_brutos
+    buffer = io.StringIO()
+
+    if formato == "csv":
+        escritor = csv.writer(buffer, lineterminator="\n")
+        escritor.writerow(nomes)
+        escrever = lambda linha: escritor.writerow([_valor_csv(v) for v in linha])
+    else:
+        escrever = lambda linha: buffer.write(
+            json.dumps(dict(zip(nomes, map(_valor_json, linha))), ensure_ascii=False) + "\n"
+        )
+
+    # Cabeçalho sai antes mesmo da consulta ao banco
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    pendentes = 0
+    for linha in tabela.linhas_brutas(tamanho_lote):
+        escrever(linha)
+        pendentes += 1
+        if pendentes >= tamanho_lote:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendentes = 0
+    if pendentes:
+        yield buffer.getvalue()
+
+
+def transmitir_tabela_gzip(tabela, formato, tamanho_lote=LINHAS_POR_LOTE, nivel=6):
+    """
+    Gera os bytes gzip da tabela. Cada lote é enviado com Z_SYNC_FLUSH, então o
+    cliente recebe dados continuamente e a memória fica limitada a um lote.
+    """
+    compressor = zlib.compressobj(nivel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    inicio = time.perf_counter()
+    total_bytes = 0
+    for bloco in _blocos_texto(tabela, formato, tamanho_lote):
+        dados = compressor.compress(bloco.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        total_bytes += len(dados)
+        yield dados
+    dados = compressor.flush()
+    total_bytes += len(dados)
+    yield dados
+    logging.info(
+        f"[EXPORTAÇÃO] {tabela.nome}.{formato}.gz: {total_bytes} bytes em {time.perf_counter() - inicio:.2f}s"
+    )
@@ -0,0 +1,173 @@
+"""
+Serviço de exportações em segundo plano.
+
+A requisição só enfileira o job; um trabalhador (thread) gera o arquivo numa
+pasta de artefatos e a página de espera consulta o estado até o download
+ficar disponível. Assim a thread do Waitress não fica presa gerando planilhas.
+
+O identificador do job é o hash de (exportação, parâmetros, versão dos dados):
+- dois pedidos iguais enquanto o primeiro roda compartilham o mesmo job;
+- um artefato já pronto é reaproveitado enquanto a versão dos dados não muda
+  (inclusive após reiniciar o servidor, pois ele fica em disco).
+
+Artefatos antigos são removidos por idade e pelo tamanho total da pasta.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.cache_relatorios import normalizar_parametros
+from app.versao_dados import versao_atual
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+PRONTO = "pronto"
+ERRO = "erro"
+
+
+class JobExportacao:
+    def __init__(self, id, nome, extensao, nome_download, requer_admin):
+        self.id = id
+        self.nome = nome
+        self.extensao = extensao
+        self.nome_download = nome_download
+        self.requer_admin = requer_admin
+        self.estado = PENDENTE
+        self.erro = None
+        self.criado_em = time.time()
+        self.iniciado_em = None
+        self.concluido_em = None
+
+    @property
+    def duracao(self):
+        if self.iniciado_em and self.concluido_em:
+            return round(self.concluido_em - self.iniciado_em, 2)
+        return None
+
+    def como_dict(self):
+        return {
+            "id": self.id,
+            "nome": self.nome,
+            "estado": self.estado,
+            "erro": self.erro,
+            "duracao": self.duracao,
+        }
+
+
+class ServicoExportacao:
+    """Fila de exportações com artefatos reaproveitáveis em disco."""
+
+    def __init__(self, app, pasta, max_trabalhadores=2, idade_maxima=24 * 3600, max_bytes=1024 * 1024 * 1024):
+        self.app = app
+        self.pasta = pasta
+        self.idade_maxima = idade_maxima
+        self.max_bytes = max_bytes
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_trabalhadores, thread_name_prefix="exportacao")
+        os.makedirs(self.pasta, exist_ok=True)
+
+    def _arquivo(self, job_id, extensao):
+        return os.path.join(self.pasta, f"{job_id}{extensao}")
+
+    def caminho(self, job):
+        return self._arquivo(job.id, job.extensao)
+
+    def enfileirar(self, nome, parametros, tabelas, gerar, extensao, nome_download, requer_admin=False):
+        """
+        Retorna o job para (nome, parâmetros, versão das tabelas), criando-o se
+        necessário. `gerar(caminho)` escreve o arquivo e roda num app context.
+        """
+        chave = (nome, normalizar_parametros(parametros), versao_atual(*tabelas))
+        job_id = hashlib.sha256(repr(chave).encode("utf-8")).hexdigest()[:32]
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.estado != ERRO:
+                return job
+
+            job = JobExportacao(job_id, nome, extensao, nome_download, requer_admin)
+            self._jobs[job_id] = job
+
+            caminho = self.caminho(job)
+            if os.path.exists(caminho):
+                # Artefato de uma execução anterior com a mesma versão dos dados
+                os.utime(caminho)
+                job.estado = PRONTO
+                job.concluido_em = time.time()
+                return job
+
+        self._executor.submit(self._executar, job, gerar)
+        return job
+
+    def _executar(self, job, gerar):
+        job.estado = EXECUTANDO
+        job.iniciado_em = time.time()
+        caminho = self.caminho(job)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        try:
+            with self.app.app_context():
+                gerar(temporario)
+            os.replace(temporario, caminho)
+            job.estado = PRONTO
+            logging.info(f"[EXPORTAÇÃO] Job {job.nome} ({job.id}) pronto em {time.time() - job.iniciado_em:.2f}s")
+        except Exception as e:
+            job.estado = ERRO
+            job.erro = str(e)
+            logging.error(f"[EXPORTAÇÃO] Job {job.nome} ({job.id}) falhou: {e}", exc_info=True)
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+        finally:
+            job.concluido_em = time.time()
+            self.limpar_artefatos()
+
+    def obter(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def limpar_artefatos(self):
+        """Remove artefatos vencidos e, se preciso, os mais antigos até caber no limite."""
+        limite = time.time() - self.idade_maxima
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            caminho = os.path.join(self.pasta, nome)
+            try:
+                st = os.stat(caminho)
+            except OSError:
+                continue
+            # Temporários só são removidos por idade (podem estar sendo escritos)
+            if nome.endswith(".tmp") or st.st_mtime < limite:
+                if st.st_mtime < limite:
+                    self._remover(caminho)
+                continue
+            arquivos.append((st.st_mtime, st.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.max_bytes:
+                break
+            if self._remover(caminho):
+                total -= tamanho
+
+        # Jobs prontos cujo artefato sumiu deixam de existir
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.estado == PRONTO and not os.path.exists(self.caminho(job)):
+                    del self._jobs[job_id]
+                elif job.estado == ERRO and job.concluido_em and job.concluido_em < limite:
+                    del self._jobs[job_id]
+
+    @staticmethod
+    def _remover(caminho):
+        try:
+            os.remove(caminho)
+            return True
+        except OSError:
+            # No Windows um arquivo em download não pode ser removido; fica para a próxima
+            return False
@@ -0,0 +1,217 @@
+"""
+Agregações dos relatórios administrativos calculadas no próprio banco.
+
+As métricas do relatório de contratos vivos são montadas com GROUP BY e
+expressões CASE, de modo que apenas as linhas agregadas chegam ao Python.
+No PostgreSQL a mediana e a moda usam percentile_cont/mode(); nos demais
+bancos (ex.: SQLite em desenvolvimento) são derivadas de um histograma
+agrupado, que também é pequeno (uma linha por valor distinto).
+"""
+
+from decimal import Decimal
+
+from sqlalchemy import and_, case, func, literal_column, or_
+
+from app import db, Contrato, Vendedor
+
+STATUS_VIVOS = ["Em dia", "Pago", "Em atraso"]
+PARCELAS_AGENCIAMENTO = [1, 2, 3]
+PARCELA_INICIO_VITALICIO = 4
+# Literal SQL para manter o tipo numeric no PostgreSQL (um parâmetro float viraria double)
+PERCENTUAL_VITALICIO = literal_column("0.04")
+
+
+def _dec(valor):
+    """Normaliza o retorno do banco (Decimal, float, int ou None) para Decimal."""
+    if valor is None:
+        return Decimal(0)
+    if isinstance(valor, Decimal):
+        return valor
+    return Decimal(str(valor))
+
+
+def _usa_funcoes_ordenadas():
+    """percentile_cont/mode() WITHIN GROUP só existem no PostgreSQL."""
+    return db.engine.dialect.name == "postgresql"
+
+
+# Expressões reutilizadas pelas consultas agregadas
+_valor = func.coalesce(Contrato.valor_parcela, 0)
+_vidas = func.coalesce(Contrato.vidas, 0)
+_eh_agenciamento = Contrato.parcela_atual.in_(PARCELAS_AGENCIAMENTO)
+_eh_vitalicio = Contrato.parcela_atual >= PARCELA_INICIO_VITALICIO
+_tem_vidas = and_(Contrato.vidas.isnot(None), Contrato.vidas != 0)
+_tem_valor = and_(Contrato.valor_parcela.isnot(None), Contrato.valor_parcela != 0)
+_tem_parcela = and_(Contrato.parcela_atual.isnot(None), Contrato.parcela_atual != 0)
+
+_agenciamento = case((_eh_agenciamento, _valor), else_=0)
+_vitalicio = case((_eh_vitalicio, _valor * PERCENTUAL_VITALICIO), else_=0)
+_comissao = case(
+    (_eh_agenciamento, _valor),
+    (_eh_vitalicio, _valor * PERCENTUAL_VITALICIO),
+    else_=0
+)
+# Multiplica por 1.0 para evitar divisão inteira no SQLite
+_ticket_vida = _valor / (Contrato.vidas * literal_column("1.0"))
+
+plano_normalizado = case(
+    (or_(
+        Contrato.nome_plano.is_(None),
+        Contrato.nome_plano == "",
+        func.lower(func.trim(Contrato.nome_plano)) == "nan"
+    ), "Não informado"),
+    else_=func.trim(Contrato.nome_plano)
+)
+
+
+def _filtro_vivos(query):
+    return query.filter(Contrato.status.in_(STATUS_VIVOS))
+
+
+def texto_ou_traco(coluna):
+    """Coluna texto com nulos/vazios substituídos por '-'."""
+    return func.coalesce(func.nullif(coluna, ""), "-")
+
+
+def _top(coluna, limite=10):
+    """Top N valores de uma coluna texto (nulos/vazios contam como '-')."""
+    chave = texto_ou_traco(coluna)
+    total = func.count()
+    linhas = _filtro_vivos(db.session.query(chave, total)) \
+        .group_by(chave) \
+        .order_by(total.desc(), chave) \
+        .limit(limite) \
+        .all()
+    return [(nome, qtd) for nome, qtd in linhas]
+
+
+def _mediana_histograma(histograma):
+    """Mediana a partir de pares (valor, frequência) ordenados por valor."""
+    n = sum(freq for _, freq in histograma)
+    if not n:
+        return None
+    alvos = {(n - 1) // 2, n // 2}
+    encontrados = []
+    acumulado = 0
+    for valor, freq in histograma:
+        for alvo in sorted(alvos):
+            if acumulado <= alvo < acumulado + freq:
+                encontrados.append(valor)
+        acumulado += freq
+    return sum(encontrados) / len(encontrados)
+
+
+def _mediana_e_moda():
+    """Mediana das parcelas ativas e moda de vidas por contrato."""
+    if _usa_funcoes_ordenadas():
+        mediana = _filtro_vivos(db.session.query(
+            func.percentile_cont(0.5).within_group(Contrato.parcela_atual)
+        )).filter(_tem_parcela).scalar()
+        moda = _filtro_vivos(db.session.query(
+            func.mode().within_group(_vidas)
+        )).scalar()
+        return mediana, moda
+
+    histograma_parcelas = _filtro_vivos(db.session.query(
+        Contrato.parcela_atual, func.count()
+    )).filter(_tem_parcela).group_by(Contrato.parcela_atual).order_by(Contrato.parcela_atual).all()
+    mediana = _mediana_histograma(histograma_parcelas)
+
+    freq = func.count()
+    linha_moda = _filtro_vivos(db.session.query(_vidas, freq)) \
+        .group_by(_vidas).order_by(freq.desc(), _vidas).first()
+    moda = linha_moda[0] if linha_moda else None
+    return mediana, moda
+
+
+def metricas_vivos_sql():
+    """
+    Calcula todas as métricas do relatório de contratos vivos via SQL.
+
+    Retorna um dicionário com as mesmas chaves usadas pelo template
+    `relatorio_vivos.html`.
+    """
+    totais = _filtro_vivos(db.session.query(
+        func.count(Contrato.id).label("contratos"),
+        func.sum(_vidas).label("vidas"),
+        func.sum(_valor).label("faturamento"),
+        func.sum(_agenciamento).label("agenciamento"),
+        func.sum(_vitalicio).label("vitalicio"),
+        func.sum(case((_tem_vidas, _comissao))).label("comissao_com_vidas"),
+        func.count(case((_tem_vidas, 1))).label("contratos_com_vidas"),
+        func.avg(case((_tem_vidas, _ticket_vida))).label("ticket_vida"),
+        func.avg(case((_tem_valor, _valor))).label("parcela_media"),
+        func.max(case((_tem_parcela, Contrato.parcela_atual))).label("parcela_maxima"),
+    )).one()
+
+    total_contratos = totais.contratos or 0
+    total_vidas = int(totais.vidas or 0)
+    total_faturamento = _dec(totais.faturamento)
+    total_agenciamento = _dec(totais.agenciamento)
+    total_vitalicio = _dec(totais.vitalicio)
+    comissao_com_vidas = _dec(totais.comissao_com_vidas)
+    contratos_com_vidas = totais.contratos_com_vidas or 0
+
+    # Agrupamento por produto
+    vidas_por_produto = {}
+    agenciamento_por_produto = {}
+    vitalicio_por_produto = {}
+    por_plano = _filtro_vivos(db.session.query(
+        plano_normalizado.label("plano"),
+        func.sum(_vidas),
+        func.sum(_agenciamento),
+        func.count(case((_eh_agenciamento, 1))),
+        func.sum(_vitalicio),
+        func.count(case((_eh_vitalicio, 1))),
+    )).group_by(plano_normalizado).all()
+    for plano, vidas, agenc, qtd_agenc, vital, qtd_vital in por_plano:
+        vidas_por_produto[plano] = int(vidas or 0)
+        if qtd_agenc:
+            agenciamento_por_produto[plano] = _dec(agenc)
+        if qtd_vital:
+            vitalicio_por_produto[plano] = _dec(vital)
+
+    percentual_por_produto = {
+        produto: round((vidas / total_vidas * 100) if total_vidas else 0, 1)
+        for produto, vidas in vidas_por_produto.items()
+    }
+
+    # Agrupamento por vendedora (contratos sem vendedor ficam de fora)
+    vidas_por_vendedora = {}
+    contratos_por_vendedora = {}
+    por_vendedor = _filtro_vivos(
+        db.session.query(Vendedor.nome, func.sum(_vidas), func.count(Contrato.id))
+        .join(Vendedor, Contrato.vendedor_id == Vendedor.id)
+    ).group_by(Vendedor.nome).all()
+    for nome, vidas, qtd in por_vendedor:
+        vidas_por_vendedora[nome] = int(vidas or 0)
+        contratos_por_vendedora[nome] = qtd
+
+    mediana, moda = _mediana_e_moda()
+
+    return {
+        "total_contratos": total_contratos,
+        "total_vidas": total_vidas,
+        "media_vidas_por_contrato": round(total_vidas / total_contratos, 2) if total_contratos else 0,
+        "total_faturamento": round(total_faturamento, 2),
+        "total_agenciamento": round(total_agenciamento, 2),
+        "total_vitalicio": round(total_vitalicio, 2),
+        "vidas_por_produto": vidas_por_produto,
+        "parcela_mediana": round(mediana, 2) if mediana is not None else "-",
+        "parcela_maxima": totais.parcela_maxima if totais.parcela_maxima else "-",
+        "percentual_por_produto": percentual_por_produto,
+        "agenciamento_por_produto": agenciamento_por_produto,
+        "vitalicio_por_produto": vitalicio_por_produto,
+        "vidas_por_vendedora": vidas_por_vendedora,
+        "contratos_por_vendedora": contratos_por_vendedora,
+        "parcela_media": round(_dec(totais.parcela_media), 2),
+        "parcela_moda": moda if moda is not None else "Sem valor único",
+        "ticket_medio_contrato": round(total_faturamento / total_contratos, 2) if total_contratos else 0,
+        "ticket_medio_vida": round(_dec(totais.ticket_vida), 2) if totais.ticket_vida is not None else 0,
+        "comissao_media_contrato": round(comissao_com_vidas / contratos_com_vidas, 2) if contratos_com_vidas else 0,
+        "comissao_media_vida": round(comissao_com_vidas / total_vidas, 2) if total_vidas else 0,
+        "comissao_agenciamento": round(total_agenciamento, 2),
+        "comissao_vitalicio": round(total_vitalicio, 2),
+        "top_atividades": _top(Contrato.atividade_economica),
+        "top_cidades": _top(Contrato.cidade),
+    }
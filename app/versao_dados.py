@@ -0,0 +1,114 @@
+"""
+Versão dos dados por tabela.
+
+Toda escrita feita pela sessão do SQLAlchemy (interface web ou automação, que
+compartilham os modelos de `app`) avança o contador da tabela alterada. Caches
+de relatórios usam `versao_atual()` como carimbo: quando a versão muda, as
+entradas antigas simplesmente deixam de ser encontradas.
+
+O flush só anota as tabelas alteradas na sessão; o contador avança uma vez
+por transação, depois do commit, numa transação curta e separada. Assim
+escritores concorrentes (interface, sessões do robô) não ficam presos na linha
+de `versao_dados` até o fim das transações uns dos outros, e um rollback não
+avança nada. Um cache montado entre o commit e o avanço fica guardado com a
+versão antiga e deixa de ser encontrado logo em seguida.
+
+Escritas em massa que não passam pelo flush do ORM (ex.: UPDATE via Core)
+devem chamar `avancar_versao()` explicitamente.
+
+A tabela `versao_dados` é criada pela migração (migrations/add_versao_dados.sql)
+ou pelo `db.create_all()`, nunca durante uma escrita.
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from app import db, VersaoDados
+
+TABELAS_VERSIONADAS = (
+    "contratos",
+    "vendedores",
+    "acoes_cobranca",
+    "responsaveis_cobranca",
+    "usuarios",
+)
+
+# Chave em Session.info com as tabelas alteradas na transação em andamento
+_PENDENTES = "versao_dados_pendentes"
+
+
+def _incrementar(conexao, tabelas):
+    tabela = VersaoDados.__table__
+    agora = datetime.now()
+    for nome in sorted(tabelas):  # ordem fixa evita deadlock entre processos
+        resultado = conexao.execute(
+            update(tabela)
+            .where(tabela.c.tabela == nome)
+            .values(versao=tabela.c.versao + 1, atualizado_em=agora)
+        )
+        if resultado.rowcount == 0:
+            conexao.execute(insert(tabela).values(tabela=nome, versao=1, atualizado_em=agora))
+
+
+def _anotar(session, tabelas):
+    session.info.setdefault(_PENDENTES, set()).update(tabelas)
+
+
+def avancar_versao(*tabelas, conexao=None):
+    """
+    Avança a versão das tabelas informadas (para escritas fora do flush do ORM).
+    Com `conexao` (transação Core do chamador), avança nela, como último passo
+    antes do commit; sem ela, avança depois do commit da sessão atual.
+    """
+    tabelas = {t for t in tabelas if t in TABELAS_VERSIONADAS}
+    if not tabelas:
+        return
+    if conexao is not None:
+        _incrementar(conexao, tabelas)
+    else:
+        _anotar(db.session(), tabelas)
+
+
+def versao_atual(*tabelas):
+    """
+    Retorna o carimbo de versão (tupla de inteiros) das tabelas informadas.
+    Sem argumentos, considera todas as tabelas versionadas.
+    """
+    tabelas = tabelas or TABELAS_VERSIONADAS
+    tabela = VersaoDados.__table__
+    linhas = dict(db.session.execute(
+        select(tabela.c.tabela, tabela.c.versao).where(tabela.c.tabela.in_(tabelas))
+    ).all())
+    return tuple(linhas.get(t, 0) for t in tabelas)
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_escritas(session, flush_context):
+    tabelas = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        nome = getattr(obj, "__tablename__", None)
+        if nome in TABELAS_VERSIONADAS:
+            tabelas.add(nome)
+    if tabelas:
+        _anotar(session, tabelas)
+
+
+@event.listens_for(Session, "after_commit")
+def _avancar_apos_commit(session):
+    tabelas = session.info.pop(_PENDENTES, None)
+    if not tabelas:
+        return
+    try:
+        with session.get_bind().begin() as conexao:
+            _incrementar(conexao, tabelas)
+    except Exception as e:
+        # Os dados já estão gravados; no pior caso um cache fica velho até a próxima escrita
+        logging.error(f"[VERSAO] Falha ao avançar versão de {sorted(tabelas)}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_apos_rollback(session):
+    session.info.pop(_PENDENTES, None)
@@ -0,0 +1,26 @@
+-- ============================================================================
+-- MIGRAÇÃO: Tabela faturas_snapshot (faturas lidas pela automação)
+-- ============================================================================
+--
+-- A cada checagem a automação guarda as faturas do portal já normalizadas
+-- (JSON, na ordem do portal) com o SHA-256 do conteúdo. Uma linha por versão:
+-- enquanto as faturas e o contexto da análise (mês, vigência, D+3, faturas
+-- vencidas) não mudam, a automação não recalcula o status nem regrava o
+-- contrato; só avança data_checagem e faturas_snapshot.ultima_checagem.
+--
+-- O histórico aparece na página /historico/<contrato_id>.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS faturas_snapshot (
+    id SERIAL PRIMARY KEY,
+    contrato_id INTEGER NOT NULL REFERENCES contratos (id),
+    primeira_checagem DATE NOT NULL,
+    ultima_checagem DATE NOT NULL,
+    hash VARCHAR(64) NOT NULL,
+    contexto VARCHAR(40),
+    status VARCHAR(50),
+    quantidade INTEGER,
+    faturas JSON NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_faturas_snapshot_contrato_id ON faturas_snapshot (contrato_id);
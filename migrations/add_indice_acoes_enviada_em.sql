@@ -0,0 +1,12 @@
+-- ============================================================================
+-- MIGRAÇÃO: Índice em acoes_cobranca.enviada_em
+-- ============================================================================
+--
+-- Os relatórios mensais filtram as ações por intervalo de datas
+-- (enviada_em >= início do mês AND enviada_em < início do mês seguinte);
+-- com este índice só as ações do mês são lidas.
+--
+-- Bancos novos já recebem o índice via db.create_all().
+-- ============================================================================
+
+CREATE INDEX IF NOT EXISTS ix_acoes_cobranca_enviada_em ON acoes_cobranca (enviada_em);
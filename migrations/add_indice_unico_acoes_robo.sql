@@ -0,0 +1,28 @@
+-- ============================================================================
+-- MIGRAÇÃO: Índice único das ações de cobrança da automação
+-- ============================================================================
+--
+-- A automação grava os resultados em lote (scripts/buffer_escrita.py) e insere
+-- as ações com INSERT ... ON CONFLICT DO NOTHING; o conflito é detectado por
+-- este índice: uma ação "Enviado" por (contrato_id, dia_atraso). As ações
+-- manuais (status_envio = 'Manual') não entram no índice e podem se repetir.
+--
+-- Antes de criar o índice, remove duplicatas antigas das ações da automação
+-- (mantém a mais antiga de cada contrato/dia). Confira antes em produção:
+--     SELECT contrato_id, dia_atraso, COUNT(*) FROM acoes_cobranca
+--     WHERE status_envio = 'Enviado' GROUP BY 1, 2 HAVING COUNT(*) > 1;
+--
+-- Bancos novos já recebem o índice via db.create_all().
+-- ============================================================================
+
+DELETE FROM acoes_cobranca a
+USING acoes_cobranca b
+WHERE a.status_envio = 'Enviado'
+  AND b.status_envio = 'Enviado'
+  AND a.contrato_id = b.contrato_id
+  AND a.dia_atraso = b.dia_atraso
+  AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_acoes_cobranca_robo_contrato_dia
+    ON acoes_cobranca (contrato_id, dia_atraso)
+    WHERE status_envio = 'Enviado';
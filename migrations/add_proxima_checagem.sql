@@ -0,0 +1,22 @@
+-- ============================================================================
+-- MIGRAÇÃO: Coluna contratos.proxima_checagem (agenda da automação)
+-- ============================================================================
+--
+-- A automação grava, a cada verificação, o dia em que o contrato volta a ser
+-- consultado (atraso: dia seguinte; Em dia/Pago: próximo D+3; Cliente Morto:
+-- +15 dias). A seleção de candidatos vira uma busca por intervalo no índice
+-- (proxima_checagem <= hoje) em vez de carregar e filtrar a base inteira.
+--
+-- NULL = agenda a recalcular: a automação calcula sozinha na primeira vez que
+-- encontrar o contrato, e a interface zera o campo ao alterar status,
+-- vigência ou data de checagem. Para calcular tudo de uma vez depois da
+-- migração:
+--     python scripts/backfill_proxima_checagem.py
+--
+-- 9999-12-31 = fora da agenda (ex.: Em dia/Pago sem vigência): o contrato não
+-- é consultado nem recalculado até a interface alterar um daqueles campos.
+-- ============================================================================
+
+ALTER TABLE contratos ADD COLUMN IF NOT EXISTS proxima_checagem DATE;
+
+CREATE INDEX IF NOT EXISTS ix_contratos_proxima_checagem ON contratos (proxima_checagem);
@@ -0,0 +1,21 @@
+-- ============================================================================
+-- MIGRAÇÃO: Tabela de versão dos dados
+-- ============================================================================
+--
+-- Cada escrita (interface ou automação) avança o contador da tabela alterada.
+-- Os caches de relatórios/análises usam esse número para saber se estão velhos.
+--
+-- Rode este script antes de subir a versão que usa a tabela (ou use
+-- db.create_all()); a aplicação não cria a tabela durante as escritas.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS versao_dados (
+    tabela VARCHAR(50) PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP
+);
+
+INSERT INTO versao_dados (tabela, versao)
+VALUES ('contratos', 0), ('vendedores', 0), ('acoes_cobranca', 0),
+       ('responsaveis_cobranca', 0), ('usuarios', 0)
+ON CONFLICT (tabela) DO NOTHING;
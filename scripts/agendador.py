@@ -0,0 +1,119 @@
+"""
+Agenda do robô entre um ciclo e outro.
+
+Antes, `run()` chamava `atualizar_banco` a cada 5 minutos (refazendo a
+seleção dos candidatos mesmo sem nada vencido) e, sem candidatos, dormia até
+00:05 do dia seguinte. Agora o robô pergunta ao banco quando vence a próxima
+checagem e dorme até lá:
+
+- contratos sem agenda (proxima_checagem NULL: novos ou editados) ou vencidos
+  que sobraram do ciclo (falha ou orçamento de tempo): novo ciclo em
+  INTERVALO_RETENTATIVA;
+- senão: 00:05 (horário de Brasília) do dia da menor proxima_checagem (os
+  marcados com FORA_DA_AGENDA não contam: só voltam quando editados).
+
+Durante a espera o heartbeat continua (o watchdog não mata o robô) e, a cada
+`intervalo_despertar` segundos, uma leitura da versão da tabela de contratos
+(app/versao_dados.py, uma linha) detecta escritas da interface: só então a
+agenda é consultada de novo e, se surgiram contratos a verificar (importação,
+edição, botão "Verificar agora" do histórico), o ciclo começa na hora.
+"""
+
+import logging
+import time as relogio
+from datetime import datetime, time, timedelta, timezone
+
+from app import app, db, Contrato
+from app.versao_dados import versao_atual
+from scripts.faturas import FORA_DA_AGENDA, STATUS_AGENDADOS
+
+FUSO_BRASILIA = timezone(timedelta(hours=-3))
+HORA_INICIO = time(0, 5)
+INTERVALO_RETENTATIVA = 300  # 5 minutos
+INTERVALO_DESPERTAR = 60
+INTERVALO_HEARTBEAT = 10
+
+
+class Agendador:
+    """Espera até o próximo ciclo: a próxima checagem vencida ou uma escrita da interface."""
+
+    def __init__(self, ao_esperar=None, intervalo_despertar=INTERVALO_DESPERTAR,
+                 intervalo_retentativa=INTERVALO_RETENTATIVA):
+        self.ao_esperar = ao_esperar
+        self.intervalo_despertar = intervalo_despertar
+        self.intervalo_retentativa = intervalo_retentativa
+
+    def situacao(self, hoje):
+        """(contratos a verificar já: sem agenda ou vencidos, menor proxima_checagem futura)."""
+        agendado = Contrato.status.in_(STATUS_AGENDADOS)
+        with app.app_context():
+            try:
+                pendentes = db.session.execute(
+                    db.select(db.func.count(Contrato.id)).where(
+                        agendado, db.or_(Contrato.proxima_checagem.is_(None), Contrato.proxima_checagem <= hoje)
+                    )
+                ).scalar()
+                menor = db.session.execute(
+                    db.select(db.func.min(Contrato.proxima_checagem))
+                    .where(agendado, Contrato.proxima_checagem > hoje, Contrato.proxima_checagem < FORA_DA_AGENDA)
+                ).scalar()
+            finally:
+                db.session.remove()
+        return pendentes, menor
+
+    def proximo_ciclo(self, agora, pendentes_antes=None):
+        """
+        (momento do próximo ciclo, contratos pendentes). Com pendentes, o ciclo
+        é em INTERVALO_RETENTATIVA; na hora se surgiram pendentes novos desde
+        `pendentes_antes` (contrato novo, editado ou "Verificar agora").
+        """
+        pendentes, menor = self.situacao(agora.date())
+        if pendentes:
+            if pendentes_antes is not None and pendentes > pendentes_antes:
+                return agora, pendentes
+            return agora + timedelta(seconds=self.intervalo_retentativa), pendentes
+        # Nenhum contrato agendado: reavalia no dia seguinte
+        dia = menor if menor is not None else agora.date() + timedelta(days=1)
+        return datetime.combine(dia, HORA_INICIO, tzinfo=agora.tzinfo), pendentes
+
+    def _versao_contratos(self):
+        with app.app_context():
+            try:
+                return versao_atual("contratos")
+            finally:
+                db.session.remove()
+
+    def aguardar(self):
+        """Dorme até o próximo ciclo (ou até a interface gravar algo que o antecipe)."""
+        agora = datetime.now(FUSO_BRASILIA)
+        try:
+            alvo, pendentes = self.proximo_ciclo(agora)
+            versao = self._versao_contratos()
+        except Exception as e:
+            logging.error(f"Erro ao consultar a agenda ({e}). Novo ciclo em {self.intervalo_retentativa}s.")
+            alvo, versao = agora + timedelta(seconds=self.intervalo_retentativa), None
+        logging.info(f"💤 Próximo ciclo em {alvo:%d/%m/%Y %H:%M:%S} ({(alvo - agora).total_seconds():.0f}s).")
+
+        proxima_leitura = relogio.monotonic() + self.intervalo_despertar
+        while True:
+            restante = (alvo - datetime.now(FUSO_BRASILIA)).total_seconds()
+            if restante <= 0:
+                return
+            relogio.sleep(min(restante, INTERVALO_HEARTBEAT))
+            if self.ao_esperar:
+                self.ao_esperar()
+            if versao is None or relogio.monotonic() < proxima_leitura:
+                continue
+            proxima_leitura = relogio.monotonic() + self.intervalo_despertar
+            try:
+                atual = self._versao_contratos()
+                if atual == versao:
+                    continue
+                versao = atual
+                novo_alvo, pendentes = self.proximo_ciclo(datetime.now(FUSO_BRASILIA), pendentes)
+            except Exception as e:
+                logging.warning(f"Erro ao reconsultar a agenda durante a espera: {e}")
+                continue
+            if novo_alvo < alvo:
+                alvo = novo_alvo
+                logging.info(f"⏰ Contratos alterados pela interface: próximo ciclo antecipado para {alvo:%d/%m/%Y %H:%M:%S}.")
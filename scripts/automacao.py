@@ -38,11 +38,8 @@ import os
 # Adiciona o diretório pai (raiz do projeto) ao path para importar 'app'
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import app, db, Contrato, AcaoCobranca
+from app import app, db, Contrato, FaturaSnapshot
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -54,12 +51,15 @@ import time
 import logging
 import threading
 import pytz
-import threading
-import pytz
+import queue
 import re
 import socket
 from logging.handlers import TimedRotatingFileHandler
-from selenium.common.exceptions import InvalidSessionIdException
+from selenium.common.exceptions import (
+    InvalidSessionIdException, NoAlertPresentException, NoSuchFrameException,
+    StaleElementReferenceException, TimeoutException, UnexpectedAlertPresentException,
+    WebDriverException
+)
 
 # ============================================================================
 # CONFIGURAÇÕES GLOBAIS
@@ -73,9 +73,41 @@ fuso_brasilia = timezone(timedelta(hours=-3))
 AMIL_USER = os.getenv("AMIL_USER")
 AMIL_PASSWORD = os.getenv("AMIL_PASSWORD")
 # DIAS_VERIFICACAO_MORTOS = 15
-DIAS_ATRASO_PARA_MORTO = 63
-DIAS_D3 = 3
-INTERVALO_EXECUCAO = 300  # 5 minutos
+# Esperas por condição (em vez de sleeps fixos)
+TIMEOUT_ESPERA = 30
+INTERVALO_POLLING = 0.1
+# Como a sessão chegou ao formulário de consulta de faturas
+NAV_FORMULARIO = "formulario"  # o frame principal já estava nele
+NAV_RETORNO = "retorno"        # URL do formulário recarregada no frame
+NAV_MENU = "menu"              # caminho completo pelo menu
+# Sessões do portal em paralelo (cada uma com seu Chrome e login)
+NUM_SESSOES = max(1, int(os.getenv("BOT_SESSOES", "1")))
+# Consulta de faturas via HTTP com os cookies do navegador (o Selenium fica como reserva)
+CONSULTA_HTTP = os.getenv("BOT_CONSULTA_HTTP", "1") == "1"
+# Gravação dos resultados em lote, com diário local para não perder nada numa queda
+LOTE_ESCRITA = max(1, int(os.getenv("BOT_LOTE_ESCRITA", "20")))
+INTERVALO_ESCRITA = float(os.getenv("BOT_INTERVALO_ESCRITA", "30"))
+DIARIO_RESULTADOS = os.getenv("BOT_DIARIO_RESULTADOS", os.path.join("logs", "resultados_pendentes.jsonl"))
+# Fila planejada e contratos concluídos de cada ciclo (retomada após reinício)
+PASTA_DIARIO_CICLOS = os.getenv("BOT_DIARIO_CICLOS", os.path.join("logs", "ciclos"))
+# Chrome: caminho do chromedriver em cache, sem janela, perfis persistentes e um driver reserva
+CACHE_CHROMEDRIVER = os.getenv("BOT_CACHE_CHROMEDRIVER", os.path.join("logs", "chromedriver.json"))
+HEADLESS = os.getenv("BOT_HEADLESS", "0") == "1"
+PASTA_PERFIS_CHROME = os.getenv("BOT_PERFIL_CHROME") or None
+DRIVER_RESERVA = os.getenv("BOT_DRIVER_RESERVA", "1") == "1"
+# Sessão do portal: idade máxima antes de relogar (minutos; o novo login começa em segundo plano
+# a FRACAO_RENOVACAO dela) e intervalo sem consulta concluída a partir do qual a sessão é sondada
+IDADE_MAXIMA_SESSAO = float(os.getenv("BOT_IDADE_MAXIMA_SESSAO", "50")) * 60
+FRACAO_RENOVACAO = 0.9
+INTERVALO_SONDA = 60
+# Métricas no formato Prometheus: arquivo regravado a cada N segundos e endpoint HTTP local opcional
+ARQUIVO_METRICAS = os.getenv("BOT_METRICAS_ARQUIVO", os.path.join("logs", "metricas.prom"))
+INTERVALO_METRICAS = float(os.getenv("BOT_METRICAS_INTERVALO", "15"))
+PORTA_METRICAS = int(os.getenv("BOT_METRICAS_PORTA", "0")) or None
+# Entre ciclos: segundos entre as leituras da versão dos contratos (escritas da interface antecipam o ciclo)
+INTERVALO_DESPERTAR = float(os.getenv("BOT_INTERVALO_DESPERTAR", "60"))
+# Início do processo, para medir o tempo até a primeira consulta
+INICIO_PROCESSO = time.monotonic()
 
 # ============================================================================
 # CONFIGURAÇÃO DE LOGGING
@@ -106,19 +138,15 @@ file_handler = TimedRotatingFileHandler(
 )
 file_handler.suffix = "%Y-%m-%d.log"  # Formato do arquivo rotacionado
 file_handler.setFormatter(
-    logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    logging.Formatter('%(asctime)s - %(levelname)s - [%(threadName)s] %(message)s')
 )
 
 console_handler = logging.StreamHandler()
-console_handler.setFormatter(logging.Formatter('%(levelname)s - %(message)s'))
+console_handler.setFormatter(logging.Formatter('%(levelname)s - [%(threadName)s] %(message)s'))
 
 logger.addHandler(file_handler)
 logger.addHandler(console_handler)
 
-def log_debug(msg):
-    """Wrapper para logs de debug detalhados"""
-    logger.info(f"[DEBUG] {msg}")  # Usando INFO para aparecer no console por enquanto
-
 def log_trace(msg):
     """Wrapper para logs de rastreamento extremo"""
     # logger.debug(f"[TRACE] {msg}") 
@@ -128,142 +156,37 @@ def log_trace(msg):
 # FUNÇÕES AUXILIARES
 # ============================================================================
 
-def parse_date(date_str):
-    """Converte string de data no formato DD/MM/YYYY para objeto date."""
-    try:
-        if not date_str or not date_str.strip():
-            return None
-        return datetime.strptime(date_str.strip(), "%d/%m/%Y").date()
-    except Exception as e:
-        # log_debug(f"Falha ao parsear data '{date_str}': {e}")
-        return None
-
-
-def parse_float(valor_str):
-    """Converte string de valor brasileiro (R$ 1.234,56) para float."""
-    try:
-        cleaned = re.sub(r"[^\d,\.]", "", valor_str)
-        
-        if cleaned.count(",") == 1 and cleaned.count(".") == 0:
-            cleaned = cleaned.replace(",", ".")
-        elif cleaned.count(",") > 1 and cleaned.count(".") == 0:
-            cleaned = cleaned.replace(".", "").replace(",", ".")
-        
-        return float(cleaned)
-    except:
-        return 0.0
-
-
-def calcular_data_d3(data_vigencia: date, hoje: date):
-    """
-    Calcula a data de D+3 (3 dias após o vencimento do mês corrente).
-    """
-    if not data_vigencia:
-        return hoje, False
-
-    dia_vencimento = data_vigencia.day
-    
-    # Calcula vencimento do mês atual
-    try:
-        vencimento_mes_atual = data_vigencia.replace(
-            year=hoje.year, 
-            month=hoje.month
-        )
-    except ValueError:
-        # Trata casos onde o dia não existe no mês atual
-        if hoje.month == 2:
-            try:
-                vencimento_mes_atual = date(hoje.year, 2, 29)
-            except ValueError:
-                vencimento_mes_atual = date(hoje.year, 2, 28)
-        elif hoje.month in [4, 6, 9, 11] and dia_vencimento == 31:
-            vencimento_mes_atual = date(hoje.year, hoje.month, 30)
-        else:
-            vencimento_mes_atual = date(hoje.year, hoje.month, dia_vencimento)
-
-    data_d3_atual = vencimento_mes_atual + timedelta(days=DIAS_D3)
-    # log_debug(f"Calculando D+3. Vigência: {data_vigencia}, Hoje: {hoje}. Vencimento Mês Atual: {vencimento_mes_atual}, D+3 Atual: {data_d3_atual}")
-    
-    # CORREÇÃO CRÍTICA: Para vigências de fim de mês (28-31)
-    if dia_vencimento >= 28:
-        # Calcula mês anterior
-        if hoje.month == 1:
-            mes_anterior = 12
-            ano_anterior = hoje.year - 1
-        else:
-            mes_anterior = hoje.month - 1
-            ano_anterior = hoje.year
-        
-        # Calcula vencimento do mês anterior
-        try:
-            vencimento_mes_anterior = date(ano_anterior, mes_anterior, dia_vencimento)
-        except ValueError:
-            if mes_anterior == 2:
-                try:
-                    vencimento_mes_anterior = date(ano_anterior, 2, 29)
-                except ValueError:
-                    vencimento_mes_anterior = date(ano_anterior, 2, 28)
-            elif mes_anterior in [4, 6, 9, 11] and dia_vencimento == 31:
-                vencimento_mes_anterior = date(ano_anterior, mes_anterior, 30)
-            else:
-                vencimento_mes_anterior = date(ano_anterior, mes_anterior, dia_vencimento)
-        
-        data_d3_anterior = vencimento_mes_anterior + timedelta(days=DIAS_D3)
-        
-        if data_d3_anterior.month == hoje.month:
-            pode_checar = hoje >= data_d3_anterior
-            return data_d3_anterior, pode_checar
-    
-    if data_d3_atual.month != hoje.month:
-        dias_desde_vencimento = (hoje - vencimento_mes_atual).days
-        pode_checar = dias_desde_vencimento >= DIAS_D3
-    else:
-        pode_checar = hoje >= data_d3_atual
-    
-    return data_d3_atual, pode_checar
-
-
-def determinar_status_faturas(invoices, data_ref, data_vigencia=None, ja_passou_d3=False):
-    """Determina o status do contrato baseado nas faturas."""
-    # Verifica multa por rescisão contratual
-    for inv in invoices:
-        ciclo = inv.get("ciclo", "").lower()
-        if "multa por rescisão contratual" in ciclo:
-            log_debug(f"Multa rescisória encontrada na fatura ref {inv.get('referencia')}")
-            return "Cancelado por Inadimplência"
-    
-    # Verifica faturas vencidas não pagas
-    for inv in invoices:
-        vencimento = inv.get("vencimento")
-        pagamento = inv.get("pagamento")
-        if (vencimento and 
-            vencimento <= data_ref and 
-            (not pagamento or str(pagamento).strip() == "")):
-            log_debug(f"Fatura em atraso encontrada: Ref {inv.get('referencia')}, Venc {vencimento}, Valor {inv.get('valor')}")
-            return "Em atraso"
-    
-    # Se já passou D+3, verifica se mensalidade do mês vigente está paga
-    if ja_passou_d3 and data_vigencia:
-        mes_ref = data_ref.month
-        ano_ref = data_ref.year
-        
-        for inv in invoices:
-            referencia = inv.get("referencia", "")
-            if referencia:
-                try:
-                    partes = referencia.split("/")
-                    if len(partes) >= 2:
-                        mes_fatura = int(partes[0])
-                        ano_fatura = int(partes[1])
-                        
-                        if mes_fatura == mes_ref and ano_fatura == ano_ref:
-                            if inv.get("pagamento") and str(inv.get("pagamento", "")).strip():
-                                log_debug(f"Pagamento do mês vigente ({mes_ref}/{ano_ref}) confirmado.")
-                                return "Pago"
-                except:
-                    pass
-    
-    return "Em dia"
+# Conversão das faturas, D+3 e regras de status ficam em scripts/faturas.py
+# (sem Selenium), compartilhadas com a consulta via HTTP e os scripts de teste.
+from scripts.faturas import (
+    log_debug, faturas_de_celulas, analisar_faturas,
+    STATUS_ATIVOS, STATUS_ATRASO, STATUS_MORTO, STATUS_AGENDADOS, calcular_proxima_checagem,
+    calcular_proximas_checagens, agenda_para_gravar, normalizar_faturas, hash_faturas, contexto_analise,
+    DIAS_ATRASO_PARA_MORTO, status_com_regra_morto
+)
+from scripts.portal_http import ClienteFaturasHttp, FalhaConsultaHttp, ID_TABELA_FATURAS, JS_LINHAS_TABELA
+from scripts.metricas_bot import etapas, ExportadorMetricas
+from scripts.prioridade import pontuar
+from scripts.buffer_escrita import BufferEscrita, STATUS_ACAO_ROBO
+from scripts.diario_ciclo import DiarioCiclo
+from scripts.controle_portal import ControlePortal, espera_exponencial
+from scripts.fabrica_driver import FabricaDriver
+from scripts.agendador import Agendador
+
+fabrica_driver = FabricaDriver(CACHE_CHROMEDRIVER, headless=HEADLESS, pasta_perfis=PASTA_PERFIS_CHROME,
+                               reserva=DRIVER_RESERVA)
+exportador_metricas = ExportadorMetricas(etapas, ARQUIVO_METRICAS, INTERVALO_METRICAS, PORTA_METRICAS)
+_primeira_consulta = threading.Event()
+
+
+def registrar_primeira_consulta():
+    """Loga uma vez por processo quanto tempo o robô levou do início até a primeira consulta concluída."""
+    if _primeira_consulta.is_set():
+        return
+    _primeira_consulta.set()
+    segundos = time.monotonic() - INICIO_PROCESSO
+    etapas.definir("inicio_ate_primeira_consulta_s", round(segundos, 1))
+    logging.info(f"⏱️ Primeira consulta concluída {segundos:.1f}s após o início do robô.")
 
 
 def watchdog_timeout():
@@ -285,43 +208,46 @@ class AutomacaoBree:
     - Resiliência de Rede e Watchdog inteligente
     """
     
-    def __init__(self):
+    def __init__(self, nome="principal", ao_progredir=None, buffer=None, controle=None):
         """Inicializa o driver Selenium e configurações."""
+        self.nome = nome
         self.driver = None
         self.wait = None
         self.sisamil_handle = None
+        # Idade da sessão do portal e última vez que ela respondeu (time.monotonic)
+        self.login_em = None
+        self.confirmada_em = 0.0
+        # Login antecipado em outro Chrome: (driver, wait, janela) quando pronto
+        self._renovacao = None
+        self._sessao_nova = None
         
         # Variáveis de controle de execução
         self.last_activity = time.time()
         self.running = True
         self.watchdog_thread = None
+        # Sessões extras repassam o heartbeat para a principal (vigiada pelo watchdog)
+        self.ao_progredir = ao_progredir
+        self.pool = None
+        self.http = ClienteFaturasHttp(pasta_gravacao=os.getenv("BOT_GRAVAR_RESPOSTAS") or None) if CONSULTA_HTTP else None
+        self.url_formulario = None
+        # Compartilhado entre as sessões do pool (a principal cria)
+        self.buffer = buffer or BufferEscrita(DIARIO_RESULTADOS, LOTE_ESCRITA, INTERVALO_ESCRITA)
+        self.diario_ciclo = DiarioCiclo(PASTA_DIARIO_CICLOS)
+        # Concorrência, espaçamento e disjuntor do portal (scripts/controle_portal.py), também compartilhado
+        self.controle = controle or ControlePortal(NUM_SESSOES, ao_esperar=self.update_heartbeat)
         
-        logging.info("Automação Bree inicializada com proteções ativas.")
+        logging.info(f"Automação Bree ({nome}) inicializada com proteções ativas.")
 
     def _init_driver(self):
-        """Inicializa ou reinicializa o driver do Chrome."""
+        """Inicializa ou reinicializa o driver do Chrome (scripts/fabrica_driver.py)."""
         try:
             # Se tiver driver antigo ou com sessao invalida, mata ele
             if self.driver:
-                try:
-                    self.driver.quit()
-                except:
-                    pass
+                fabrica_driver.descartar(self.driver)
             self.driver = None  # Garante limpeza da referencia
 
-            chrome_options = webdriver.ChromeOptions()
-            chrome_options.add_argument("--start-maximized")
-            chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            chrome_options.add_experimental_option("useAutomationExtension", False)
-            chrome_options.add_argument("--disable-gpu")
-            chrome_options.add_argument("--no-sandbox")
-            chrome_options.add_argument("--disable-dev-shm-usage")
-            
-            self.driver = webdriver.Chrome(
-                service=Service(ChromeDriverManager().install()), 
-                options=chrome_options
-            )
-            self.wait = WebDriverWait(self.driver, 30)
+            self.driver = fabrica_driver.obter()
+            self.wait = WebDriverWait(self.driver, TIMEOUT_ESPERA, poll_frequency=INTERVALO_POLLING)
             logging.info("Driver Chrome inicializado com sucesso.")
             
         except Exception as e:
@@ -344,6 +270,8 @@ class AutomacaoBree:
     def update_heartbeat(self):
         """Atualiza o sinal de vida do bot."""
         self.last_activity = time.time()
+        if self.ao_progredir:
+            self.ao_progredir()
 
     def watchdog_monitor(self):
         """Monitora se o bot travou (sem heartbeat por 5 min)."""
@@ -379,72 +307,194 @@ class AutomacaoBree:
         Realiza login com retry infinito.
         """
         tentativa = 0
-        backoff = 60
+        backoff = 15
         
         while True:
+            # Portal fora do ar: espera o disjuntor em vez de insistir no login
+            self.controle.aguardar_disjuntor()
+            inicio_login = time.perf_counter()
             try:
                 self.aguardar_internet()
+                inicio_login = time.perf_counter()
                 self._init_driver()
                 
                 logging.info(f"Iniciando tentativa de login #{tentativa + 1}...")
-                log_debug(f"Navegando para URL de login...")
-                self.driver.get("https://portalcorretor.amil.com.br/portal/web/servicos/usuario/corretor/login")
-                
-                log_debug("Preenchendo credenciais...")
-                self.wait.until(EC.presence_of_element_located((By.ID, "login"))).send_keys(AMIL_USER)
-                self.wait.until(EC.presence_of_element_located((By.ID, "senha"))).send_keys(AMIL_PASSWORD)
-                self.wait.until(EC.element_to_be_clickable((By.ID, "efetuarLogin"))).click()
-                
-                log_debug("Aguardando redirecionamento pós-login...")
-                self.wait.until(EC.url_changes("https://portalcorretor.amil.com.br/portal/web/servicos/usuario/corretor/login"))
-                time.sleep(3)
-                
-                if "login" in self.driver.current_url:
-                    raise Exception("Falha no login: Login/Senha incorretos ou erro no site.")
-
-                # Gestão Comercial
-                log_debug("Clicando em 'Gestão comercial'...")
-                botao_gc = self.wait.until(EC.element_to_be_clickable((By.LINK_TEXT, "Gestão comercial")))
-                self.driver.execute_script("arguments[0].click();", botao_gc)
-                
-                # Troca de aba
-                log_debug("Aguardando nova janela/aba...")
-                self.wait.until(EC.number_of_windows_to_be(2))
-                self.driver.switch_to.window(self.driver.window_handles[1])
-                self.sisamil_handle = self.driver.current_window_handle
-                log_debug(f"Janela trocada. Título: {self.driver.title}")
-                
-                # Validação final
-                self.wait.until(EC.presence_of_element_located((By.ID, "mostraMenu")))
+                self.sisamil_handle = self._entrar_no_sisamil(self.driver, self.wait)
                 
                 logging.info("SisAmil conectado com sucesso.")
-                self.update_heartbeat()
+                etapas.registrar("login", time.perf_counter() - inicio_login)
+                self._sessao_iniciada()
                 return
                 
             except InvalidSessionIdException:
                 logging.error("Sessão inválida detectada no login! Forçando reinício do driver...")
+                fabrica_driver.descartar(self.driver)
                 self.driver = None # Força recriação na proxima iteracao
                 tentativa += 1
                 time.sleep(5) # Espera curta para retry rapido
 
             except Exception as e:
                 logging.error(f"Erro no login: {e}", exc_info=True)
-                try:
-                    self.driver.quit()
-                except:
-                    pass
+                self.controle.observar(False, time.perf_counter() - inicio_login)
+                fabrica_driver.descartar(self.driver)
+                self.driver = None
                 
                 tentativa += 1
-                tempo_espera = min(backoff * tentativa, 3600)
-                logging.info(f"Tentando novamente em {tempo_espera} segundos...")
+                tempo_espera = espera_exponencial(tentativa - 1, base=backoff, maximo=3600)
+                logging.info(f"Tentando novamente em {tempo_espera:.0f} segundos...")
                 time.sleep(tempo_espera)
 
+    def _entrar_no_sisamil(self, driver, wait):
+        """Login no portal e abertura do SisAmil num driver já aberto. Retorna a janela do SisAmil."""
+        log_debug(f"Navegando para URL de login...")
+        driver.get("https://portalcorretor.amil.com.br/portal/web/servicos/usuario/corretor/login")
+        
+        # Com perfil persistente (BOT_PERFIL_CHROME) os cookies podem manter a sessão do portal
+        wait.until(EC.any_of(
+            EC.presence_of_element_located((By.ID, "login")),
+            EC.element_to_be_clickable((By.LINK_TEXT, "Gestão comercial"))
+        ))
+        if driver.find_elements(By.ID, "login"):
+            log_debug("Preenchendo credenciais...")
+            wait.until(EC.presence_of_element_located((By.ID, "login"))).send_keys(AMIL_USER)
+            wait.until(EC.presence_of_element_located((By.ID, "senha"))).send_keys(AMIL_PASSWORD)
+            wait.until(EC.element_to_be_clickable((By.ID, "efetuarLogin"))).click()
+            
+            log_debug("Aguardando redirecionamento pós-login...")
+            wait.until(EC.url_changes("https://portalcorretor.amil.com.br/portal/web/servicos/usuario/corretor/login"))
+            time.sleep(3)
+            
+            if "login" in driver.current_url:
+                raise Exception("Falha no login: Login/Senha incorretos ou erro no site.")
+        else:
+            log_debug("Sessão do portal ainda ativa no perfil do Chrome. Pulando as credenciais.")
+
+        # Gestão Comercial
+        log_debug("Clicando em 'Gestão comercial'...")
+        botao_gc = wait.until(EC.element_to_be_clickable((By.LINK_TEXT, "Gestão comercial")))
+        driver.execute_script("arguments[0].click();", botao_gc)
+        
+        # Troca de aba
+        log_debug("Aguardando nova janela/aba...")
+        wait.until(EC.number_of_windows_to_be(2))
+        driver.switch_to.window(driver.window_handles[1])
+        log_debug(f"Janela trocada. Título: {driver.title}")
+        
+        # Validação final
+        wait.until(EC.presence_of_element_located((By.ID, "mostraMenu")))
+        return driver.current_window_handle
+
+    def _sessao_iniciada(self):
+        self.login_em = self.confirmada_em = time.monotonic()
+        self.url_formulario = None
+        if self.http:
+            self.http.invalidar()  # cookies novos: ressincroniza na próxima consulta pelo navegador
+        self.update_heartbeat()
+
+    # ========================================================================
+    # SAÚDE DA SESSÃO
+    # ========================================================================
+
+    def idade_sessao(self):
+        return time.monotonic() - self.login_em if self.login_em is not None else float("inf")
+
+    def sessao_viva(self):
+        """
+        Sonda barata (um execute_script, sem carregar página): a janela do
+        SisAmil existe, não caiu na tela de login e ainda tem o `mostraMenu`.
+        """
+        if self.driver is None or self.sisamil_handle is None:
+            return False
+        try:
+            with etapas.medir("sonda"):
+                if self.driver.current_window_handle != self.sisamil_handle:
+                    self.driver.switch_to.window(self.sisamil_handle)
+                self.driver.switch_to.default_content()
+                viva = bool(self.driver.execute_script(
+                    "return !!document.getElementById('mostraMenu') && document.location.href.indexOf('/login') < 0;"
+                ))
+        except (WebDriverException, UnexpectedAlertPresentException):
+            viva = False
+        if viva:
+            self.confirmada_em = time.monotonic()
+        return viva
+
+    def garantir_sessao(self):
+        """
+        Antes de cada contrato: adota a sessão renovada em segundo plano se já
+        estiver pronta, começa a renovação perto da idade máxima, reloga na hora
+        se a sessão passou dela e sonda a sessão que não conclui uma consulta há
+        INTERVALO_SONDA segundos (início de ciclo, depois de erros).
+        """
+        if self._sessao_nova is not None:
+            self._adotar_sessao_nova()
+        idade = self.idade_sessao()
+        if self.driver is None:
+            self.renovar_sessao()
+            return
+        if idade >= IDADE_MAXIMA_SESSAO:
+            logging.info(f"Sessão {self.nome} com {idade / 60:.0f} min: relogando antes de expirar.")
+            self.renovar_sessao()
+            return
+        if idade >= IDADE_MAXIMA_SESSAO * FRACAO_RENOVACAO:
+            self._renovar_em_segundo_plano()
+        if time.monotonic() - self.confirmada_em >= INTERVALO_SONDA and not self.sessao_viva():
+            logging.warning(f"Sessão {self.nome} do portal caiu (sonda). Relogando antes do próximo contrato.")
+            etapas.contar("sessao_caiu")
+            self.renovar_sessao()
+
+    def renovar_sessao(self):
+        """Nova sessão agora: a do login em segundo plano, se houver um em andamento, senão um login normal."""
+        if self._renovacao is not None and self._renovacao.is_alive():
+            self._renovacao.join(timeout=TIMEOUT_ESPERA * 4)
+        if self._sessao_nova is not None:
+            self._adotar_sessao_nova()
+            return
+        self.login_e_navegar_sisamil()
+
+    def _renovar_em_segundo_plano(self):
+        if self._sessao_nova is not None or (self._renovacao is not None and self._renovacao.is_alive()):
+            return
+        self._renovacao = threading.Thread(target=self._logar_em_segundo_plano, name=f"{self.nome}-relogin", daemon=True)
+        self._renovacao.start()
+
+    def _logar_em_segundo_plano(self):
+        """Login num Chrome à parte enquanto a sessão atual termina o contrato em andamento."""
+        driver = None
+        try:
+            inicio = time.perf_counter()
+            driver = fabrica_driver.obter()
+            wait = WebDriverWait(driver, TIMEOUT_ESPERA, poll_frequency=INTERVALO_POLLING)
+            janela = self._entrar_no_sisamil(driver, wait)
+            etapas.registrar("login", time.perf_counter() - inicio)
+            self._sessao_nova = (driver, wait, janela)
+        except Exception as e:
+            logging.warning(f"Login antecipado da sessão {self.nome} falhou ({e}). Fica para o login normal.")
+            fabrica_driver.descartar(driver)
+
+    def _adotar_sessao_nova(self):
+        (driver, wait, janela), self._sessao_nova = self._sessao_nova, None
+        fabrica_driver.descartar(self.driver)
+        self.driver, self.wait, self.sisamil_handle = driver, wait, janela
+        self._sessao_iniciada()
+        etapas.contar("relogin_antecipado")
+        logging.info(f"Sessão {self.nome} trocada pela sessão nova logada em segundo plano.")
+
+    def descartar_renovacao(self):
+        if self._renovacao is not None:
+            self._renovacao.join(timeout=TIMEOUT_ESPERA * 4)
+        if self._sessao_nova is not None:
+            fabrica_driver.descartar(self._sessao_nova[0])
+            self._sessao_nova = None
+
     def reset_para_proxima_consulta(self):
         """Reseta a tela do SisAmil."""
         try:
             self.update_heartbeat()
-            self.driver.get("https://portalcorretor.amil.com.br/portal/web/servicos/usuario/sisamil/acesso/token?uri=/corporativo/ace/token.asp")
-            time.sleep(1.5)
+            with etapas.medir("reset"):
+                self.driver.get("https://portalcorretor.amil.com.br/portal/web/servicos/usuario/sisamil/acesso/token?uri=/corporativo/ace/token.asp")
+                self.driver.switch_to.default_content()
+                self.wait.until(EC.presence_of_element_located((By.ID, "mostraMenu")))
         except Exception as e:
             logging.error(f"Erro ao resetar tela: {e}")
             raise
@@ -457,10 +507,9 @@ class AutomacaoBree:
         try:
             self.driver.switch_to.default_content()
             self.wait.until(EC.element_to_be_clickable((By.ID, "mostraMenu"))).click()
-            time.sleep(1)
             
             self.driver.switch_to.default_content()
-            self.driver.switch_to.frame("menu")
+            self.wait.until(EC.frame_to_be_available_and_switch_to_it("menu"))
             
             log_debug("Navegando no Menu: Portal Cliente Empresa...")
             self.driver.execute_script("arguments[0].click();", self.wait.until(EC.element_to_be_clickable((By.LINK_TEXT, "Portal Cliente Empresa"))))
@@ -472,119 +521,158 @@ class AutomacaoBree:
             logging.error(f"Erro navegação menu: {e}")
             raise
 
+    def _no_formulario(self):
+        """True se o frame `principal` já está no formulário de consulta (deixa o driver nele)."""
+        try:
+            self.driver.switch_to.default_content()
+            self.driver.switch_to.frame("principal")
+            return bool(self.driver.find_elements(By.ID, "num_contrato"))
+        except (NoSuchFrameException, UnexpectedAlertPresentException):
+            return False
+
+    def abrir_formulario_consulta(self):
+        """
+        Deixa o driver no frame `principal` com o formulário de consulta pelo
+        caminho mais curto: já está nele (após "nenhum registro" o portal volta
+        sozinho), recarrega no frame a URL do formulário (após uma tabela de
+        faturas) ou, se o estado não bate com nenhum dos dois, navega pelo menu.
+        """
+        if self._no_formulario():
+            etapas.contar(NAV_FORMULARIO)
+            return NAV_FORMULARIO
+
+        if self.url_formulario:
+            try:
+                self.driver.execute_script("window.location.replace(arguments[0]);", self.url_formulario)
+                WebDriverWait(self.driver, 10, poll_frequency=INTERVALO_POLLING).until(
+                    EC.presence_of_element_located((By.ID, "num_contrato"))
+                )
+                etapas.contar(NAV_RETORNO)
+                return NAV_RETORNO
+            except (TimeoutException, WebDriverException) as e:
+                log_debug(f"Formulário não abriu pela URL ({e.__class__.__name__}). Usando o menu.")
+                self.url_formulario = None
+
+        self.navegar_para_consultar_faturas()
+        self.driver.switch_to.default_content()
+        self.wait.until(EC.frame_to_be_available_and_switch_to_it("principal"))
+        self.wait.until(EC.presence_of_element_located((By.ID, "num_contrato")))
+        self.url_formulario = self.driver.execute_script("return document.location.href;")
+        etapas.contar(NAV_MENU)
+        return NAV_MENU
+
+    def _pagina_pronta(self, driver):
+        """Documento carregado e sem requisições jQuery pendentes (handlers do 'change')."""
+        return driver.execute_script(
+            "return document.readyState === 'complete' && (!window.jQuery || window.jQuery.active === 0);"
+        )
+
+    def _resultado_consulta(self, driver):
+        """
+        Condição de espera após enviar a consulta. Retorna ("alerta", texto),
+        ("tabela", None) ou ("nenhum", None); False enquanto nada apareceu.
+        """
+        try:
+            alert = driver.switch_to.alert
+            texto = alert.text
+            alert.accept()
+            return ("alerta", texto)
+        except NoAlertPresentException:
+            pass
+        try:
+            driver.switch_to.default_content()
+            driver.switch_to.frame("principal")
+            if driver.find_elements(By.ID, "tbemitida_1"):
+                return ("tabela", None)
+            texto = driver.execute_script("return document.body ? document.body.textContent : '';") or ""
+            if "nenhum registro" in texto.lower():
+                return ("nenhum", None)
+        except UnexpectedAlertPresentException as e:
+            # Alerta surgiu durante a troca de frame (o Chrome já o descartou)
+            return ("alerta", e.alert_text or "")
+        return False
+
+    def aguardar_resultado_consulta(self):
+        espera = WebDriverWait(
+            self.driver, TIMEOUT_ESPERA, poll_frequency=INTERVALO_POLLING,
+            ignored_exceptions=(NoSuchFrameException, StaleElementReferenceException)
+        )
+        return espera.until(self._resultado_consulta, message="Resultado da consulta não apareceu")
+
     def extrair_faturas(self):
+        """Faturas da tabela tbemitida_1 lidas numa única chamada ao navegador."""
         try:
-            tabela = self.driver.find_element(By.ID, "tbemitida_1")
-            linhas = tabela.find_elements(By.TAG_NAME, "tr")[1:]
-            faturas = []
-            
-            for linha in linhas:
-                cells = linha.find_elements(By.TAG_NAME, "td")
-                if len(cells) < 7: continue
-                
-                faturas.append({
-                    "ciclo": cells[1].get_attribute("textContent").strip().lower(),
-                    "referencia": cells[2].get_attribute("textContent").strip(),
-                    "vencimento": parse_date(cells[3].get_attribute("textContent").replace("\xa0", "").strip()),
-                    "pagamento": parse_date(cells[4].get_attribute("textContent").replace("\xa0", "").strip()),
-                    "valor": parse_float(cells[5].get_attribute("textContent").strip().replace("R$", "")),
-                    "dias_atraso": int(cells[6].get_attribute("textContent").strip()) if cells[6].get_attribute("textContent").strip().isdigit() else 0,
-                })
+            linhas = self.driver.execute_script(JS_LINHAS_TABELA, ID_TABELA_FATURAS)
+            if linhas is None:
+                return []
+            faturas = faturas_de_celulas(linhas[1:])
             log_debug(f"Extraídas {len(faturas)} faturas da tabela.")
             return faturas
         except Exception:
             return []
 
     def consultar_faturas(self, contrato: str, data_checagem: date, data_vigencia: date = None):
+        return analisar_faturas(self.obter_faturas(contrato, data_checagem), data_checagem, data_vigencia)
+
+    def obter_faturas(self, contrato: str, data_checagem: date):
+        """Faturas do contrato no portal ([] quando não há registro)."""
         try:
             self.update_heartbeat()
-            self.navegar_para_consultar_faturas()
-            
-            self.driver.switch_to.default_content()
-            self.driver.switch_to.frame("principal")
-            
-            log_debug(f"Consultando contrato: {contrato}")
-            campo_contrato = self.wait.until(EC.presence_of_element_located((By.ID, "num_contrato")))
             contrato_str = str(contrato).strip()
+
+            # Caminho rápido: formulário enviado direto via HTTP
+            if self.http is not None and self.http.pronto:
+                try:
+                    with etapas.medir("http"):
+                        invoices = self.http.consultar(contrato_str, data_checagem)
+                    log_debug(f"Contrato {contrato_str} consultado via HTTP ({len(invoices)} faturas).")
+                    return invoices
+                except FalhaConsultaHttp as e:
+                    logging.warning(f"Consulta HTTP falhou para {contrato_str} ({e}). Usando o navegador.")
+
+            with etapas.medir("navegacao"):
+                self.abrir_formulario_consulta()
             
-            # Preenchimento robusto via JS
-            self.driver.execute_script('''
-                arguments[0].value = arguments[1];
-                arguments[0].dispatchEvent(new Event('change', { bubbles: true }));
-            ''', campo_contrato, contrato_str)
-            time.sleep(0.5)
-            
-            self.wait.until(EC.presence_of_element_located((By.ID, "dt_ini_ref"))).send_keys("01/2000")
-            self.wait.until(EC.presence_of_element_located((By.ID, "dt_fim_ref"))).send_keys(data_checagem.strftime("%m/%Y"))
+            with etapas.medir("formulario"):
+                log_debug(f"Consultando contrato: {contrato}")
+                campo_contrato = self.wait.until(EC.presence_of_element_located((By.ID, "num_contrato")))
+                if self.http is not None and not self.http.pronto and not self.http.desativado:
+                    self.http.sincronizar(self.driver)
+                
+                # Preenchimento robusto via JS (sobrescreve o contrato anterior)
+                self.driver.execute_script('''
+                    arguments[0].value = arguments[1];
+                    arguments[0].dispatchEvent(new Event('change', { bubbles: true }));
+                ''', campo_contrato, contrato_str)
+                self.wait.until(self._pagina_pronta)
+                
+                for id_campo, valor in (("dt_ini_ref", "01/2000"), ("dt_fim_ref", data_checagem.strftime("%m/%Y"))):
+                    campo = self.wait.until(EC.presence_of_element_located((By.ID, id_campo)))
+                    campo.clear()
+                    campo.send_keys(valor)
             
-            self.driver.switch_to.default_content()
-            self.driver.switch_to.frame("toolbar")
-            self.wait.until(EC.element_to_be_clickable((By.ID, "btn_acao_continuar"))).click()
-            time.sleep(3)
+            with etapas.medir("envio"):
+                self.driver.switch_to.default_content()
+                self.driver.switch_to.frame("toolbar")
+                self.wait.until(EC.element_to_be_clickable((By.ID, "btn_acao_continuar"))).click()
+                # Espera o que vier primeiro: alerta, tabela de faturas ou "nenhum registro"
+                resultado, texto_alerta = self.aguardar_resultado_consulta()
             
             # Tratamento de Alertas
-            try:
-                alert = self.driver.switch_to.alert
-                text = alert.text
-                alert.accept()
-                if "nenhum registro" in text.lower():
+            if resultado == "alerta":
+                if "nenhum registro" in texto_alerta.lower():
                     # Contrato existe mas sem faturas -> Em dia
                     log_debug("Alerta Amil: Nenhum registro encontrado. Considerando 'Em dia'.")
-                    return {"valor_parcela": 0.0, "parcelas": 0, "status": "Em dia", "mes_cancelamento": None, "dias_atraso": 0}
-                log_debug(f"Alerta Amil inesperado: {text}")
-                raise Exception(f"Alert: {text}")
-            except Exception as e:
-                if "Alert" in str(e): raise
-            
-            self.driver.switch_to.default_content()
-            self.driver.switch_to.frame("principal")
-            invoices = self.extrair_faturas()
-            
-            # Lógica de Status
-            log_debug("Iniciando análise de status das faturas extraídas...")
-            has_multa = any("multa por rescisão" in i["ciclo"] for i in invoices)
-            mens_invoices = [i for i in invoices if "multa por rescisão" not in i["ciclo"]]
-            _, pode_checar_d3 = calcular_data_d3(data_vigencia, data_checagem) if data_vigencia else (None, False)
+                    return []
+                log_debug(f"Alerta Amil inesperado: {texto_alerta}")
+                raise Exception(f"Alert: {texto_alerta}")
+            if resultado == "nenhum":
+                log_debug("Página Amil: Nenhum registro encontrado. Considerando 'Em dia'.")
+                return []
             
-            if has_multa:
-                status = "Cancelado por Inadimplência"
-                multa = next((i for i in invoices if "multa por rescisão" in i["ciclo"]), None)
-                mes_cancelamento = multa["referencia"] if multa else None
-                dias_atraso = 0
-                parcelas = 0
-                valor_parcela = 0.0
-                log_debug(f"Status definido: {status} (Multa encontrada em {mes_cancelamento})")
-            else:
-                status = determinar_status_faturas(invoices, data_checagem, data_vigencia, pode_checar_d3)
-                mes_cancelamento = None
-                
-                if status == "Em atraso":
-                     overdue = [i for i in mens_invoices if not i["pagamento"] and i["vencimento"] and i["vencimento"] <= data_checagem]
-                     if overdue:
-                         first = sorted(overdue, key=lambda x: x["vencimento"])[0]
-                         try: parcelas = sorted(mens_invoices, key=lambda x: x["vencimento"]).index(first) + 1
-                         except: parcelas = 1
-                         valor_parcela = first["valor"]
-                         dias_atraso = first["dias_atraso"]
-                         log_debug(f"Status: Em atraso. Fatura mais antiga: {first['vencimento']}, Dias atraso: {dias_atraso}")
-                     else:
-                         parcelas = 0
-                         valor_parcela = 0.0
-                         dias_atraso = 0
-                         log_debug("Status: Em atraso, mas não encontrei a fatura exata na lista filtrada. Zerando métricas.")
-                else:
-                    parcelas = 0
-                    valor_parcela = 0.0
-                    dias_atraso = 0
-                    log_debug(f"Status definido: {status}")
-            
-            return {
-                "valor_parcela": valor_parcela,
-                "parcelas": parcelas,
-                "status": status,
-                "mes_cancelamento": mes_cancelamento,
-                "dias_atraso": dias_atraso
-            }
+            # aguardar_resultado_consulta deixa o driver no frame "principal"
+            with etapas.medir("extracao"):
+                return self.extrair_faturas()
             
         except Exception as e:
             logging.error(f"Erro consulta contrato {contrato}: {e}", exc_info=True)
@@ -594,146 +682,216 @@ class AutomacaoBree:
     # ATUALIZAÇÃO E EXECUÇÃO
     # ========================================================================
     
-    def _verificar_contrato_safe(self, contrato, hoje, tipo="", max_retries=2):
-        """Wrapper com retry local."""
+    def _verificar_contrato_safe(self, contrato, hoje, tipo="", max_retries=2, anterior=None):
+        """
+        Wrapper com retry local. Cada tentativa alimenta o controle do portal;
+        entre tentativas, espera exponencial com jitter (e o disjuntor, se abriu).
+        """
         for i in range(max_retries + 1):
+            inicio = time.monotonic()
             try:
-                return self._verificar_contrato_impl(contrato, hoje, tipo)
+                resultado = self._verificar_contrato_impl(contrato, hoje, tipo, anterior)
+                if resultado:
+                    self.controle.observar(True, time.monotonic() - inicio)
+                    self.confirmada_em = time.monotonic()
+                    registrar_primeira_consulta()
+                return resultado
             except InvalidSessionIdException:
+                self.controle.observar(False, time.monotonic() - inicio)
                 logging.error(f"Sessão morreu durante contrato {contrato.contrato}. Resetando driver.")
+                fabrica_driver.descartar(self.driver)
                 self.driver = None
-                try: self.login_e_navegar_sisamil()
+                try: self.renovar_sessao()
                 except: pass
             except Exception as e:
+                self.controle.observar(False, time.monotonic() - inicio)
                 logging.warning(f"Erro contrato {contrato.contrato} (Tentativa {i+1}): {e}")
                 if i < max_retries:
-                    try: self.reset_para_proxima_consulta()
+                    time.sleep(espera_exponencial(i))
+                    self.controle.aguardar_disjuntor()
+                    try:
+                        # Sessão expirada: reloga em vez de gastar as tentativas restantes nela
+                        if self.sessao_viva():
+                            self.reset_para_proxima_consulta()
+                        else:
+                            etapas.contar("sessao_caiu")
+                            self.renovar_sessao()
                     except: pass
                 else:
                     return False
 
-    def _verificar_contrato_impl(self, contrato, hoje, tipo=""):
+    def _verificar_contrato_impl(self, contrato, hoje, tipo="", anterior=None):
+        """
+        `anterior`: último snapshot das faturas do contrato (id, hash, contexto,
+        status). Se as faturas e o contexto da análise não mudaram, o status
+        também não muda: só a data de checagem avança.
+        """
         contrato_bruto = re.sub(r"\D", "", (contrato.contrato or ""))
         if not contrato_bruto: return False
         
         logging.info(f"[{tipo}] Verificando {contrato.contrato}...")
-        res = self.consultar_faturas(contrato_bruto, hoje, contrato.data_vigencia)
+        with etapas.medir("consulta"):
+            invoices = self.obter_faturas(contrato_bruto, hoje)
         
-        contrato.status = res["status"]
-        contrato.valor_parcela = res["valor_parcela"]
-        contrato.parcela_atual = res["parcelas"]
-        contrato.dias_atraso = res["dias_atraso"]
-        contrato.data_checagem = hoje
+        normalizadas = normalizar_faturas(invoices)
+        hash_atual = hash_faturas(normalizadas)
+        contexto = contexto_analise(invoices, hoje, contrato.data_vigencia)
+        mesmas_faturas = anterior is not None and anterior.hash == hash_atual
+        
+        if mesmas_faturas and anterior.contexto == contexto and anterior.status == contrato.status:
+            log_debug(f"Faturas de {contrato.contrato} sem mudança desde a última checagem. Status mantido.")
+            etapas.contar("faturas_iguais")
+            campos = {
+                "data_checagem": hoje,
+                "proxima_checagem": agenda_para_gravar(
+                    calcular_proxima_checagem(contrato.status, contrato.data_vigencia, hoje, hoje)
+                ),
+            }
+            snapshot = {"id": anterior.id, "ultima_checagem": hoje, "contexto": contexto, "status": contrato.status}
+            with etapas.medir("banco"):
+                self.buffer.registrar(contrato.id, campos, snapshot=snapshot)
+            return True
         
+        with etapas.medir("analise"):
+            res = analisar_faturas(invoices, hoje, contrato.data_vigencia)
+        
+        status = status_com_regra_morto(res["status"], res["dias_atraso"])
+        mes_cancelamento = None
         if res["mes_cancelamento"]:
-            try: contrato.mes_cancelamento = datetime.strptime(res["mes_cancelamento"], "%m/%Y").date().replace(day=1)
-            except: pass
-        else:
-            contrato.mes_cancelamento = None
-            
-        if contrato.status == "Em atraso" and contrato.dias_atraso >= DIAS_ATRASO_PARA_MORTO:
-            log_debug(f"Contrato {contrato.contrato} declarado MORTO (Atraso {contrato.dias_atraso} >= {DIAS_ATRASO_PARA_MORTO})")
-            contrato.status = "Cliente Morto"
+            try: mes_cancelamento = datetime.strptime(res["mes_cancelamento"], "%m/%Y").date().replace(day=1)
+            except: mes_cancelamento = contrato.mes_cancelamento
             
-        db.session.commit()
+        if status != res["status"]:
+            log_debug(f"Contrato {contrato.contrato} declarado MORTO (Atraso {res['dias_atraso']} >= {DIAS_ATRASO_PARA_MORTO})")
+        
+        campos = {
+            "status": status,
+            "valor_parcela": res["valor_parcela"],
+            "parcela_atual": res["parcelas"],
+            "dias_atraso": res["dias_atraso"],
+            "data_checagem": hoje,
+            "mes_cancelamento": mes_cancelamento,
+            "proxima_checagem": agenda_para_gravar(calcular_proxima_checagem(status, contrato.data_vigencia, hoje, hoje)),
+        }
+        acao = self._nova_acao(contrato, res) if res["status"] == "Em atraso" else None
+        if mesmas_faturas:
+            snapshot = {"id": anterior.id, "ultima_checagem": hoje, "contexto": contexto, "status": status}
+        else:
+            snapshot = {
+                "contrato_id": contrato.id, "primeira_checagem": hoje, "ultima_checagem": hoje,
+                "hash": hash_atual, "contexto": contexto, "status": status,
+                "quantidade": len(normalizadas), "faturas": normalizadas,
+            }
         
-        if res["status"] == "Em atraso":
-            self._criar_acao(contrato)
+        # Gravação em lote (scripts/buffer_escrita.py): anota no diário e grava a cada N contratos/T segundos
+        with etapas.medir("banco"):
+            self.buffer.registrar(contrato.id, campos, acao, snapshot)
             
-        self.reset_para_proxima_consulta()
+        # Sem reset: a próxima consulta reaproveita o formulário (abrir_formulario_consulta)
         return True
 
-    def _criar_acao(self, contrato):
-        try:
-            if not AcaoCobranca.query.filter_by(contrato_id=contrato.id, dia_atraso=contrato.dias_atraso).first():
-                db.session.add(AcaoCobranca(
-                    contrato_id=contrato.id, tipo="SMS", 
-                    mensagem=f"Cobrança {contrato.contrato} atraso {contrato.dias_atraso}d",
-                    parcela=contrato.parcela_atual, dia_atraso=contrato.dias_atraso,
-                    enviada_em=datetime.now(pytz.timezone("America/Sao_Paulo")),
-                    status_envio="Enviado"
-                ))
-                db.session.commit()
-        except: pass
-
-    def atualizar_banco(self):
+    def _nova_acao(self, contrato, res):
+        """Ação de cobrança da automação; o buffer só insere se ainda não houver uma para o mesmo dia de atraso."""
+        return {
+            "contrato_id": contrato.id,
+            "tipo": "SMS",
+            "mensagem": f"Cobrança {contrato.contrato} atraso {res['dias_atraso']}d",
+            "parcela": res["parcelas"],
+            "dia_atraso": res["dias_atraso"],
+            "enviada_em": datetime.now(pytz.timezone("America/Sao_Paulo")).replace(tzinfo=None),
+            "status_envio": STATUS_ACAO_ROBO,
+        }
+
+    def atualizar_banco(self, prazo=None):
+        """
+        Levanta os contratos a verificar e processa do mais prioritário para o
+        menos. `prazo` (time.monotonic) encerra o ciclo antes de esvaziar a fila.
+        """
         with app.app_context():
             db.session.remove()
             hoje = datetime.now(pytz.timezone("America/Sao_Paulo")).date()
             
             # self._log_previsao(hoje) # Substituído por log detalhado abaixo
             
-            logging.info("🔎 Levantando contratos para verificação...")
+            # Resultados de uma execução interrompida entram antes da seleção
+            self.buffer.recuperar()
+            
+            # Ciclo interrompido hoje (watchdog, queda): continua a fila planejada
+            fila = self.diario_ciclo.retomar(hoje)
+            if fila:
+                logging.info(f"♻️ Retomando o ciclo interrompido: {len(fila)} contratos restantes da fila planejada.")
+                db.session.remove()
+                self._processar_fila(fila, hoje, prazo)
+                return
             
-            # 1. EM ATRASO
-            candidatos_atraso = Contrato.query.filter(Contrato.status == "Em atraso", Contrato.data_checagem != hoje).all()
+            logging.info("🔎 Levantando contratos para verificação...")
             
-            # 2. ATIVOS (D+3)
-            # Filtra em memória (lógica python de D+3)
-            raw_ativos = Contrato.query.filter(Contrato.status.in_(["Em dia", "Pago"])).all()
-            candidatos_ativos = []
-            for c in raw_ativos:
-                d3, pode = calcular_data_d3(c.data_vigencia, hoje)
-                if pode and (not c.data_checagem or c.data_checagem < d3):
-                    candidatos_ativos.append(c)
+            # Agenda vencida: busca por intervalo no índice de proxima_checagem
+            # (atraso no dia seguinte, ativos no D+3, mortos a cada 15 dias)
+            candidatos = Contrato.query.filter(
+                Contrato.status.in_(STATUS_AGENDADOS),
+                Contrato.proxima_checagem <= hoje
+            ).all()
             
-            # 3. MORTOS (15d)
-            raw_mortos = Contrato.query.filter(Contrato.status == "Cliente Morto").all()
-            candidatos_mortos = [c for c in raw_mortos if self._deve_checar_espacado(c, hoje)]
+            # Agenda a calcular: contratos novos ou alterados fora do robô (os que não
+            # entram na fila recebem FORA_DA_AGENDA e não voltam a ser recalculados)
+            pendentes = Contrato.query.filter(
+                Contrato.status.in_(STATUS_AGENDADOS),
+                Contrato.proxima_checagem.is_(None)
+            ).all()
+            proximas = calcular_proximas_checagens(
+                [c.status for c in pendentes], [c.data_vigencia for c in pendentes],
+                [c.data_checagem for c in pendentes], hoje
+            )
+            for c, proxima in zip(pendentes, proximas):
+                c.proxima_checagem = agenda_para_gravar(proxima)
+                if proxima and proxima <= hoje:
+                    candidatos.append(c)
             
-            total_previsao = len(candidatos_atraso) + len(candidatos_ativos) + len(candidatos_mortos)
+            candidatos_atraso = [c for c in candidatos if c.status == STATUS_ATRASO]
+            candidatos_ativos = [c for c in candidatos if c.status in STATUS_ATIVOS]
+            candidatos_mortos = [c for c in candidatos if c.status == STATUS_MORTO]
+            total_previsao = len(candidatos)
             
             logging.info("="*50)
             logging.info(f"📊 PREVISÃO DE EXECUÇÃO: {total_previsao} contratos na fila.")
             logging.info(f"   ➤ Atrasados: {len(candidatos_atraso)}")
             logging.info(f"   ➤ Ativos (D+3): {len(candidatos_ativos)}")
             logging.info(f"   ➤ Mortos (15d): {len(candidatos_mortos)}")
+            if pendentes:
+                logging.info(f"   ➤ Agenda recalculada: {len(pendentes)} contratos")
             logging.info("="*50)
             
             if total_previsao == 0:
-                self._dormir(hoje)
+                db.session.commit()
                 return
 
-            c = 0
-            
-            # PROCESSAMENTO
-            for contrato in candidatos_atraso:
-                self.update_heartbeat()
-                if self._verificar_contrato_safe(contrato, hoje, "ATRASO"): c += 1
-            
-            for contrato in candidatos_ativos:
-                self.update_heartbeat()
-                if self._verificar_contrato_safe(contrato, hoje, "ATIVO"): c += 1
-            
-            for contrato in candidatos_mortos:
-                self.update_heartbeat()
-                if self._verificar_contrato_safe(contrato, hoje, "MORTO"): c += 1
+            # PROCESSAMENTO por prioridade (scripts/prioridade.py)
+            fila = [(pontuar(c, tipo, hoje), c.id, tipo)
+                    for tipo, candidatos in (("ATRASO", candidatos_atraso), ("ATIVO", candidatos_ativos),
+                                             ("MORTO", candidatos_mortos))
+                    for c in candidatos]
+            db.session.commit()
+            db.session.remove()
 
-            logging.info(f"Ciclo concluído. {c} contratos verificados com sucesso.")
+            self.diario_ciclo.iniciar(hoje, fila)
+            self._processar_fila(fila, hoje, prazo)
 
-    def _deve_checar_espacado(self, contrato, hoje):
-        """Helper para checar a cada 15 dias."""
-        if not contrato.data_checagem: return True
-        return (hoje - contrato.data_checagem).days >= 15
+    def _processar_fila(self, fila, hoje, prazo=None):
+        if self.pool is None:
+            self.pool = PoolSessoes(self, NUM_SESSOES)
+        self.pool.processar(fila, hoje, prazo, diario=self.diario_ciclo)
 
     def _log_previsao(self, hoje):
         # Log simplificado para cleaner code
         logging.info("Iniciando novo ciclo de verificação...")
 
-    def _dormir(self, hoje):
-        # Dorme até o dia seguinte
-        agora = datetime.now()
-        amanha = (agora + timedelta(days=1)).replace(hour=0, minute=5, second=0)
-        secs = (amanha - agora).total_seconds()
-        logging.info(f"Dormindo {secs}s até amanha...")
-        while secs > 0:
-            time.sleep(min(secs, 10))
-            secs -= 10
-            self.update_heartbeat()
-
     def run(self):
         self.watchdog_thread = threading.Thread(target=self.watchdog_monitor, daemon=True)
         self.watchdog_thread.start()
+        exportador_metricas.iniciar()
+        # Dorme até a próxima checagem vencida (scripts/agendador.py), com heartbeat
+        agendador = Agendador(ao_esperar=self.update_heartbeat, intervalo_despertar=INTERVALO_DESPERTAR)
         
         try:
             self.login_e_navegar_sisamil()
@@ -746,30 +904,219 @@ class AutomacaoBree:
                     try: self.login_e_navegar_sisamil()
                     except: pass
                 
-                logging.info(f"Aguardando {INTERVALO_EXECUCAO}s...")
-                for _ in range(int(INTERVALO_EXECUCAO/10)):
-                    time.sleep(10)
-                    self.update_heartbeat()
+                agendador.aguardar()
                     
         except KeyboardInterrupt:
             self.running = False
 
+class EstatisticasCiclo:
+    """Contadores de um ciclo, compartilhados entre as sessões."""
+
+    def __init__(self, total):
+        self.total = total
+        self.sucessos = 0
+        self.falhas = 0
+        # Contratos devolvidos à fila por queda da sessão
+        self.devolvidos = set()
+        self.inicio = time.monotonic()
+        self._lock = threading.Lock()
+
+    def registrar(self, sucesso):
+        with self._lock:
+            if sucesso:
+                self.sucessos += 1
+            else:
+                self.falhas += 1
+
+    @property
+    def duracao(self):
+        return time.monotonic() - self.inicio
+
+    @property
+    def contratos_por_hora(self):
+        return (self.sucessos + self.falhas) / self.duracao * 3600 if self.duracao > 0 else 0.0
+
+
+class PoolSessoes:
+    """
+    N sessões independentes do portal (cada uma com seu Chrome, login,
+    recuperação e sessão do banco) consumindo a mesma fila de contratos.
+    A sessão principal é a do próprio bot; as extras são criadas na primeira
+    vez e mantidas logadas entre os ciclos.
+    """
+
+    def __init__(self, principal, tamanho):
+        self.principal = principal
+        self.tamanho = max(1, tamanho)
+        self.sessoes = [principal]
+
+    def _garantir_sessoes(self, quantidade):
+        while len(self.sessoes) < quantidade:
+            numero = len(self.sessoes) + 1
+            self.sessoes.append(AutomacaoBree(
+                nome=f"sessao-{numero}", ao_progredir=self.principal.update_heartbeat, buffer=self.principal.buffer,
+                controle=self.principal.controle
+            ))
+        return self.sessoes[:quantidade]
+
+    def processar(self, fila, hoje, prazo=None, diario=None):
+        """
+        Verifica os contratos da fila [(pontuacao, contrato_id, tipo)], maior
+        pontuação primeiro. Com `prazo` (time.monotonic), nenhuma sessão começa
+        um contrato que não termine antes dele. Com `diario` (DiarioCiclo), cada
+        contrato concluído é registrado e o ciclo é fechado no fim. Retorna as
+        estatísticas do ciclo.
+        """
+        tarefas = queue.PriorityQueue()
+        for ordem, (pontuacao, contrato_id, tipo) in enumerate(fila):
+            tarefas.put((-pontuacao, ordem, contrato_id, tipo))
+
+        estatisticas = EstatisticasCiclo(len(fila))
+        sessoes = self._garantir_sessoes(min(self.tamanho, len(fila)))
+        buffer = self.principal.buffer
+
+        if len(sessoes) == 1:
+            self._trabalhar(sessoes[0], tarefas, hoje, estatisticas, prazo, diario)
+        else:
+            threads = [
+                threading.Thread(target=self._trabalhar, args=(sessao, tarefas, hoje, estatisticas, prazo, diario),
+                                 name=sessao.nome, daemon=True)
+                for sessao in sessoes
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        buffer.descarregar()
+        if diario:
+            diario.concluir(estatisticas.sucessos, estatisticas.falhas, tarefas.qsize())
+
+        logging.info(
+            f"Ciclo concluído. {estatisticas.sucessos}/{estatisticas.total} contratos verificados com sucesso "
+            f"({estatisticas.falhas} falhas) em {estatisticas.duracao:.0f}s com {len(sessoes)} sessão(ões) "
+            f"- {estatisticas.contratos_por_hora:.0f} contratos/h."
+        )
+        if not tarefas.empty():
+            logging.info(f"⏳ Orçamento de tempo esgotado: {tarefas.qsize()} contratos ficam para o próximo ciclo.")
+        self._log_navegacao()
+        logging.info(f"🔌 Portal: {self.principal.controle.resumo()}.")
+        if etapas.contagem("sessao_caiu") or etapas.contagem("relogin_antecipado"):
+            logging.info(
+                f"🔑 Sessões: {etapas.contagem('relogin_antecipado')} relogins antecipados, "
+                f"{etapas.contagem('sessao_caiu')} quedas detectadas pela sonda, "
+                f"{etapas.contagem('contrato_devolvido')} contratos devolvidos à fila."
+            )
+        if etapas.contagem("faturas_iguais"):
+            logging.info(f"🧾 Faturas sem mudança em {etapas.contagem('faturas_iguais')} contratos (só a data de checagem avançou).")
+        etapas.definir("ciclo_contratos_por_hora", round(estatisticas.contratos_por_hora))
+        etapas.definir("ciclo_duracao_s", round(estatisticas.duracao, 1))
+        etapas.definir("ciclo_falhas", estatisticas.falhas)
+        etapas.registrar_no_log()
+        exportador_metricas.gravar()
+        etapas.zerar()
+        return estatisticas
+
+    def _log_navegacao(self):
+        contagem = {nav: etapas.contagem(nav) for nav in (NAV_FORMULARIO, NAV_RETORNO, NAV_MENU)}
+        total = sum(contagem.values())
+        if not total:
+            return
+        logging.info(
+            f"🧭 Menu evitado em {(total - contagem[NAV_MENU]) / total:.0%} das consultas pelo navegador "
+            f"({contagem[NAV_FORMULARIO]} já no formulário, {contagem[NAV_RETORNO]} pela URL, "
+            f"{contagem[NAV_MENU]} pelo menu)."
+        )
+
+    def _trabalhar(self, sessao, tarefas, hoje, estatisticas, prazo=None, diario=None):
+        """Loop de uma sessão: pega o contrato mais prioritário até esvaziar a fila ou estourar o prazo."""
+        with app.app_context():
+            try:
+                feitos, tempo_total = 0, 0.0
+                while sessao.running:
+                    # Só começa outro contrato se, pela média desta sessão, ele termina no prazo
+                    if prazo is not None and time.monotonic() + (tempo_total / feitos if feitos else 0) > prazo:
+                        return
+                    # Sessão do portal sondada/renovada antes de tirar um contrato da fila
+                    sessao.garantir_sessao()
+                    # Vez no portal: limite de consultas simultâneas, espaçamento e disjuntor
+                    if not sessao.controle.aguardar_vez(prazo):
+                        return
+                    try:
+                        try:
+                            tarefa = tarefas.get_nowait()
+                        except queue.Empty:
+                            return
+                        _, _, contrato_id, tipo = tarefa
+                        contrato = db.session.get(Contrato, contrato_id)
+                        anterior = db.session.execute(
+                            db.select(FaturaSnapshot.id, FaturaSnapshot.hash, FaturaSnapshot.contexto, FaturaSnapshot.status)
+                            .where(FaturaSnapshot.contrato_id == contrato_id)
+                            .order_by(FaturaSnapshot.id.desc())
+                            .limit(1)
+                        ).first()
+                        # Solta a conexão durante a consulta ao portal (a gravação é pelo buffer)
+                        db.session.close()
+                        if contrato is None:
+                            continue
+                        sessao.update_heartbeat()
+                        inicio = time.monotonic()
+                        sucesso = bool(sessao._verificar_contrato_safe(contrato, hoje, tipo, anterior=anterior))
+                        segundos = time.monotonic() - inicio
+                    finally:
+                        sessao.controle.liberar()
+                    if not sucesso and contrato_id not in estatisticas.devolvidos and not sessao.sessao_viva():
+                        # Falhou porque a sessão caiu: volta para a fila (uma vez) em vez de contar como falha
+                        estatisticas.devolvidos.add(contrato_id)
+                        tarefas.put(tarefa)
+                        etapas.contar("contrato_devolvido")
+                        continue
+                    estatisticas.registrar(sucesso)
+                    etapas.registrar("contrato", segundos)
+                    if diario:
+                        diario.registrar(contrato_id, sucesso, sessao.nome, segundos)
+                    feitos += 1
+                    tempo_total += segundos
+            except Exception as e:
+                # Os contratos restantes continuam na fila para as outras sessões
+                logging.error(f"Sessão {sessao.nome} interrompida: {e}", exc_info=True)
+            finally:
+                db.session.remove()
+
+    def encerrar(self):
+        for sessao in self.sessoes:
+            sessao.descartar_renovacao()
+            fabrica_driver.descartar(sessao.driver)
+            sessao.driver = None
+        fabrica_driver.encerrar()
+
+
 if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description='Automacao Bree')
     parser.add_argument('--once', action='store_true', help='Executa apenas um ciclo e encerra (modo Agendador de Tarefas)')
+    parser.add_argument('--orcamento-minutos', type=float, default=None,
+                        help='Com --once: tempo máximo da execução; os contratos menos prioritários que não couberem ficam para a próxima')
     args = parser.parse_args()
 
     try:
         bot = AutomacaoBree()
         if args.once:
             logging.info("Modo Único (--once) ativado. Executando um ciclo e encerrando.")
+            prazo = None
+            if args.orcamento_minutos:
+                prazo = time.monotonic() + args.orcamento_minutos * 60
+                logging.info(f"Orçamento de tempo: {args.orcamento_minutos:g} minutos.")
+            exportador_metricas.iniciar()
             try:
                 bot.login_e_navegar_sisamil()
-                bot.atualizar_banco()
+                bot.atualizar_banco(prazo)
             finally:
-                if bot.driver: bot.driver.quit()
+                exportador_metricas.parar()
+                if bot.pool: bot.pool.encerrar()
+                else:
+                    fabrica_driver.descartar(bot.driver)
+                    fabrica_driver.encerrar()
         else:
             bot.run()
             
@@ -0,0 +1,70 @@
+"""
+BACKFILL: calcula contratos.proxima_checagem para a base existente
+(migrations/add_proxima_checagem.sql precisa ter sido aplicada).
+
+Por padrão só preenche os contratos com a agenda vazia; --todos recalcula
+também os que já têm data (ex.: depois de mudar a regra do D+3).
+
+Uso:
+    python scripts/backfill_proxima_checagem.py
+    python scripts/backfill_proxima_checagem.py --todos --lote 5000
+"""
+
+import sys
+import os
+import argparse
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytz
+from sqlalchemy import select, update
+
+from app import app, db, Contrato
+from app.versao_dados import avancar_versao
+from scripts.faturas import STATUS_AGENDADOS, agenda_para_gravar, calcular_proximas_checagens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preenche contratos.proxima_checagem")
+    parser.add_argument("--todos", action="store_true", help="Recalcula também os contratos que já têm agenda")
+    parser.add_argument("--lote", type=int, default=2000)
+    args = parser.parse_args()
+
+    hoje = datetime.now(pytz.timezone("America/Sao_Paulo")).date()
+
+    with app.app_context():
+        consulta = select(Contrato.id, Contrato.status, Contrato.data_vigencia, Contrato.data_checagem) \
+            .where(Contrato.status.in_(STATUS_AGENDADOS)).order_by(Contrato.id)
+        if not args.todos:
+            consulta = consulta.where(Contrato.proxima_checagem.is_(None))
+        linhas = db.session.execute(consulta).all()
+
+        vencidos = futuros = sem_agenda = 0
+        for inicio in range(0, len(linhas), args.lote):
+            lote = linhas[inicio:inicio + args.lote]
+            ids, status, vigencias, checagens = zip(*lote)
+            valores = []
+            for contrato_id, proxima in zip(ids, calcular_proximas_checagens(status, vigencias, checagens, hoje)):
+                if proxima is None:
+                    sem_agenda += 1
+                elif proxima <= hoje:
+                    vencidos += 1
+                else:
+                    futuros += 1
+                valores.append({"id": contrato_id, "proxima_checagem": agenda_para_gravar(proxima)})
+            # UPDATE em lote por chave primária (não passa pelo flush do ORM)
+            db.session.execute(update(Contrato), valores)
+            avancar_versao("contratos")
+            db.session.commit()
+            print(f"  {min(inicio + args.lote, len(linhas))}/{len(linhas)} contratos")
+
+        print("===== AGENDA DA AUTOMAÇÃO =====")
+        print(f"Contratos calculados: {len(linhas)}")
+        print(f"Vencidos (entram no próximo ciclo): {vencidos}")
+        print(f"Agendados para depois de hoje: {futuros}")
+        print(f"Fora da agenda (ativos sem vigência): {sem_agenda}")
+
+
+if __name__ == "__main__":
+    main()
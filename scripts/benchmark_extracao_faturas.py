@@ -0,0 +1,159 @@
+"""
+BENCHMARK: Extração da tabela de faturas (tbemitida_1)
+Compara a leitura original, célula a célula (find_elements + get_attribute),
+com a leitura em um único execute_script (JS_LINHAS_TABELA).
+
+Cada comando do Selenium é uma requisição HTTP ao chromedriver. Aqui o
+navegador é simulado: cada comando conta uma ida e volta e espera
+--latencia-ms, o que basta para comparar as duas formas sem Chrome nem portal.
+
+Uso:
+    python scripts/benchmark_extracao_faturas.py
+    python scripts/benchmark_extracao_faturas.py --faturas 10 40 120 --latencia-ms 3
+"""
+
+import sys
+import os
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selenium.webdriver.common.by import By
+
+from scripts.faturas import parse_date, parse_float, faturas_de_celulas
+from scripts.portal_http import ID_TABELA_FATURAS, JS_LINHAS_TABELA
+
+
+class ElementoSimulado:
+    def __init__(self, navegador, filhos=None, texto=""):
+        self.navegador = navegador
+        self.filhos = filhos or []
+        self.texto = texto
+
+    def find_elements(self, by, valor):
+        self.navegador.ida_e_volta()
+        return list(self.filhos)
+
+    def get_attribute(self, nome):
+        self.navegador.ida_e_volta()
+        return self.texto
+
+
+class NavegadorSimulado:
+    """Driver falso: só a tabela de faturas, com latência fixa por comando."""
+
+    def __init__(self, linhas, latencia):
+        self.linhas = linhas  # inclui o cabeçalho
+        self.latencia = latencia
+        self.idas_e_voltas = 0
+        self.tabela = ElementoSimulado(self, [
+            ElementoSimulado(self, [ElementoSimulado(self, texto=t) for t in linha])
+            for linha in linhas
+        ])
+
+    def ida_e_volta(self):
+        self.idas_e_voltas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def find_element(self, by, valor):
+        self.ida_e_volta()
+        return self.tabela
+
+    def execute_script(self, script, *args):
+        self.ida_e_volta()
+        if script == JS_LINHAS_TABELA and args == (ID_TABELA_FATURAS,):
+            return [list(linha) for linha in self.linhas]
+        raise ValueError("Script não simulado")
+
+
+def extrair_por_elementos(driver):
+    """Cópia da extração original de AutomacaoBree.extrair_faturas (referência)."""
+    tabela = driver.find_element(By.ID, "tbemitida_1")
+    linhas = tabela.find_elements(By.TAG_NAME, "tr")[1:]
+    faturas = []
+
+    for linha in linhas:
+        cells = linha.find_elements(By.TAG_NAME, "td")
+        if len(cells) < 7: continue
+
+        faturas.append({
+            "ciclo": cells[1].get_attribute("textContent").strip().lower(),
+            "referencia": cells[2].get_attribute("textContent").strip(),
+            "vencimento": parse_date(cells[3].get_attribute("textContent").replace("\xa0", "").strip()),
+            "pagamento": parse_date(cells[4].get_attribute("textContent").replace("\xa0", "").strip()),
+            "valor": parse_float(cells[5].get_attribute("textContent").strip().replace("R$", "")),
+            "dias_atraso": int(cells[6].get_attribute("textContent").strip()) if cells[6].get_attribute("textContent").strip().isdigit() else 0,
+        })
+    return faturas
+
+
+def extrair_por_script(driver):
+    """Extração atual: uma chamada, células convertidas em Python."""
+    linhas = driver.execute_script(JS_LINHAS_TABELA, ID_TABELA_FATURAS)
+    return faturas_de_celulas(linhas[1:]) if linhas is not None else []
+
+
+def gerar_linhas(quantidade, semente=42):
+    """Tabela sintética no formato do portal (cabeçalho + uma linha por fatura)."""
+    rnd = random.Random(semente)
+    linhas = [["Nº", "Ciclo", "Referência", "Vencimento", "Pagamento", "Valor", "Dias"]]
+    vencimento = date(2024, 1, 10)
+    for i in range(quantidade):
+        pago = rnd.random() < 0.85
+        valor = f"R$ {rnd.randint(300, 9000):,}".replace(",", ".") + f",{rnd.randint(0, 99):02d}"
+        linhas.append([
+            f" {i + 1} ",
+            " Mensalidade ",
+            vencimento.strftime(" %m/%Y "),
+            vencimento.strftime("%d/%m/%Y\xa0"),
+            (vencimento + timedelta(days=rnd.randint(0, 5))).strftime("%d/%m/%Y") if pago else "\xa0",
+            valor,
+            "0" if pago else str(rnd.randint(1, 60)),
+        ])
+        vencimento = (vencimento.replace(day=1) + timedelta(days=32)).replace(day=10)
+    return linhas
+
+
+def medir(extrair, linhas, latencia, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        driver = NavegadorSimulado(linhas, latencia)
+        inicio = time.perf_counter()
+        faturas = extrair(driver)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return faturas, driver.idas_e_voltas, melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da extração da tabela de faturas")
+    parser.add_argument("--faturas", type=int, nargs="+", default=[10, 40, 120])
+    parser.add_argument("--latencia-ms", type=float, default=2.0,
+                        help="Latência de cada comando ao chromedriver (padrão: 2ms)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+    latencia = args.latencia_ms / 1000
+
+    print(f"Latência simulada por comando: {args.latencia_ms:.1f}ms (melhor de {args.repeticoes})")
+    print(f"{'Faturas':>8} | {'Idas legado':>11} | {'Idas script':>11} | {'Legado':>10} | {'Script':>10}")
+    print("-" * 64)
+    divergencias = 0
+    for quantidade in args.faturas:
+        linhas = gerar_linhas(quantidade)
+        legado, idas_legado, t_legado = medir(extrair_por_elementos, linhas, latencia, args.repeticoes)
+        novo, idas_script, t_script = medir(extrair_por_script, linhas, latencia, args.repeticoes)
+        if legado != novo:
+            divergencias += 1
+            print(f"  [DIVERGÊNCIA] {quantidade} faturas: as duas extrações não produziram as mesmas faturas")
+        print(f"{quantidade:>8} | {idas_legado:>11} | {idas_script:>11} | "
+              f"{t_legado * 1000:>8.1f}ms | {t_script * 1000:>8.1f}ms")
+
+    if divergencias:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
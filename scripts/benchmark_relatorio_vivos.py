@@ -0,0 +1,178 @@
+"""
+BENCHMARK: Relatório de Contratos Vivos
+Compara o loop Python original (objetos do ORM + Decimal) com a agregação SQL
+e com o motor colunar NumPy (frio = leitura + cálculo, quente = cache por versão).
+
+Usa um banco SQLite temporário com contratos sintéticos, a não ser que
+--database-url aponte para um banco de testes (NUNCA use o banco de produção).
+
+Uso:
+    python scripts/benchmark_relatorio_vivos.py
+    python scripts/benchmark_relatorio_vivos.py --tamanhos 10000 100000 --repeticoes 3
+"""
+
+import sys
+import os
+import argparse
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def loop_legado(Contrato, joinedload):
+    """Cópia do cálculo original de /relatorio_vivos (referência de desempenho)."""
+    from collections import defaultdict, Counter
+    from statistics import mean, mode, median
+
+    contratos_vivos = Contrato.query.options(joinedload(Contrato.vendedor)).filter(
+        Contrato.status.in_(["Em dia", "Pago", "Em atraso"])
+    ).all()
+
+    total_contratos = len(contratos_vivos)
+    total_vidas = sum(c.vidas or 0 for c in contratos_vivos)
+    total_faturamento = sum(c.valor_parcela or Decimal(0) for c in contratos_vivos)
+
+    def calcular_comissao(contrato):
+        if contrato.parcela_atual in [1, 2, 3]:
+            return contrato.valor_parcela or Decimal(0)
+        elif contrato.parcela_atual and contrato.parcela_atual >= 4:
+            return (contrato.valor_parcela or Decimal(0)) * Decimal("0.04")
+        return 0
+
+    total_agenciamento = sum(c.valor_parcela or Decimal(0) for c in contratos_vivos if c.parcela_atual in [1, 2, 3])
+    total_vitalicio = sum((c.valor_parcela or Decimal(0)) * Decimal("0.04") for c in contratos_vivos if c.parcela_atual and c.parcela_atual >= 4)
+
+    vidas_por_produto = defaultdict(int)
+    vidas_por_vendedora = defaultdict(int)
+    atividades = Counter()
+    cidades = Counter()
+    vidas_por_contrato_total = []
+    ticket_por_vida = []
+    comissao_total = []
+
+    for c in contratos_vivos:
+        nome_plano = c.nome_plano.strip() if c.nome_plano and c.nome_plano.strip().lower() != "nan" else "Não informado"
+        vidas_por_produto[nome_plano] += c.vidas or 0
+        if c.vendedor:
+            vidas_por_vendedora[c.vendedor.nome] += c.vidas or 0
+        atividades[c.atividade_economica or "-"] += 1
+        cidades[c.cidade or "-"] += 1
+        vidas_por_contrato_total.append(c.vidas or 0)
+        if c.vidas:
+            ticket_por_vida.append((c.valor_parcela or Decimal(0)) / c.vidas)
+            comissao_total.append(calcular_comissao(c))
+
+    parcelas_ativas = [c.parcela_atual for c in contratos_vivos if c.parcela_atual]
+    return {
+        "total_contratos": total_contratos,
+        "total_vidas": total_vidas,
+        "total_faturamento": round(total_faturamento, 2),
+        "total_agenciamento": round(total_agenciamento, 2),
+        "total_vitalicio": round(total_vitalicio, 2),
+        "parcela_mediana": round(median(parcelas_ativas), 2) if parcelas_ativas else "-",
+        "parcela_moda": mode(vidas_por_contrato_total) if vidas_por_contrato_total else None,
+        "ticket_medio_vida": round(mean(ticket_por_vida), 2) if ticket_por_vida else 0,
+        "top_cidades": cidades.most_common(10),
+    }
+
+
+def popular(db, Contrato, Vendedor, quantidade, semente=42):
+    """Insere `quantidade` contratos sintéticos (insert em lote via Core)."""
+    from app.versao_dados import avancar_versao
+
+    random.seed(semente)
+    db.session.execute(Contrato.__table__.delete())
+    db.session.execute(Vendedor.__table__.delete())
+    db.session.execute(Vendedor.__table__.insert(), [{"id": i + 1, "nome": f"Vendedora {i + 1}"} for i in range(40)])
+
+    planos = ["AMIL 400 QC", "AMIL 500 QP", "AMIL S380", "AMIL S750", "nan", None]
+    cidades = [f"Cidade {i}" for i in range(60)] + [None]
+    atividades = [f"Atividade {i}" for i in range(30)] + [None]
+    status = ["Em dia", "Pago", "Em atraso", "Cliente Morto", "Cancelado por Regra"]
+
+    lote = []
+    for i in range(quantidade):
+        lote.append({
+            "proposta": f"BENCH{i}",
+            "contrato": f"{9000000 + i}",
+            "status": random.choice(status),
+            "nome_plano": random.choice(planos),
+            "vidas": random.choice([None, 1, 1, 2, 3, 4, 8]),
+            "valor_parcela": Decimal(random.randint(8000, 300000)) / 100,
+            "parcela_atual": random.randint(0, 36),
+            "cidade": random.choice(cidades),
+            "atividade_economica": random.choice(atividades),
+            "vendedor_id": random.randint(1, 40),
+            "data_vigencia": date(2023, 1, 1) + timedelta(days=random.randint(0, 900)),
+        })
+        if len(lote) == 5000:
+            db.session.execute(Contrato.__table__.insert(), lote)
+            lote = []
+    if lote:
+        db.session.execute(Contrato.__table__.insert(), lote)
+    # Inserts via Core não passam pelo flush do ORM
+    avancar_versao("contratos", "vendedores")
+    db.session.commit()
+
+
+def cronometrar(funcao, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do relatório de contratos vivos")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--database-url", help="Banco de TESTES (padrão: SQLite temporário)")
+    args = parser.parse_args()
+
+    pasta_tmp = tempfile.mkdtemp(prefix="bench_bree_")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(pasta_tmp, 'bench.db')}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    from sqlalchemy.orm import joinedload
+    from app import app, db, Contrato, Vendedor
+    from app.relatorios import metricas_vivos_sql
+    from app import analise_carteira
+
+    with app.app_context():
+        db.create_all()
+        print(f"{'Contratos':>10} | {'Loop ORM':>10} | {'SQL':>10} | {'NumPy frio':>10} | {'NumPy cache':>11}")
+        print("-" * 64)
+        for tamanho in args.tamanhos:
+            popular(db, Contrato, Vendedor, tamanho)
+            db.session.expire_all()
+
+            t_loop = cronometrar(lambda: loop_legado(Contrato, joinedload), args.repeticoes)
+            t_sql = cronometrar(metricas_vivos_sql, args.repeticoes)
+
+            def numpy_frio():
+                analise_carteira._cache["versao"] = None
+                analise_carteira.metricas_vivos()
+            t_frio = cronometrar(numpy_frio, args.repeticoes)
+            analise_carteira.metricas_vivos()
+            t_quente = cronometrar(analise_carteira.metricas_vivos, args.repeticoes)
+
+            # Conferência: os motores devem concordar com o loop original
+            legado = loop_legado(Contrato, joinedload)
+            novo = analise_carteira.metricas_vivos()
+            for chave in ("total_contratos", "total_vidas", "total_faturamento", "total_agenciamento",
+                          "total_vitalicio", "parcela_mediana", "ticket_medio_vida"):
+                if legado[chave] != novo[chave]:
+                    print(f"  [DIVERGÊNCIA] {chave}: loop={legado[chave]} numpy={novo[chave]}")
+
+            print(f"{tamanho:>10} | {t_loop * 1000:>8.1f}ms | {t_sql * 1000:>8.1f}ms | "
+                  f"{t_frio * 1000:>8.1f}ms | {t_quente * 1000:>9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+BENCHMARK: Replay de status (scripts/replay_status.py)
+Mede a vazão (contratos/s) das regras de status sobre faturas gravadas, num
+processo e com o pool de processos, e confere que os dois chegam às mesmas
+mudanças. Carteira sintética em memória: não precisa de banco.
+
+Meta: META_CONTRATOS_POR_SEGUNDO por processo. Com ela, a carteira inteira
+(100 mil contratos) é reprocessada em menos de 10s num núcleo, e o pool
+divide esse tempo pelo número de núcleos (menos o custo de enviar os lotes).
+Abaixo da meta o script termina com código 1.
+
+Uso:
+    python scripts/benchmark_replay_status.py
+    python scripts/benchmark_replay_status.py --contratos 100000 --processos 1 4
+"""
+
+import sys
+import os
+import argparse
+import logging
+import random
+import time
+from datetime import date, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.benchmark_extracao_faturas import gerar_linhas
+from scripts.faturas import faturas_de_celulas, normalizar_faturas
+from scripts.replay_status import reprocessar, TAMANHO_LOTE
+
+META_CONTRATOS_POR_SEGUNDO = 10000
+STATUS_GRAVADOS = ("Em dia", "Pago", "Em atraso", "Cliente Morto")
+# Tabelas de faturas distintas (a carteira repete estas, com vigências e datas variadas)
+MODELOS = 200
+
+
+def gerar_carteira(quantidade, semente=42):
+    rnd = random.Random(semente)
+    modelos = [
+        normalizar_faturas(faturas_de_celulas(gerar_linhas(rnd.randint(1, 40), semente=i)[1:]))
+        for i in range(MODELOS)
+    ]
+    carteira = []
+    for contrato_id in range(1, quantidade + 1):
+        vigencia = date(2024, 1, 1) + timedelta(days=rnd.randint(0, 365))
+        data = date(2024, 6, 1) + timedelta(days=rnd.randint(0, 400))
+        carteira.append((
+            contrato_id, f"{contrato_id:07d}000", rnd.choice(modelos), data.isoformat(),
+            vigencia.isoformat() if rnd.random() > 0.02 else None, rnd.choice(STATUS_GRAVADOS)
+        ))
+    return carteira
+
+
+def medir(carteira, processos, tamanho_lote):
+    lotes = [carteira[i:i + tamanho_lote] for i in range(0, len(carteira), tamanho_lote)]
+    inicio = time.perf_counter()
+    mudancas = []
+    for _, mudancas_lote in reprocessar(iter(lotes), processos):
+        mudancas.extend(mudancas_lote)
+    return mudancas, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do replay de status")
+    parser.add_argument("--contratos", type=int, default=50_000)
+    parser.add_argument("--processos", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE)
+    args = parser.parse_args()
+    # Sem os logs [DEBUG] das regras (um por fatura)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    carteira = gerar_carteira(args.contratos)
+    print(f"{args.contratos} contratos sintéticos, lotes de {args.lote} (meta: {META_CONTRATOS_POR_SEGUNDO} contratos/s por processo)")
+    print(f"{'Processos':>9} | {'Tempo':>8} | {'Contratos/s':>11} | {'Mudanças':>8}")
+    print("-" * 47)
+
+    referencia = None
+    abaixo_da_meta = False
+    for processos in args.processos:
+        mudancas, segundos = medir(carteira, processos, args.lote)
+        vazao = args.contratos / segundos
+        print(f"{processos:>9} | {segundos:>7.2f}s | {vazao:>11.0f} | {len(mudancas):>8}")
+        if referencia is None:
+            referencia = mudancas
+            abaixo_da_meta = vazao < META_CONTRATOS_POR_SEGUNDO
+        elif mudancas != referencia:
+            print(f"  [DIVERGÊNCIA] {processos} processos não produziram as mesmas mudanças que 1 processo")
+            sys.exit(1)
+
+    if abaixo_da_meta:
+        print(f"[X] Abaixo da meta de {META_CONTRATOS_POR_SEGUNDO} contratos/s por processo")
+        sys.exit(1)
+    print(f"[OK] Meta de {META_CONTRATOS_POR_SEGUNDO} contratos/s por processo atingida")
+
+
+if __name__ == "__main__":
+    main()
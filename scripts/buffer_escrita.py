@@ -0,0 +1,254 @@
+"""
+Gravação em lote dos resultados do robô.
+
+Antes, cada contrato verificado custava um UPDATE + commit e, se em atraso,
+um SELECT + INSERT + commit da ação de cobrança. Agora as sessões entregam o
+resultado ao `BufferEscrita`, que:
+
+1. anota o resultado num diário local (JSON por linha, com fsync) antes de
+   qualquer coisa, para nada se perder se o processo cair;
+2. a cada N resultados ou T segundos grava tudo numa transação só:
+   - contratos: um `UPDATE ... FROM (VALUES ...)` no PostgreSQL (executemany
+     nos outros bancos);
+   - ações: `INSERT ... SELECT ... WHERE NOT EXISTS` com
+     `ON CONFLICT DO NOTHING` no índice único parcial (contrato_id,
+     dia_atraso) das ações do robô (migrations/add_indice_unico_acoes_robo.sql);
+   - snapshots das faturas: versão nova inserida (se ainda não existir) ou
+     `ultima_checagem` da versão atual avançada;
+3. depois do commit, esvazia o diário.
+
+Reaplicar o diário é seguro (UPDATE com os mesmos valores, INSERT idempotente),
+então na inicialização `recuperar()` regrava o que tiver sobrado de uma
+execução interrompida, inclusive uma que caiu entre o commit e a limpeza.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import Integer, and_, bindparam, cast, column, exists, select, text, update, values
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db, Contrato, AcaoCobranca, FaturaSnapshot
+from app.versao_dados import avancar_versao
+from scripts.metricas_bot import etapas
+
+# Colunas de contratos atualizadas pelo robô
+CAMPOS_CONTRATO = (
+    "status", "valor_parcela", "parcela_atual", "dias_atraso",
+    "data_checagem", "mes_cancelamento", "proxima_checagem",
+)
+CAMPOS_ACAO = ("contrato_id", "tipo", "mensagem", "parcela", "dia_atraso", "enviada_em", "status_envio")
+CAMPOS_SNAPSHOT = ("contrato_id", "primeira_checagem", "ultima_checagem", "hash", "contexto", "status",
+                   "quantidade", "faturas")
+CAMPOS_DATA = {"data_checagem", "mes_cancelamento", "proxima_checagem", "primeira_checagem", "ultima_checagem"}
+CAMPOS_DATA_HORA = {"enviada_em"}
+# Ações gravadas pelo robô (as da interface são "Manual")
+STATUS_ACAO_ROBO = "Enviado"
+CONDICAO_INDICE_ACOES = text(f"status_envio = '{STATUS_ACAO_ROBO}'")
+
+
+def _para_json(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _de_json(campos):
+    convertidos = dict(campos)
+    for nome, valor in campos.items():
+        if valor is None:
+            continue
+        if nome in CAMPOS_DATA:
+            convertidos[nome] = date.fromisoformat(valor)
+        elif nome in CAMPOS_DATA_HORA:
+            convertidos[nome] = datetime.fromisoformat(valor)
+    return convertidos
+
+
+class BufferEscrita:
+    """Resultados pendentes de gravação, compartilhados entre as sessões do robô."""
+
+    def __init__(self, caminho_diario, tamanho_lote=20, intervalo=30.0):
+        self.caminho_diario = caminho_diario
+        self.tamanho_lote = max(1, tamanho_lote)
+        self.intervalo = intervalo
+        self.pendentes = []  # [(contrato_id, campos, acao, snapshot)]
+        self.ultima_gravacao = time.monotonic()
+        self._lock = threading.RLock()
+        pasta = os.path.dirname(caminho_diario)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+    def registrar(self, contrato_id, campos, acao=None, snapshot=None):
+        """
+        Anota o resultado no diário e grava o lote se já encheu ou passou do
+        intervalo. `campos` pode trazer só parte de CAMPOS_CONTRATO; `snapshot`
+        é uma versão nova das faturas ou, com "id", a atualização da atual.
+        """
+        with self._lock:
+            self._anotar(contrato_id, campos, acao, snapshot)
+            self.pendentes.append((contrato_id, campos, acao, snapshot))
+            if len(self.pendentes) >= self.tamanho_lote or time.monotonic() - self.ultima_gravacao >= self.intervalo:
+                self.descarregar()
+
+    def _anotar(self, contrato_id, campos, acao, snapshot=None):
+        registro = {
+            "contrato_id": contrato_id,
+            "campos": {k: _para_json(v) for k, v in campos.items()},
+            "acao": {k: _para_json(v) for k, v in acao.items()} if acao else None,
+            "snapshot": {k: _para_json(v) for k, v in snapshot.items()} if snapshot else None,
+        }
+        with open(self.caminho_diario, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def descarregar(self):
+        """
+        Grava os pendentes numa transação. Em caso de erro eles continuam no
+        diário e na memória para a próxima tentativa. Retorna quantos gravou.
+        """
+        with self._lock:
+            self.ultima_gravacao = time.monotonic()
+            if not self.pendentes:
+                return 0
+            # Campos de cada contrato mesclados na ordem (um resultado parcial, como o de
+            # faturas iguais, não apaga um completo anterior); uma ação por (contrato, dia de atraso)
+            contratos = {}
+            acoes = {}
+            snapshots = {}
+            for contrato_id, campos, acao, snapshot in self.pendentes:
+                contratos.setdefault(contrato_id, {"id": contrato_id}).update(campos)
+                if acao:
+                    acoes[(acao["contrato_id"], acao["dia_atraso"])] = acao
+                if snapshot:
+                    snapshots[contrato_id] = snapshot
+            try:
+                with etapas.medir("commit"), db.engine.begin() as conexao:
+                    _atualizar_contratos(conexao, list(contratos.values()))
+                    inseridas = _inserir_acoes(conexao, list(acoes.values()))
+                    _gravar_snapshots(conexao, list(snapshots.values()))
+                    avancar_versao("contratos", "acoes_cobranca", conexao=conexao)
+            except Exception as e:
+                logging.error(f"Falha ao gravar {len(self.pendentes)} resultados (ficam no diário para nova tentativa): {e}")
+                return 0
+            logging.info(f"💾 {len(contratos)} contratos e {inseridas} ações gravados em lote.")
+            self.pendentes = []
+            open(self.caminho_diario, "w").close()
+            return len(contratos)
+
+    def recuperar(self):
+        """Regrava os resultados que ficaram no diário (execução interrompida)."""
+        with self._lock:
+            if not os.path.exists(self.caminho_diario):
+                return 0
+            registros = []
+            with open(self.caminho_diario, encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        registro = json.loads(linha)
+                    except ValueError:
+                        continue  # última linha cortada na queda
+                    registros.append((
+                        registro["contrato_id"],
+                        _de_json(registro["campos"]),
+                        _de_json(registro["acao"]) if registro.get("acao") else None,
+                        _de_json(registro["snapshot"]) if registro.get("snapshot") else None,
+                    ))
+            if not registros:
+                return 0
+            logging.info(f"♻️ Regravando {len(registros)} resultados do diário {self.caminho_diario}...")
+            self.pendentes = registros + self.pendentes
+            return self.descarregar()
+
+
+def _atualizar_contratos(conexao, linhas):
+    """Um UPDATE por conjunto de colunas (resultado completo ou só a data de checagem)."""
+    grupos = {}
+    for linha in linhas:
+        nomes = tuple(nome for nome in CAMPOS_CONTRATO if nome in linha)
+        grupos.setdefault(nomes, []).append(linha)
+    for nomes, grupo in grupos.items():
+        _atualizar_tabela(conexao, Contrato.__table__, nomes, grupo)
+
+
+def _atualizar_tabela(conexao, tabela, nomes, linhas):
+    if conexao.dialect.name == "postgresql":
+        # UPDATE tabela SET ... FROM (VALUES ...) AS v WHERE tabela.id = v.id
+        v = values(
+            column("id", Integer), *(column(nome, tabela.c[nome].type) for nome in nomes),
+            name="v"
+        ).data([tuple(linha[nome] for nome in ("id",) + nomes) for linha in linhas])
+        conexao.execute(
+            update(tabela)
+            .where(tabela.c.id == v.c.id)
+            .values({nome: cast(v.c[nome], tabela.c[nome].type) for nome in nomes})
+        )
+    else:
+        conexao.execute(
+            update(tabela)
+            .where(tabela.c.id == bindparam("b_id"))
+            .values({nome: bindparam(f"b_{nome}") for nome in nomes}),
+            [{f"b_{nome}": linha[nome] for nome in ("id",) + nomes} for linha in linhas]
+        )
+
+
+def _gravar_snapshots(conexao, snapshots):
+    """Insere as versões novas das faturas (uma vez só, mesmo regravando o diário) e avança as atuais."""
+    tabela = FaturaSnapshot.__table__
+    novos = [s for s in snapshots if "id" not in s]
+    atuais = [s for s in snapshots if "id" in s]
+    if novos:
+        parametros = [bindparam(f"b_{nome}", type_=tabela.c[nome].type) for nome in CAMPOS_SNAPSHOT]
+        if conexao.dialect.name == "postgresql":
+            # No SELECT o PostgreSQL não infere o tipo da coluna de destino (date, json)
+            parametros = [cast(p, p.type) for p in parametros]
+        origem = select(*parametros).where(
+            ~exists().where(and_(
+                tabela.c.contrato_id == bindparam("b_contrato_id"),
+                tabela.c.hash == bindparam("b_hash"),
+                tabela.c.primeira_checagem == bindparam("b_primeira_checagem"),
+            ))
+        )
+        conexao.execute(
+            tabela.insert().from_select(list(CAMPOS_SNAPSHOT), origem),
+            [{f"b_{nome}": snapshot[nome] for nome in CAMPOS_SNAPSHOT} for snapshot in novos]
+        )
+    if atuais:
+        _atualizar_tabela(conexao, tabela, ("ultima_checagem", "contexto", "status"), atuais)
+
+
+def _inserir_acoes(conexao, acoes):
+    """Insere as ações que ainda não existem (qualquer status) para o mesmo contrato e dia de atraso."""
+    if not acoes:
+        return 0
+    tabela = AcaoCobranca.__table__
+    if conexao.dialect.name == "postgresql":
+        # INSERT ... SELECT FROM (VALUES ...) AS v WHERE NOT EXISTS (...) ON CONFLICT DO NOTHING
+        v = values(*(column(nome, tabela.c[nome].type) for nome in CAMPOS_ACAO), name="v") \
+            .data([tuple(acao[nome] for nome in CAMPOS_ACAO) for acao in acoes])
+        origem = select(*(cast(v.c[nome], tabela.c[nome].type) for nome in CAMPOS_ACAO)).where(~exists().where(and_(
+            tabela.c.contrato_id == cast(v.c.contrato_id, Integer),
+            tabela.c.dia_atraso == cast(v.c.dia_atraso, Integer),
+        )))
+        comando = postgresql.insert(tabela).from_select(list(CAMPOS_ACAO), origem)
+        parametros = None
+    else:
+        origem = select(*(bindparam(f"b_{nome}", type_=tabela.c[nome].type) for nome in CAMPOS_ACAO)).where(~exists().where(and_(
+            tabela.c.contrato_id == bindparam("b_contrato_id"),
+            tabela.c.dia_atraso == bindparam("b_dia_atraso"),
+        )))
+        comando = sqlite.insert(tabela).from_select(list(CAMPOS_ACAO), origem)
+        parametros = [{f"b_{nome}": acao[nome] for nome in CAMPOS_ACAO} for acao in acoes]
+    comando = comando.on_conflict_do_nothing(
+        index_elements=["contrato_id", "dia_atraso"], index_where=CONDICAO_INDICE_ACOES
+    )
+    resultado = conexao.execute(comando, parametros) if parametros else conexao.execute(comando)
+    return resultado.rowcount if resultado.rowcount is not None and resultado.rowcount >= 0 else len(acoes)
@@ -0,0 +1,68 @@
+"""
+Calendário D+3 vetorizado (NumPy datetime64[D]).
+
+Mesma regra de sempre, para a carteira inteira de uma vez:
+- o vencimento do mês é o dia da vigência, limitado ao último dia do mês
+  (vigência 31 vence em 30/04 e em 28 ou 29/02);
+- D+3 = vencimento + 3 dias e pode checar quando hoje >= D+3;
+- vigências de fim de mês (dia >= 28): se o D+3 do vencimento do mês
+  anterior cai no mês de hoje, é ele que vale (ex.: vigência 30, hoje
+  02/03 -> vencimento 28/02, D+3 03/03);
+- sem vigência: D+3 = hoje e não pode checar.
+
+`calcular_d3_vetorizado` aceita vigências e datas de referência em arrays
+(ou escalares) com broadcasting: N contratos num dia, um contrato em N dias,
+ou a matriz contratos x dias. A versão escalar de `scripts/faturas.py` é um
+atalho para esta; scripts/teste_calendario_d3.py confere as duas contra a
+implementação escalar original, dia a dia.
+"""
+
+import numpy as np
+
+DIAS_D3 = 3
+# Menor dia de vigência que usa a regra do mês anterior
+DIA_FIM_DE_MES = 28
+
+
+def como_datas(valores):
+    """Converte date/None (ou listas deles) em datetime64[D]; None vira NaT."""
+    if isinstance(valores, np.ndarray):
+        return valores.astype("datetime64[D]")
+    if isinstance(valores, (list, tuple)):
+        return np.array([np.datetime64(v, "D") if v is not None else np.datetime64("NaT", "D") for v in valores],
+                        dtype="datetime64[D]")
+    return np.datetime64(valores, "D") if valores is not None else np.datetime64("NaT", "D")
+
+
+def dia_da_vigencia(vigencias):
+    """Dia do mês (1 a 31) de cada vigência."""
+    return (vigencias - vigencias.astype("datetime64[M]")).astype(np.int64) + 1
+
+
+def vencimento_no_mes(meses, dias):
+    """Vencimento no mês (datetime64[M]) para o dia da vigência, limitado ao fim do mês."""
+    inicio = meses.astype("datetime64[D]")
+    dias_no_mes = ((meses + 1).astype("datetime64[D]") - inicio).astype(np.int64)
+    return inicio + (np.minimum(dias, dias_no_mes) - 1)
+
+
+def calcular_d3_vetorizado(vigencias, hojes):
+    """
+    Retorna (datas_d3, pode_checar) com o formato do broadcasting de
+    `vigencias` e `hojes` (datetime64[D]; NaT = sem vigência).
+    """
+    vigencias, hojes = np.broadcast_arrays(como_datas(vigencias), como_datas(hojes))
+    sem_vigencia = np.isnat(vigencias)
+    vigencias = np.where(sem_vigencia, hojes, vigencias)
+
+    dias = dia_da_vigencia(vigencias)
+    meses = hojes.astype("datetime64[M]")
+
+    data_d3 = vencimento_no_mes(meses, dias) + DIAS_D3
+    d3_anterior = vencimento_no_mes(meses - 1, dias) + DIAS_D3
+    usa_anterior = (dias >= DIA_FIM_DE_MES) & (d3_anterior.astype("datetime64[M]") == meses)
+    data_d3 = np.where(usa_anterior, d3_anterior, data_d3)
+
+    pode_checar = (hojes >= data_d3) & ~sem_vigencia
+    data_d3 = np.where(sem_vigencia, hojes, data_d3)
+    return data_d3, pode_checar
@@ -0,0 +1,230 @@
+"""
+Controle de carga do portal Amil: concorrência adaptativa, espaçamento entre
+consultas e disjuntor (circuit breaker).
+
+As sessões do pool pedem vez (`aguardar_vez`) antes de cada contrato e
+informam cada tentativa (`observar`). Com a janela das últimas consultas
+(latência e erros) o controle ajusta, no estilo AIMD:
+
+- o limite de consultas em andamento: +1/limite a cada consulta saudável
+  (cerca de +1 a cada "rodada"), metade a cada sinal de congestionamento
+  (erro ou consulta mais lenta que FATOR_LENTIDAO x a mediana);
+- o intervalo mínimo entre o início de duas consultas: dobra no
+  congestionamento, diminui aos poucos com o portal saudável.
+
+Falhas seguidas ou taxa de erro alta abrem o disjuntor: ninguém consulta
+nem faz login até o tempo de espera passar (dobrando a cada reabertura).
+Depois, uma única consulta de teste decide se fecha ou reabre.
+"""
+
+import logging
+import random
+import statistics
+import threading
+import time
+from collections import deque
+
+from scripts.metricas_bot import etapas
+
+# Janela de observação
+JANELA = 50
+MIN_AMOSTRAS = 10
+FATOR_LENTIDAO = 2.0
+# Variação absoluta mínima para contar como lenta (ruído de consultas rápidas não é congestionamento)
+LENTIDAO_MINIMA = 1.0
+# Concorrência e espaçamento
+FATOR_REDUCAO = 0.5
+PASSO_INTERVALO = 0.5
+REDUCAO_INTERVALO = 0.1
+MAX_INTERVALO = 15.0
+# Disjuntor
+FALHAS_SEGUIDAS_PARA_ABRIR = 5
+TAXA_ERRO_PARA_ABRIR = 0.5
+ESPERA_DISJUNTOR = 60.0
+MAX_ESPERA_DISJUNTOR = 900.0
+# Espera entre tentativas de um mesmo contrato/login
+ESPERA_BASE_RETRY = 2.0
+MAX_ESPERA_RETRY = 60.0
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio-aberto"
+
+
+def espera_exponencial(tentativa, base=ESPERA_BASE_RETRY, maximo=MAX_ESPERA_RETRY):
+    """Espera antes da tentativa seguinte: base x 2^tentativa, limitada, com jitter (50% a 100%)."""
+    return min(base * 2 ** tentativa, maximo) * random.uniform(0.5, 1.0)
+
+
+class ControlePortal:
+    """Estado de saúde do portal compartilhado entre as sessões (thread-safe)."""
+
+    def __init__(self, maximo, ao_esperar=None):
+        self.maximo = max(1, maximo)
+        self.limite = float(self.maximo)
+        self.intervalo = 0.0
+        self.em_andamento = 0
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self.aberto_ate = 0.0
+        self.espera_disjuntor = ESPERA_DISJUNTOR
+        self.aberturas = 0
+        # Heartbeat durante as esperas (o watchdog mataria um robô "parado")
+        self.ao_esperar = ao_esperar
+        self._janela = deque(maxlen=JANELA)  # (sucesso, segundos)
+        self._proximo_inicio = 0.0
+        self._ultima_reducao = 0.0
+        self._teste_em_andamento = False
+        self._condicao = threading.Condition()
+        self._publicar()
+
+    # ------------------------------------------------------------------
+    # Vez de consultar
+    # ------------------------------------------------------------------
+
+    def aguardar_vez(self, prazo=None):
+        """
+        Bloqueia até a sessão poder começar uma consulta (disjuntor, limite e
+        espaçamento). Retorna False se `prazo` (time.monotonic) chegar antes.
+        """
+        with self._condicao:
+            while True:
+                agora = time.monotonic()
+                if prazo is not None and agora >= prazo:
+                    return False
+                espera = self._espera_necessaria(agora)
+                if espera <= 0:
+                    break
+                if prazo is not None:
+                    espera = min(espera, prazo - agora)
+                self._condicao.wait(min(espera, 10))
+                self._sinal_de_vida()
+
+            if self.estado == MEIO_ABERTO:
+                self._teste_em_andamento = True
+            self.em_andamento += 1
+            self._proximo_inicio = time.monotonic() + self.intervalo
+            self._publicar()
+            return True
+
+    def _espera_necessaria(self, agora):
+        if self.estado == ABERTO:
+            if agora < self.aberto_ate:
+                return self.aberto_ate - agora
+            self.estado = MEIO_ABERTO
+            logging.info("🔌 Disjuntor do portal meio-aberto: uma consulta de teste.")
+        if self.estado == MEIO_ABERTO and (self._teste_em_andamento or self.em_andamento):
+            return 1.0
+        if self.em_andamento >= max(1, int(self.limite)):
+            return 1.0
+        return self._proximo_inicio - agora
+
+    def liberar(self):
+        """
+        Devolve a vez (consulta terminada ou fila vazia). A vez de teste do
+        disjuntor meio-aberto devolvida sem `observar` (fila vazia, contrato
+        inexistente ou sem número) volta a ficar livre para a próxima sessão.
+        """
+        with self._condicao:
+            self.em_andamento = max(0, self.em_andamento - 1)
+            self._teste_em_andamento = False
+            self._publicar()
+            self._condicao.notify_all()
+
+    def aguardar_disjuntor(self):
+        """Espera o disjuntor sair de "aberto" (antes de um login ou nova tentativa)."""
+        with self._condicao:
+            while self.estado == ABERTO and time.monotonic() < self.aberto_ate:
+                self._condicao.wait(min(self.aberto_ate - time.monotonic(), 10))
+                self._sinal_de_vida()
+
+    def _sinal_de_vida(self):
+        if self.ao_esperar:
+            self.ao_esperar()
+
+    # ------------------------------------------------------------------
+    # Observações
+    # ------------------------------------------------------------------
+
+    def observar(self, sucesso, segundos):
+        """Registra uma tentativa (consulta ou login) e ajusta limite, intervalo e disjuntor."""
+        with self._condicao:
+            agora = time.monotonic()
+            mediana = self._mediana_sucessos()
+            self._janela.append((sucesso, segundos))
+            lenta = (sucesso and mediana is not None and segundos > FATOR_LENTIDAO * mediana
+                     and segundos - mediana > LENTIDAO_MINIMA)
+
+            if self.estado == MEIO_ABERTO and self._teste_em_andamento:
+                self._teste_em_andamento = False
+                if sucesso and not lenta:
+                    self._fechar()
+                else:
+                    self._abrir(agora, "consulta de teste falhou")
+            elif sucesso and not lenta:
+                self.falhas_seguidas = 0
+                self.limite = min(self.maximo, self.limite + 1 / self.limite)
+                self.intervalo = max(0.0, self.intervalo - REDUCAO_INTERVALO)
+            else:
+                self.falhas_seguidas = 0 if sucesso else self.falhas_seguidas + 1
+                # Uma redução por "rodada" (a resposta ao congestionamento leva uma consulta para aparecer)
+                if agora - self._ultima_reducao >= max(1.0, mediana or segundos):
+                    self._ultima_reducao = agora
+                    self.limite = max(1.0, self.limite * FATOR_REDUCAO)
+                    self.intervalo = min(MAX_INTERVALO, max(PASSO_INTERVALO, self.intervalo * 2))
+                    etapas.contar("portal_congestionado")
+                if self.estado == FECHADO and self._deve_abrir():
+                    self._abrir(agora, f"{self.falhas_seguidas} falhas seguidas, "
+                                       f"{self.taxa_erro():.0%} de erro nas últimas {len(self._janela)}")
+            self._publicar()
+            self._condicao.notify_all()
+
+    def _deve_abrir(self):
+        if self.falhas_seguidas >= FALHAS_SEGUIDAS_PARA_ABRIR:
+            return True
+        return len(self._janela) >= MIN_AMOSTRAS and self.taxa_erro() >= TAXA_ERRO_PARA_ABRIR
+
+    def _abrir(self, agora, motivo):
+        if self.estado == MEIO_ABERTO:
+            self.espera_disjuntor = min(MAX_ESPERA_DISJUNTOR, self.espera_disjuntor * 2)
+        self.estado = ABERTO
+        self.aberto_ate = agora + self.espera_disjuntor
+        self.aberturas += 1
+        self.limite = 1.0
+        etapas.contar("disjuntor_aberto")
+        logging.warning(f"🔌 Disjuntor do portal ABERTO por {self.espera_disjuntor:.0f}s ({motivo}).")
+
+    def _fechar(self):
+        self.estado = FECHADO
+        self.falhas_seguidas = 0
+        self.espera_disjuntor = ESPERA_DISJUNTOR
+        self._janela.clear()
+        logging.info("🔌 Disjuntor do portal fechado: portal respondendo.")
+
+    def _mediana_sucessos(self):
+        tempos = [s for ok, s in self._janela if ok]
+        return statistics.median(tempos) if len(tempos) >= MIN_AMOSTRAS else None
+
+    def taxa_erro(self):
+        return sum(1 for ok, _ in self._janela if not ok) / len(self._janela) if self._janela else 0.0
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+
+    def _publicar(self):
+        etapas.definir("portal_limite_concorrencia", round(self.limite, 2))
+        etapas.definir("portal_em_andamento", self.em_andamento)
+        etapas.definir("portal_intervalo_s", round(self.intervalo, 2))
+        etapas.definir("portal_taxa_erro", round(self.taxa_erro(), 3))
+        etapas.definir("portal_latencia_mediana_s", round(self._mediana_sucessos() or 0.0, 2))
+        etapas.definir("portal_disjuntor_aberto", int(self.estado != FECHADO))
+
+    def resumo(self):
+        with self._condicao:
+            mediana = self._mediana_sucessos()
+            return (
+                f"disjuntor {self.estado}, limite {self.limite:.1f}/{self.maximo} consultas simultâneas, "
+                f"intervalo {self.intervalo:.1f}s, erro {self.taxa_erro():.0%}, "
+                f"mediana {f'{mediana:.1f}s' if mediana is not None else '-'}"
+            )
@@ -0,0 +1,158 @@
+"""
+Diário do ciclo de verificação do robô.
+
+O watchdog mata o processo (os._exit) quando o robô trava e o Agendador do
+Windows o reinicia. Sem o diário, o novo processo refazia a seleção inteira e
+reconsultava contratos que já tinham sido verificados. Agora cada ciclo grava,
+num arquivo JSON por linha (append + fsync):
+
+- "inicio": o dia e a fila planejada [(pontuacao, contrato_id, tipo)];
+- "contrato": cada contrato concluído (sessão, sucesso e segundos gastos);
+- "retomada": cada reinício que continuou o ciclo;
+- "fim": o resumo do ciclo.
+
+Enquanto o ciclo não termina, o arquivo é `ciclo_atual.jsonl`; um processo
+reiniciado no mesmo dia continua a fila planejada sem os contratos já
+concluídos. Ciclos encerrados (ou abandonados na virada do dia) são
+renomeados para `ciclo_<data>_<hora>.jsonl` e mantidos para análise:
+
+    python scripts/diario_ciclo.py logs/ciclos/ciclo_2026-01-06_08-00-00.jsonl
+
+Os resultados em si ficam no diário do BufferEscrita, que é gravado antes do
+registro do contrato aqui; um contrato concluído no diário nunca perde o resultado.
+"""
+
+import sys
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+ARQUIVO_ATUAL = "ciclo_atual.jsonl"
+
+
+def _agora():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def ler_registros(caminho):
+    """Registros do diário; ignora uma última linha cortada na queda."""
+    registros = []
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registros.append(json.loads(linha))
+            except ValueError:
+                continue
+    return registros
+
+
+class DiarioCiclo:
+    """Fila planejada e contratos concluídos do ciclo em andamento."""
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.caminho = os.path.join(pasta, ARQUIVO_ATUAL)
+        self._lock = threading.Lock()
+        os.makedirs(pasta, exist_ok=True)
+
+    def _anotar(self, registro, modo="a"):
+        with self._lock:
+            with open(self.caminho, modo, encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def iniciar(self, hoje, fila):
+        """Abre o diário de um ciclo novo com a fila planejada."""
+        if os.path.exists(self.caminho):
+            self._arquivar()
+        self._anotar({"evento": "inicio", "em": _agora(), "dia": hoje.isoformat(),
+                      "fila": [list(item) for item in fila]}, modo="w")
+
+    def registrar(self, contrato_id, sucesso, sessao, segundos):
+        self._anotar({"evento": "contrato", "em": _agora(), "id": contrato_id, "sucesso": sucesso,
+                      "sessao": sessao, "segundos": round(segundos, 3)})
+
+    def concluir(self, sucessos, falhas, restantes):
+        """Fecha o ciclo (fila esgotada ou prazo encerrado) e guarda o diário."""
+        if not os.path.exists(self.caminho):
+            return
+        self._anotar({"evento": "fim", "em": _agora(), "sucessos": sucessos, "falhas": falhas,
+                      "restantes": restantes})
+        self._arquivar()
+
+    def retomar(self, hoje):
+        """
+        Fila restante de um ciclo interrompido hoje, ou None se não há o que
+        retomar (sem diário, ciclo de outro dia ou já encerrado).
+        """
+        if not os.path.exists(self.caminho):
+            return None
+        registros = ler_registros(self.caminho)
+        inicio = registros[0] if registros and registros[0].get("evento") == "inicio" else None
+        if inicio is None or inicio["dia"] != hoje.isoformat() or any(r["evento"] == "fim" for r in registros):
+            logging.info("Diário de ciclo anterior não retomável; arquivado.")
+            self._arquivar()
+            return None
+
+        concluidos = {r["id"] for r in registros if r["evento"] == "contrato"}
+        restante = [tuple(item) for item in inicio["fila"] if item[1] not in concluidos]
+        if not restante:
+            sucessos = sum(1 for r in registros if r["evento"] == "contrato" and r["sucesso"])
+            self.concluir(sucessos, len(concluidos) - sucessos, 0)
+            return None
+        self._anotar({"evento": "retomada", "em": _agora(), "concluidos": len(concluidos),
+                      "restantes": len(restante)})
+        return restante
+
+    def _arquivar(self):
+        registros = ler_registros(self.caminho)
+        inicio = registros[0]["em"] if registros and "em" in registros[0] else _agora()
+        nome = f"ciclo_{inicio.replace('T', '_').replace(':', '-')}.jsonl"
+        destino = os.path.join(self.pasta, nome)
+        if os.path.exists(destino):
+            destino = os.path.join(self.pasta, f"ciclo_{inicio.replace('T', '_').replace(':', '-')}_{os.getpid()}.jsonl")
+        os.replace(self.caminho, destino)
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def resumir(caminho):
+    """Resumo de um diário: fila, concluídos, retomadas e tempo por sessão."""
+    registros = ler_registros(caminho)
+    inicio = registros[0]
+    contratos = [r for r in registros if r["evento"] == "contrato"]
+    retomadas = [r for r in registros if r["evento"] == "retomada"]
+    fim = next((r for r in registros if r["evento"] == "fim"), None)
+
+    print(f"Ciclo de {inicio['dia']} iniciado em {inicio['em']}")
+    print(f"Fila planejada: {len(inicio['fila'])} | concluídos: {len(contratos)} "
+          f"({sum(1 for r in contratos if r['sucesso'])} com sucesso) | retomadas: {len(retomadas)}")
+    for r in retomadas:
+        print(f"  retomado em {r['em']} com {r['concluidos']} concluídos e {r['restantes']} restantes")
+    if fim:
+        duracao = datetime.fromisoformat(fim["em"]) - datetime.fromisoformat(inicio["em"])
+        print(f"Encerrado em {fim['em']} ({duracao}), {fim['restantes']} contratos para o próximo ciclo")
+    else:
+        print("Ciclo não encerrado")
+
+    por_sessao = {}
+    for r in contratos:
+        por_sessao.setdefault(r["sessao"], []).append(r["segundos"])
+    if por_sessao:
+        print(f"{'Sessão':<12} {'qtd':>6} {'média':>8} {'p95':>8} {'máx':>8}")
+        for sessao, tempos in sorted(por_sessao.items()):
+            print(f"{sessao:<12} {len(tempos):>6} {sum(tempos) / len(tempos):>7.2f}s "
+                  f"{_percentil(tempos, 0.95):>7.2f}s {max(tempos):>7.2f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python scripts/diario_ciclo.py <diario.jsonl>")
+        sys.exit(1)
+    resumir(sys.argv[1])
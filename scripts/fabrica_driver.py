@@ -0,0 +1,183 @@
+"""
+Fábrica de drivers do Chrome para o robô.
+
+Antes, cada (re)inicialização chamava ChromeDriverManager().install() (que
+consulta versões pela internet) e abria um Chrome novo, visível e sem perfil,
+inclusive a cada tentativa de login e a cada sessão perdida. Agora:
+
+- o caminho do chromedriver é resolvido uma vez e guardado em disco
+  (BOT_CACHE_CHROMEDRIVER); só é resolvido de novo se o arquivo sumir ou se o
+  Chrome recusar a versão (SessionNotCreatedException);
+- BOT_HEADLESS=1 roda sem janela;
+- BOT_PERFIL_CHROME=<pasta> usa perfis persistentes (perfil-1, perfil-2, ...;
+  um por Chrome aberto), então os cookies do portal sobrevivem a reinícios;
+- um Chrome reserva fica aberto em segundo plano (BOT_DRIVER_RESERVA=1): a
+  sessão que perde o driver (InvalidSessionIdException) ou a próxima sessão
+  do pool pega um já pronto.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from scripts.metricas_bot import etapas
+
+
+class FabricaDriver:
+    """Cria, reaproveita e descarta os drivers do Chrome (compartilhada entre as sessões)."""
+
+    def __init__(self, caminho_cache, headless=False, pasta_perfis=None, reserva=True):
+        self.caminho_cache = caminho_cache
+        self.headless = headless
+        self.pasta_perfis = pasta_perfis
+        self.reserva = reserva
+        self._caminho_driver = None
+        self._perfis = {}  # id(driver) -> número do perfil em uso
+        self._driver_reserva = None
+        self._thread_reserva = None
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # chromedriver
+    # ------------------------------------------------------------------
+
+    def caminho_chromedriver(self, renovar=False):
+        """Caminho do chromedriver: memória, depois o cache em disco, por último o webdriver_manager."""
+        with self._lock:
+            if self._caminho_driver and not renovar:
+                return self._caminho_driver
+            if not renovar and os.path.exists(self.caminho_cache):
+                try:
+                    with open(self.caminho_cache, encoding="utf-8") as f:
+                        caminho = json.load(f)["caminho"]
+                    if os.path.exists(caminho):
+                        self._caminho_driver = caminho
+                        return caminho
+                except (ValueError, KeyError, OSError):
+                    pass
+            inicio = time.perf_counter()
+            caminho = ChromeDriverManager().install()
+            logging.info(f"chromedriver resolvido em {time.perf_counter() - inicio:.1f}s: {caminho}")
+            pasta = os.path.dirname(self.caminho_cache)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            with open(self.caminho_cache, "w", encoding="utf-8") as f:
+                json.dump({"caminho": caminho, "resolvido_em": time.strftime("%Y-%m-%d %H:%M:%S")}, f)
+            self._caminho_driver = caminho
+            return caminho
+
+    # ------------------------------------------------------------------
+    # Criação e descarte
+    # ------------------------------------------------------------------
+
+    def _opcoes(self, perfil):
+        chrome_options = webdriver.ChromeOptions()
+        if self.headless:
+            chrome_options.add_argument("--headless=new")
+            chrome_options.add_argument("--window-size=1920,1080")
+        else:
+            chrome_options.add_argument("--start-maximized")
+        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        chrome_options.add_experimental_option("useAutomationExtension", False)
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        if perfil is not None:
+            chrome_options.add_argument(f"--user-data-dir={os.path.abspath(os.path.join(self.pasta_perfis, f'perfil-{perfil}'))}")
+        return chrome_options
+
+    def _reservar_perfil(self):
+        """Menor perfil livre (um diretório de perfil só pode ter um Chrome aberto)."""
+        if not self.pasta_perfis:
+            return None
+        with self._lock:
+            em_uso = set(self._perfis.values())
+            perfil = 1
+            while perfil in em_uso:
+                perfil += 1
+            self._perfis[("reservado", perfil)] = perfil
+            return perfil
+
+    def _criar(self):
+        perfil = self._reservar_perfil()
+        try:
+            with etapas.medir("driver"):
+                try:
+                    driver = webdriver.Chrome(service=Service(self.caminho_chromedriver()), options=self._opcoes(perfil))
+                except SessionNotCreatedException as e:
+                    # Chrome atualizado: o chromedriver guardado não serve mais
+                    logging.warning(f"chromedriver em cache recusado ({e.msg}). Resolvendo de novo...")
+                    driver = webdriver.Chrome(service=Service(self.caminho_chromedriver(renovar=True)),
+                                              options=self._opcoes(perfil))
+        finally:
+            with self._lock:
+                self._perfis.pop(("reservado", perfil), None)
+        with self._lock:
+            if perfil is not None:
+                self._perfis[id(driver)] = perfil
+        return driver
+
+    def obter(self):
+        """Driver pronto: a reserva, se houver uma viva, senão um novo. Já prepara a próxima reserva."""
+        with self._lock:
+            driver, self._driver_reserva = self._driver_reserva, None
+        if driver is not None and not self._vivo(driver):
+            self.descartar(driver)
+            driver = None
+        if driver is None:
+            driver = self._criar()
+        else:
+            etapas.contar("driver_reserva")
+        self._preparar_reserva()
+        return driver
+
+    def _vivo(self, driver):
+        try:
+            driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def descartar(self, driver):
+        """Fecha o Chrome (mesmo com a sessão já morta) e libera o perfil."""
+        if driver is None:
+            return
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        with self._lock:
+            self._perfis.pop(id(driver), None)
+
+    def _preparar_reserva(self):
+        if not self.reserva:
+            return
+        with self._lock:
+            if self._driver_reserva is not None or (self._thread_reserva and self._thread_reserva.is_alive()):
+                return
+            self._thread_reserva = threading.Thread(target=self._criar_reserva, name="driver-reserva", daemon=True)
+            self._thread_reserva.start()
+
+    def _criar_reserva(self):
+        try:
+            driver = self._criar()
+        except Exception as e:
+            logging.warning(f"Não foi possível abrir o Chrome reserva: {e}")
+            return
+        with self._lock:
+            self._driver_reserva = driver
+
+    def encerrar(self):
+        """Fecha o Chrome reserva (os das sessões são fechados por elas)."""
+        if self._thread_reserva:
+            self._thread_reserva.join(timeout=60)
+        with self._lock:
+            driver, self._driver_reserva = self._driver_reserva, None
+        self.descartar(driver)
@@ -0,0 +1,307 @@
+"""
+Regras de faturas do portal Amil (sem Selenium nem banco).
+
+Funções puras usadas pelo robô (scripts/automacao.py), pela consulta via HTTP
+(scripts/portal_http.py) e pelos scripts de teste: conversão das células da
+tabela de faturas emitidas (tbemitida_1), cálculo do D+3 e definição do status.
+"""
+
+import hashlib
+import json
+import logging
+import re
+from datetime import datetime, date, timedelta
+
+import numpy as np
+
+from scripts.calendario_d3 import DIAS_D3, calcular_d3_vetorizado, como_datas, dia_da_vigencia, vencimento_no_mes
+
+
+def log_debug(msg):
+    """Wrapper para logs de debug detalhados"""
+    logging.info(f"[DEBUG] {msg}")  # Usando INFO para aparecer no console por enquanto
+
+
+def parse_date(date_str):
+    """Converte string de data no formato DD/MM/YYYY para objeto date."""
+    try:
+        if not date_str or not date_str.strip():
+            return None
+        return datetime.strptime(date_str.strip(), "%d/%m/%Y").date()
+    except Exception as e:
+        # log_debug(f"Falha ao parsear data '{date_str}': {e}")
+        return None
+
+
+def parse_float(valor_str):
+    """Converte string de valor brasileiro (R$ 1.234,56) para float."""
+    try:
+        cleaned = re.sub(r"[^\d,\.]", "", valor_str)
+        
+        if cleaned.count(",") == 1 and cleaned.count(".") == 0:
+            cleaned = cleaned.replace(",", ".")
+        elif cleaned.count(",") == 1 and cleaned.rfind(",") > cleaned.rfind("."):
+            # Milhar com ponto e decimal com vírgula (1.234,56)
+            cleaned = cleaned.replace(".", "").replace(",", ".")
+        elif cleaned.count(",") > 1 and cleaned.count(".") == 0:
+            cleaned = cleaned.replace(".", "").replace(",", ".")
+        
+        return float(cleaned)
+    except:
+        return 0.0
+
+
+def calcular_data_d3(data_vigencia: date, hoje: date):
+    """
+    Calcula a data de D+3 (3 dias após o vencimento do mês corrente).
+    Atalho de um contrato para calcular_d3_vetorizado (scripts/calendario_d3.py).
+    """
+    data_d3, pode_checar = calcular_d3_vetorizado(data_vigencia, hoje)
+    return data_d3.item(), bool(pode_checar)
+
+
+# Agenda de rechecagem por status (proxima_checagem)
+STATUS_ATIVOS = ("Em dia", "Pago")
+STATUS_ATRASO = "Em atraso"
+STATUS_MORTO = "Cliente Morto"
+STATUS_AGENDADOS = STATUS_ATIVOS + (STATUS_ATRASO, STATUS_MORTO)
+DIAS_RECHECAGEM_MORTO = 15
+# Em atraso há 63 dias ou mais, sem multa rescisória
+DIAS_ATRASO_PARA_MORTO = 63
+# D+3 se repete todo mês: a próxima janela sempre aparece dentro deste horizonte
+HORIZONTE_BUSCA_D3 = 70
+# Gravado em proxima_checagem quando o contrato não entra na fila (ex.: ativo sem
+# vigência), para que NULL signifique só "agenda a calcular" (novo ou editado)
+FORA_DA_AGENDA = date(9999, 12, 31)
+
+
+# Ativos avaliados por bloco (matriz contratos x dias candidatos)
+TAMANHO_BLOCO_AGENDA = 50_000
+
+
+def calcular_proximas_checagens(status, vigencias, ultimas_checagens, hoje):
+    """
+    Primeiro dia em que cada contrato volta a ser candidato à verificação:
+    atraso no dia seguinte, morto a cada 15 dias e ativos (Em dia/Pago) no
+    próximo D+3 posterior à última checagem. Sem checagem anterior, atraso
+    e morto já vencem hoje. None = não entra na fila (cancelados, ativos sem
+    vigência). Listas alinhadas; retorna uma lista de date/None.
+    """
+    status = np.array(status, dtype=object)
+    vigencias = como_datas(list(vigencias))
+    ultimas = como_datas(list(ultimas_checagens))
+    hoje = np.datetime64(hoje, "D")
+    tem_ultima = ~np.isnat(ultimas)
+
+    proximas = np.full(len(status), np.datetime64("NaT", "D"))
+    seguinte = np.where(tem_ultima, ultimas + 1, hoje)
+    atraso = status == STATUS_ATRASO
+    proximas[atraso] = seguinte[atraso]
+    morto = status == STATUS_MORTO
+    proximas[morto] = np.where(tem_ultima, ultimas + DIAS_RECHECAGEM_MORTO, hoje)[morto]
+
+    # Ativos: primeiro dia, a partir do dia seguinte à última checagem, em que vale
+    # a regra da seleção antiga (pode checar e última checagem antes do D+3).
+    # Dentro de um mês o D+3 vigente é o mesmo, então esse dia é o próprio início
+    # ou uma das datas de D+3 dos meses em volta: só elas são avaliadas.
+    ativos = np.flatnonzero(np.isin(status, STATUS_ATIVOS) & ~np.isnat(vigencias))
+    for inicio in range(0, len(ativos), TAMANHO_BLOCO_AGENDA):
+        indices = ativos[inicio:inicio + TAMANHO_BLOCO_AGENDA]
+        primeiro_dia = seguinte[indices, None]
+        meses = primeiro_dia.astype("datetime64[M]") + np.arange(-1, HORIZONTE_BUSCA_D3 // 28 + 2)
+        dias = np.concatenate(
+            [primeiro_dia, vencimento_no_mes(meses, dia_da_vigencia(vigencias[indices, None])) + DIAS_D3], axis=1
+        )
+        datas_d3, pode_checar = calcular_d3_vetorizado(vigencias[indices, None], dias)
+        ultima = ultimas[indices, None]
+        elegivel = (pode_checar & (np.isnat(ultima) | (ultima < datas_d3))
+                    & (dias >= primeiro_dia) & (dias < primeiro_dia + HORIZONTE_BUSCA_D3))
+        proximas[indices] = np.where(elegivel, dias, np.datetime64("9999-12-31", "D")).min(axis=1)
+        proximas[indices[~elegivel.any(axis=1)]] = np.datetime64("NaT", "D")
+
+    return proximas.astype(object).tolist()
+
+
+def agenda_para_gravar(proxima):
+    """Valor da coluna proxima_checagem para um resultado de calcular_proximas_checagens."""
+    return FORA_DA_AGENDA if proxima is None else proxima
+
+
+def calcular_proxima_checagem(status, data_vigencia, ultima_checagem, hoje):
+    """Próxima checagem de um contrato (ver calcular_proximas_checagens)."""
+    return calcular_proximas_checagens([status], [data_vigencia], [ultima_checagem], hoje)[0]
+
+
+def determinar_status_faturas(invoices, data_ref, data_vigencia=None, ja_passou_d3=False):
+    """Determina o status do contrato baseado nas faturas."""
+    # Verifica multa por rescisão contratual
+    for inv in invoices:
+        ciclo = inv.get("ciclo", "").lower()
+        if "multa por rescisão contratual" in ciclo:
+            log_debug(f"Multa rescisória encontrada na fatura ref {inv.get('referencia')}")
+            return "Cancelado por Inadimplência"
+    
+    # Verifica faturas vencidas não pagas
+    for inv in invoices:
+        vencimento = inv.get("vencimento")
+        pagamento = inv.get("pagamento")
+        if (vencimento and 
+            vencimento <= data_ref and 
+            (not pagamento or str(pagamento).strip() == "")):
+            log_debug(f"Fatura em atraso encontrada: Ref {inv.get('referencia')}, Venc {vencimento}, Valor {inv.get('valor')}")
+            return "Em atraso"
+    
+    # Se já passou D+3, verifica se mensalidade do mês vigente está paga
+    if ja_passou_d3 and data_vigencia:
+        mes_ref = data_ref.month
+        ano_ref = data_ref.year
+        
+        for inv in invoices:
+            referencia = inv.get("referencia", "")
+            if referencia:
+                try:
+                    partes = referencia.split("/")
+                    if len(partes) >= 2:
+                        mes_fatura = int(partes[0])
+                        ano_fatura = int(partes[1])
+                        
+                        if mes_fatura == mes_ref and ano_fatura == ano_ref:
+                            if inv.get("pagamento") and str(inv.get("pagamento", "")).strip():
+                                log_debug(f"Pagamento do mês vigente ({mes_ref}/{ano_ref}) confirmado.")
+                                return "Pago"
+                except:
+                    pass
+    
+    return "Em dia"
+
+
+def status_com_regra_morto(status, dias_atraso):
+    """Status gravado pela automação: "Em atraso" com DIAS_ATRASO_PARA_MORTO dias ou mais vira Cliente Morto."""
+    if status == STATUS_ATRASO and dias_atraso >= DIAS_ATRASO_PARA_MORTO:
+        return STATUS_MORTO
+    return status
+
+
+# Resultado quando o portal responde "nenhum registro" (contrato sem faturas)
+RESULTADO_SEM_FATURAS = {"valor_parcela": 0.0, "parcelas": 0, "status": "Em dia", "mes_cancelamento": None, "dias_atraso": 0}
+
+
+def faturas_de_celulas(linhas):
+    """
+    Converte as linhas da tabela tbemitida_1 (listas com o textContent de cada
+    célula, sem o cabeçalho) nos dicionários de fatura usados pelas regras.
+    """
+    faturas = []
+    for cells in linhas:
+        if len(cells) < 7: continue
+        dias = cells[6].strip()
+        faturas.append({
+            "ciclo": cells[1].strip().lower(),
+            "referencia": cells[2].strip(),
+            "vencimento": parse_date(cells[3].replace("\xa0", "").strip()),
+            "pagamento": parse_date(cells[4].replace("\xa0", "").strip()),
+            "valor": parse_float(cells[5].strip().replace("R$", "")),
+            "dias_atraso": int(dias) if dias.isdigit() else 0,
+        })
+    return faturas
+
+
+def analisar_faturas(invoices, data_checagem, data_vigencia=None, pode_checar_d3=None):
+    """
+    Status, parcela, valor, dias de atraso e mês de cancelamento a partir das
+    faturas. `pode_checar_d3` já calculado (em lote, calcular_d3_vetorizado)
+    evita o cálculo do D+3 contrato a contrato.
+    """
+    # Lógica de Status
+    log_debug("Iniciando análise de status das faturas extraídas...")
+    has_multa = any("multa por rescisão" in i["ciclo"] for i in invoices)
+    mens_invoices = [i for i in invoices if "multa por rescisão" not in i["ciclo"]]
+    if pode_checar_d3 is None:
+        _, pode_checar_d3 = calcular_data_d3(data_vigencia, data_checagem) if data_vigencia else (None, False)
+
+    if has_multa:
+        status = "Cancelado por Inadimplência"
+        multa = next((i for i in invoices if "multa por rescisão" in i["ciclo"]), None)
+        mes_cancelamento = multa["referencia"] if multa else None
+        dias_atraso = 0
+        parcelas = 0
+        valor_parcela = 0.0
+        log_debug(f"Status definido: {status} (Multa encontrada em {mes_cancelamento})")
+    else:
+        status = determinar_status_faturas(invoices, data_checagem, data_vigencia, pode_checar_d3)
+        mes_cancelamento = None
+
+        if status == "Em atraso":
+            overdue = [i for i in mens_invoices if not i["pagamento"] and i["vencimento"] and i["vencimento"] <= data_checagem]
+            if overdue:
+                first = sorted(overdue, key=lambda x: x["vencimento"])[0]
+                try: parcelas = sorted(mens_invoices, key=lambda x: x["vencimento"]).index(first) + 1
+                except: parcelas = 1
+                valor_parcela = first["valor"]
+                dias_atraso = first["dias_atraso"]
+                log_debug(f"Status: Em atraso. Fatura mais antiga: {first['vencimento']}, Dias atraso: {dias_atraso}")
+            else:
+                parcelas = 0
+                valor_parcela = 0.0
+                dias_atraso = 0
+                log_debug("Status: Em atraso, mas não encontrei a fatura exata na lista filtrada. Zerando métricas.")
+        else:
+            parcelas = 0
+            valor_parcela = 0.0
+            dias_atraso = 0
+            log_debug(f"Status definido: {status}")
+
+    return {
+        "valor_parcela": valor_parcela,
+        "parcelas": parcelas,
+        "status": status,
+        "mes_cancelamento": mes_cancelamento,
+        "dias_atraso": dias_atraso
+    }
+
+
+# ============================================================================
+# SNAPSHOT DAS FATURAS (tabela faturas_snapshot)
+# ============================================================================
+
+def normalizar_faturas(invoices):
+    """Faturas em formato JSON (datas ISO), na ordem do portal, para gravar e comparar."""
+    return [
+        {
+            "ciclo": inv["ciclo"],
+            "referencia": inv["referencia"],
+            "vencimento": inv["vencimento"].isoformat() if inv["vencimento"] else None,
+            "pagamento": inv["pagamento"].isoformat() if inv["pagamento"] else None,
+            "valor": inv["valor"],
+            "dias_atraso": inv["dias_atraso"],
+        }
+        for inv in invoices
+    ]
+
+
+def faturas_normalizadas(linhas):
+    """Inverso de normalizar_faturas: volta às faturas usadas pelas regras."""
+    return [
+        dict(linha,
+             vencimento=date.fromisoformat(linha["vencimento"]) if linha["vencimento"] else None,
+             pagamento=date.fromisoformat(linha["pagamento"]) if linha["pagamento"] else None)
+        for linha in linhas
+    ]
+
+
+def hash_faturas(normalizadas):
+    """SHA-256 do conteúdo das faturas normalizadas."""
+    conteudo = json.dumps(normalizadas, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def contexto_analise(invoices, data_checagem, data_vigencia=None):
+    """
+    O que, além das faturas, muda o resultado de analisar_faturas: o mês da
+    checagem, a vigência, se o D+3 já passou e quantas faturas já venceram.
+    Mesmas faturas + mesmo contexto = mesmo resultado.
+    """
+    _, pode_checar_d3 = calcular_data_d3(data_vigencia, data_checagem) if data_vigencia else (None, False)
+    vencidas = sum(1 for i in invoices if i["vencimento"] and i["vencimento"] <= data_checagem)
+    vigencia = data_vigencia.isoformat() if data_vigencia else "-"
+    return f"{data_checagem:%Y-%m}|{vigencia}|{int(pode_checar_d3)}|{vencidas}"
@@ -0,0 +1,237 @@
+"""
+Tempo de parede por etapa do robô (menu, preenchimento, envio, extração...).
+
+Cada sessão mede suas etapas com `etapas.medir("nome")` e conta eventos
+(ex.: como chegou ao formulário de consulta) com `etapas.contar("nome")`;
+indicadores de estado (ex.: o controle de carga do portal) são atualizados com
+`etapas.definir("nome", valor)`. O registro é compartilhado entre as sessões e
+resumido no log ao fim de cada ciclo (p50/p95/máximo por etapa).
+
+Além do resumo por ciclo, o registro acumula desde o início do processo um
+histograma por etapa e o total de cada evento, exportados no formato texto do
+Prometheus pelo `ExportadorMetricas`: num arquivo regravado periodicamente
+(para o node_exporter/textfile ou para abrir à mão) e, opcionalmente, num
+endpoint HTTP local (`GET /metrics`).
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites (segundos) dos baldes dos histogramas: da sonda de sessão ao login
+LIMITES_HISTOGRAMA = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Amostras por etapa guardadas no ciclo para os percentis (as mais recentes)
+MAX_AMOSTRAS = 10000
+PREFIXO = "bot"
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def _nome_metrica(nome):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", nome)
+
+
+class RegistroEtapas:
+    """Quantidade, tempo total, máximo e percentis de cada etapa (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etapas = {}  # etapa -> [quantidade, total, máximo]
+        self._amostras = {}  # etapa -> tempos recentes do ciclo (percentis)
+        self._eventos = {}  # evento -> quantidade
+        self._indicadores = {}  # indicador -> valor atual (não é zerado entre ciclos)
+        # Acumulados desde o início do processo (não são zerados): exportação Prometheus
+        self._histogramas = {}  # etapa -> [contagem por balde (+Inf no fim), soma, quantidade]
+        self._eventos_total = {}
+
+    def registrar(self, etapa, segundos):
+        with self._lock:
+            dados = self._etapas.setdefault(etapa, [0, 0.0, 0.0])
+            dados[0] += 1
+            dados[1] += segundos
+            dados[2] = max(dados[2], segundos)
+            amostras = self._amostras.get(etapa)
+            if amostras is None:
+                amostras = self._amostras[etapa] = deque(maxlen=MAX_AMOSTRAS)
+            amostras.append(segundos)
+            histograma = self._histogramas.get(etapa)
+            if histograma is None:
+                histograma = self._histogramas[etapa] = [[0] * (len(LIMITES_HISTOGRAMA) + 1), 0.0, 0]
+            balde = next((i for i, limite in enumerate(LIMITES_HISTOGRAMA) if segundos <= limite),
+                         len(LIMITES_HISTOGRAMA))
+            histograma[0][balde] += 1
+            histograma[1] += segundos
+            histograma[2] += 1
+
+    def contar(self, evento):
+        with self._lock:
+            self._eventos[evento] = self._eventos.get(evento, 0) + 1
+            self._eventos_total[evento] = self._eventos_total.get(evento, 0) + 1
+
+    def contagem(self, evento):
+        with self._lock:
+            return self._eventos.get(evento, 0)
+
+    def definir(self, indicador, valor):
+        with self._lock:
+            self._indicadores[indicador] = valor
+
+    def indicadores(self):
+        with self._lock:
+            return dict(self._indicadores)
+
+    @contextmanager
+    def medir(self, etapa):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(etapa, time.perf_counter() - inicio)
+
+    def resumo(self):
+        with self._lock:
+            return [
+                {"etapa": etapa, "quantidade": qtd, "total": total, "media": total / qtd, "maximo": maximo,
+                 "p50": _percentil(self._amostras[etapa], 0.5), "p95": _percentil(self._amostras[etapa], 0.95)}
+                for etapa, (qtd, total, maximo) in sorted(self._etapas.items(), key=lambda item: -item[1][1])
+            ]
+
+    def zerar(self):
+        """Fecha o ciclo: zera o resumo por ciclo (os acumulados da exportação continuam)."""
+        with self._lock:
+            self._etapas = {}
+            self._amostras = {}
+            self._eventos = {}
+
+    def prometheus(self):
+        """Histogramas, eventos e indicadores no formato texto do Prometheus."""
+        with self._lock:
+            histogramas = {etapa: (list(baldes), soma, qtd) for etapa, (baldes, soma, qtd) in self._histogramas.items()}
+            eventos = dict(self._eventos_total)
+            indicadores = dict(self._indicadores)
+
+        linhas = [
+            f"# HELP {PREFIXO}_etapa_segundos Tempo de parede de cada etapa do robô.",
+            f"# TYPE {PREFIXO}_etapa_segundos histogram",
+        ]
+        for etapa, (baldes, soma, qtd) in sorted(histogramas.items()):
+            acumulado = 0
+            for limite, quantidade in zip(LIMITES_HISTOGRAMA + ("+Inf",), baldes):
+                acumulado += quantidade
+                linhas.append(f'{PREFIXO}_etapa_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+            linhas.append(f'{PREFIXO}_etapa_segundos_sum{{etapa="{etapa}"}} {soma:.6f}')
+            linhas.append(f'{PREFIXO}_etapa_segundos_count{{etapa="{etapa}"}} {qtd}')
+
+        linhas += [
+            f"# HELP {PREFIXO}_eventos_total Eventos contados pelo robô desde o início do processo.",
+            f"# TYPE {PREFIXO}_eventos_total counter",
+        ]
+        linhas += [f'{PREFIXO}_eventos_total{{evento="{evento}"}} {quantidade}'
+                   for evento, quantidade in sorted(eventos.items())]
+
+        for nome, valor in sorted(indicadores.items()):
+            if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+                continue
+            metrica = f"{PREFIXO}_{_nome_metrica(nome)}"
+            linhas += [f"# TYPE {metrica} gauge", f"{metrica} {valor}"]
+        return "\n".join(linhas) + "\n"
+
+    def registrar_no_log(self):
+        indicadores = self.indicadores()
+        if indicadores:
+            logging.info("📈 Indicadores: " + ", ".join(f"{nome}={valor}" for nome, valor in sorted(indicadores.items())))
+        linhas = self.resumo()
+        if not linhas:
+            return
+        logging.info(f"⏱️ Tempo por etapa: {'etapa':<12} {'qtd':>6} {'média':>8} {'p50':>8} {'p95':>8} "
+                     f"{'máx':>8} {'total':>9}")
+        for l in linhas:
+            logging.info(
+                f"⏱️                   {l['etapa']:<12} {l['quantidade']:>6} {l['media']:>7.2f}s "
+                f"{l['p50']:>7.2f}s {l['p95']:>7.2f}s {l['maximo']:>7.2f}s {l['total']:>8.1f}s"
+            )
+
+
+class ExportadorMetricas:
+    """
+    Regrava `caminho` com `registro.prometheus()` a cada `intervalo` segundos
+    (arquivo temporário + os.replace: quem lê nunca vê um arquivo pela metade)
+    e, com `porta`, serve o mesmo texto em http://127.0.0.1:<porta>/metrics.
+    """
+
+    def __init__(self, registro, caminho, intervalo=15.0, porta=None):
+        self.registro = registro
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self.porta = porta
+        self._parar = threading.Event()
+        self._thread = None
+        self._servidor = None
+
+    def iniciar(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="metricas", daemon=True)
+        self._thread.start()
+        if self.porta:
+            try:
+                self._servidor = ThreadingHTTPServer(("127.0.0.1", self.porta), self._manipulador())
+            except OSError as e:
+                logging.warning(f"Endpoint de métricas não iniciado na porta {self.porta}: {e}")
+            else:
+                threading.Thread(target=self._servidor.serve_forever, name="metricas-http", daemon=True).start()
+                logging.info(f"📈 Métricas em http://127.0.0.1:{self.porta}/metrics")
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            self.gravar()
+
+    def gravar(self):
+        try:
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            temporario = f"{self.caminho}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                f.write(self.registro.prometheus())
+            os.replace(temporario, self.caminho)
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar as métricas em {self.caminho}: {e}")
+
+    def _manipulador(self):
+        registro = self.registro
+
+        class Manipulador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                corpo = registro.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        return Manipulador
+
+    def parar(self):
+        self._parar.set()
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor = None
+        self.gravar()
+
+
+etapas = RegistroEtapas()
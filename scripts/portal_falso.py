@@ -0,0 +1,131 @@
+"""
+PORTAL FALSO: imita a consulta de faturas emitidas do SisAmil para testes.
+
+Serve o formulário de consulta e, no envio, a resposta gravada do contrato
+(scripts/fixtures/portal/<contrato>.html). Sem fixture, responde com o alerta
+"Nenhum registro encontrado". Sem o cookie de sessão, devolve a página de
+login (como o portal faz quando a sessão expira).
+
+Para gravar respostas reais como fixtures, rode o robô com
+BOT_GRAVAR_RESPOSTAS=<pasta> e renomeie os arquivos para <contrato>.html.
+
+Uso:
+    python scripts/portal_falso.py --porta 8765
+"""
+
+import os
+import threading
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+PASTA_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "portal")
+COOKIE_SESSAO = ("ASPSESSIONIDPORTAL", "sessao-teste")
+CAMINHO_FORMULARIO = "/corporativo/financeiro/consulta_fatura_emitida.asp"
+CAMINHO_CONSULTA = "/corporativo/financeiro/consulta_fatura_emitida_resultado.asp"
+
+PAGINA_FORMULARIO = """<html><head><title>Consultar Faturas Emitidas</title></head>
+<body>
+<form name="frm" id="frm" method="post" action="{acao}">
+    <input type="hidden" name="acao" value="consultar">
+    <input type="hidden" name="cd_empresa" value="001">
+    Contrato: <input type="text" id="num_contrato" name="nr_contrato" value="">
+    Referência de: <input type="text" id="dt_ini_ref" name="dt_ini" value="">
+    até: <input type="text" id="dt_fim_ref" name="dt_fim" value="">
+</form>
+</body></html>"""
+
+PAGINA_NENHUM_REGISTRO = """<html><head><script language="javascript">
+alert("Nenhum registro encontrado para os parâmetros informados.");
+history.back();
+</script></head><body></body></html>"""
+
+PAGINA_LOGIN = """<html><head><title>Portal do Corretor - Login</title></head>
+<body><form action="/login"><input id="login"><input id="senha" type="password"></form></body></html>"""
+
+
+def formulario_esperado(url_base):
+    """Descrição do formulário que o robô obteria via JS_DESCREVER_FORMULARIO."""
+    return {
+        "action": url_base + CAMINHO_CONSULTA,
+        "method": "post",
+        "campos": [["acao", "consultar"], ["cd_empresa", "001"], ["nr_contrato", ""], ["dt_ini", ""], ["dt_fim", ""]],
+        "nomes": {"num_contrato": "nr_contrato", "dt_ini_ref": "dt_ini", "dt_fim_ref": "dt_fim"},
+        "referer": url_base + CAMINHO_FORMULARIO,
+    }
+
+
+def cookies_sessao():
+    nome, valor = COOKIE_SESSAO
+    return [{"name": nome, "value": valor, "path": "/"}]
+
+
+class ManipuladorPortal(BaseHTTPRequestHandler):
+    pasta_fixtures = PASTA_FIXTURES
+    consultas = []
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, corpo, status=200):
+        dados = corpo.encode("iso-8859-1", errors="replace")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=iso-8859-1")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _sessao_valida(self):
+        cookies = SimpleCookie(self.headers.get("Cookie", ""))
+        nome, valor = COOKIE_SESSAO
+        return nome in cookies and cookies[nome].value == valor
+
+    def do_GET(self):
+        if not self._sessao_valida():
+            return self._responder(PAGINA_LOGIN)
+        if self.path.startswith(CAMINHO_FORMULARIO):
+            return self._responder(PAGINA_FORMULARIO.format(acao=CAMINHO_CONSULTA))
+        self._responder("Não encontrado", status=404)
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        campos = {k: v[0] for k, v in parse_qs(self.rfile.read(tamanho).decode("utf-8")).items()}
+        if not self._sessao_valida():
+            return self._responder(PAGINA_LOGIN)
+        if not self.path.startswith(CAMINHO_CONSULTA):
+            return self._responder("Não encontrado", status=404)
+        # Sem o campo oculto "acao" o ASP devolve o formulário vazio
+        if campos.get("acao") != "consultar":
+            return self._responder(PAGINA_FORMULARIO.format(acao=CAMINHO_CONSULTA))
+
+        contrato = campos.get("nr_contrato", "")
+        self.consultas.append(campos)
+        caminho = os.path.join(self.pasta_fixtures, f"{contrato}.html")
+        if contrato.isdigit() and os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as f:
+                return self._responder(f.read())
+        self._responder(PAGINA_NENHUM_REGISTRO)
+
+
+def iniciar_portal_falso(porta=0, pasta_fixtures=PASTA_FIXTURES):
+    """Sobe o portal numa thread. Retorna (servidor, url_base)."""
+    manipulador = type("Manipulador", (ManipuladorPortal,), {"pasta_fixtures": pasta_fixtures, "consultas": []})
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), manipulador)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Portal falso de faturas emitidas")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--fixtures", default=PASTA_FIXTURES)
+    args = parser.parse_args()
+
+    servidor, url = iniciar_portal_falso(args.porta, args.fixtures)
+    print(f"Portal falso em {url}{CAMINHO_FORMULARIO} (cookie {COOKIE_SESSAO[0]}={COOKIE_SESSAO[1]})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,253 @@
+"""
+Consulta de faturas emitidas sem navegador.
+
+Depois que o Selenium faz o login e abre "Consultar Faturas Emitidas" uma vez,
+o formulário do frame `principal` (URL de envio, método e campos ocultos) e os
+cookies da sessão são copiados para um `requests.Session`. As consultas
+seguintes enviam o formulário direto e leem a tabela `tbemitida_1` do HTML de
+resposta, sem renderizar página nem navegar pelos menus.
+
+Qualquer resposta inesperada (sessão expirada, formulário diferente, erro HTTP)
+levanta `FalhaConsultaHttp`; o robô então usa o caminho pelo navegador, que
+também ressincroniza cookies e formulário.
+
+Para testar sem o portal: scripts/portal_falso.py e scripts/teste_portal_http.py.
+"""
+
+import logging
+import os
+import re
+import time
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scripts.faturas import faturas_de_celulas
+
+ID_TABELA_FATURAS = "tbemitida_1"
+DATA_INICIAL_REFERENCIA = "01/2000"
+
+# Lê, no frame `principal`, o formulário que contém o campo num_contrato
+JS_DESCREVER_FORMULARIO = """
+var campo = document.getElementById('num_contrato');
+if (!campo || !campo.form) { return null; }
+var form = campo.form;
+var campos = [];
+for (var i = 0; i < form.elements.length; i++) {
+    var e = form.elements[i];
+    if (!e.name || e.disabled) { continue; }
+    if ((e.type === 'checkbox' || e.type === 'radio') && !e.checked) { continue; }
+    if (e.type === 'button' || e.type === 'submit' || e.type === 'file') { continue; }
+    campos.push([e.name, e.value]);
+}
+function nome(id) { var el = document.getElementById(id); return el ? el.name : null; }
+return {
+    action: form.action || document.location.href,
+    method: (form.getAttribute('method') || 'get').toLowerCase(),
+    campos: campos,
+    nomes: {num_contrato: campo.name, dt_ini_ref: nome('dt_ini_ref'), dt_fim_ref: nome('dt_fim_ref')},
+    referer: document.location.href
+};
+"""
+
+# Lê de uma vez o textContent das células de cada linha da tabela (arguments[0] = id),
+# com a mesma semântica do find_elements(By.TAG_NAME, "tr"/"td") usado antes
+JS_LINHAS_TABELA = """
+var tabela = document.getElementById(arguments[0]);
+if (!tabela) { return null; }
+var linhas = tabela.getElementsByTagName('tr');
+var resultado = [];
+for (var i = 0; i < linhas.length; i++) {
+    var celulas = linhas[i].getElementsByTagName('td');
+    var textos = [];
+    for (var j = 0; j < celulas.length; j++) { textos.push(celulas[j].textContent); }
+    resultado.push(textos);
+}
+return resultado;
+"""
+
+
+class FalhaConsultaHttp(Exception):
+    """A resposta não trouxe a tabela de faturas nem a mensagem de 'nenhum registro'."""
+
+
+class _LeitorTabela(HTMLParser):
+    """Extrai o textContent das células <td> de cada <tr> de uma tabela pelo id."""
+
+    def __init__(self, id_tabela):
+        super().__init__(convert_charrefs=True)
+        self.id_tabela = id_tabela
+        self.profundidade = 0
+        self.linhas = None
+        self._linha = None
+        self._celula = None
+
+    def _fechar_celula(self):
+        if self._celula is not None and self._linha is not None:
+            self._linha.append("".join(self._celula))
+        self._celula = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.profundidade == 0:
+            if tag == "table" and self.linhas is None and dict(attrs).get("id") == self.id_tabela:
+                self.profundidade = 1
+                self.linhas = []
+            return
+        if tag == "table":
+            self.profundidade += 1
+        elif tag == "tr":
+            self._fechar_celula()
+            self._linha = []
+            self.linhas.append(self._linha)
+        elif tag == "td":
+            self._fechar_celula()
+            self._celula = []
+
+    def handle_endtag(self, tag):
+        if self.profundidade == 0:
+            return
+        if tag == "td":
+            self._fechar_celula()
+        elif tag == "tr":
+            self._fechar_celula()
+            self._linha = None
+        elif tag == "table":
+            self.profundidade -= 1
+            if self.profundidade == 0:
+                self._fechar_celula()
+
+    def handle_data(self, data):
+        if self.profundidade and self._celula is not None:
+            self._celula.append(data)
+
+
+def ler_tabela_html(html, id_tabela=ID_TABELA_FATURAS):
+    """Linhas (listas de textos das células) da tabela, ou None se ela não existir."""
+    leitor = _LeitorTabela(id_tabela)
+    leitor.feed(html)
+    leitor.close()
+    return leitor.linhas
+
+
+class ClienteFaturasHttp:
+    """Envia o formulário de faturas emitidas com os cookies da sessão do navegador."""
+
+    MAX_FALHAS_SEGUIDAS = 3
+
+    def __init__(self, timeout=20, tamanho_pool=4, pasta_gravacao=None):
+        self.timeout = timeout
+        self.pasta_gravacao = pasta_gravacao
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=tamanho_pool, pool_maxsize=tamanho_pool)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+        self.formulario = None
+        self.falhas_seguidas = 0
+        self.desativado = False
+        self.consultas = 0
+
+    @property
+    def pronto(self):
+        return self.formulario is not None and not self.desativado
+
+    def sincronizar(self, driver):
+        """
+        Copia formulário, cookies e user-agent do navegador. O driver precisa
+        estar no frame `principal` com o formulário de consulta carregado.
+        """
+        try:
+            formulario = driver.execute_script(JS_DESCREVER_FORMULARIO)
+            if not formulario:
+                return False
+            self.configurar(
+                formulario,
+                driver.get_cookies(),
+                user_agent=driver.execute_script("return navigator.userAgent;")
+            )
+            logging.info(f"Consulta HTTP sincronizada com o navegador ({formulario['method'].upper()} {formulario['action']}).")
+            return True
+        except Exception as e:
+            logging.warning(f"Não foi possível sincronizar a consulta HTTP: {e}")
+            return False
+
+    def configurar(self, formulario, cookies, user_agent=None):
+        self.sessao.cookies.clear()
+        for cookie in cookies:
+            self.sessao.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain") or "", path=cookie.get("path", "/")
+            )
+        if user_agent:
+            self.sessao.headers["User-Agent"] = user_agent
+        if formulario.get("referer"):
+            self.sessao.headers["Referer"] = formulario["referer"]
+        self.formulario = formulario
+
+    def invalidar(self):
+        """Descarta formulário e cookies (ex.: novo login); a próxima consulta pelo navegador ressincroniza."""
+        self.formulario = None
+
+    def _registrar_falha(self):
+        self.falhas_seguidas += 1
+        self.invalidar()
+        if self.falhas_seguidas >= self.MAX_FALHAS_SEGUIDAS and not self.desativado:
+            self.desativado = True
+            logging.warning(
+                f"Consulta HTTP desativada nesta sessão após {self.falhas_seguidas} falhas seguidas; usando só o navegador."
+            )
+
+    def consultar(self, contrato, data_checagem):
+        """Lista de faturas do contrato (vazia quando o portal responde 'nenhum registro')."""
+        if not self.pronto:
+            raise FalhaConsultaHttp("Consulta HTTP não sincronizada")
+
+        formulario = self.formulario
+        dados = [(nome, valor) for nome, valor in formulario["campos"]
+                 if nome not in formulario["nomes"].values()]
+        nomes = formulario["nomes"]
+        dados.append((nomes["num_contrato"], contrato))
+        if nomes.get("dt_ini_ref"):
+            dados.append((nomes["dt_ini_ref"], DATA_INICIAL_REFERENCIA))
+        if nomes.get("dt_fim_ref"):
+            dados.append((nomes["dt_fim_ref"], data_checagem.strftime("%m/%Y")))
+
+        try:
+            if formulario["method"] == "post":
+                resposta = self.sessao.post(formulario["action"], data=dados, timeout=self.timeout)
+            else:
+                resposta = self.sessao.get(formulario["action"], params=dados, timeout=self.timeout)
+            resposta.raise_for_status()
+        except requests.RequestException as e:
+            self._registrar_falha()
+            raise FalhaConsultaHttp(f"Erro HTTP: {e}") from e
+
+        if not resposta.encoding:
+            resposta.encoding = resposta.apparent_encoding
+        html = resposta.text
+        self._gravar(contrato, html)
+
+        linhas = ler_tabela_html(html)
+        if linhas is not None:
+            faturas = faturas_de_celulas(linhas[1:])
+        elif re.search(r"nenhum\s+registro", html, re.IGNORECASE):
+            faturas = []
+        else:
+            self._registrar_falha()
+            raise FalhaConsultaHttp("Resposta sem a tabela de faturas (sessão expirada ou formulário diferente)")
+
+        self.falhas_seguidas = 0
+        self.consultas += 1
+        return faturas
+
+    def _gravar(self, contrato, html):
+        """Guarda a resposta bruta (BOT_GRAVAR_RESPOSTAS) para virar fixture do portal falso."""
+        if not self.pasta_gravacao:
+            return
+        try:
+            os.makedirs(self.pasta_gravacao, exist_ok=True)
+            caminho = os.path.join(self.pasta_gravacao, f"{contrato}_{time.strftime('%Y%m%d_%H%M%S')}.html")
+            with open(caminho, "w", encoding="utf-8") as f:
+                f.write(html)
+        except OSError as e:
+            logging.warning(f"Falha ao gravar resposta do portal: {e}")
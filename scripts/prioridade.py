@@ -0,0 +1,40 @@
+"""
+Prioridade dos contratos na fila de verificação do robô.
+
+Quanto maior a pontuação, antes o contrato é consultado. Com orçamento de
+tempo (--orcamento-minutos no modo --once), o que não couber fica para o
+próximo ciclo, então o trabalho de maior valor precisa vir primeiro.
+"""
+
+import math
+
+# Classe do status na fila (atrasados acima de ativos, ativos acima de mortos)
+PESO_TIPO = {"ATRASO": 300.0, "ATIVO": 100.0, "MORTO": 0.0}
+PESO_CRITICO = 200.0
+# Valor da parcela em escala log: R$ 100 ≈ 100 pontos, R$ 10.000 ≈ 200
+PESO_VALOR = 50.0
+# Atraso e idade da última checagem, limitados para não dominar o resto
+PESO_DIA_ATRASO = 2.0
+MAX_DIAS_ATRASO = 60
+PESO_DIA_SEM_CHECAGEM = 1.0
+MAX_DIAS_SEM_CHECAGEM = 60
+
+
+def pontuar(contrato, tipo, hoje):
+    """Pontuação de prioridade de um contrato candidato ("ATRASO", "ATIVO" ou "MORTO")."""
+    pontos = PESO_TIPO.get(tipo, 0.0)
+    if contrato.cliente_critico:
+        pontos += PESO_CRITICO
+
+    valor = float(contrato.valor_parcela or 0)
+    if valor > 0:
+        pontos += PESO_VALOR * math.log10(1 + valor)
+
+    pontos += PESO_DIA_ATRASO * min(contrato.dias_atraso or 0, MAX_DIAS_ATRASO)
+
+    if contrato.data_checagem:
+        dias_sem_checagem = (hoje - contrato.data_checagem).days
+    else:
+        dias_sem_checagem = MAX_DIAS_SEM_CHECAGEM
+    pontos += PESO_DIA_SEM_CHECAGEM * min(max(dias_sem_checagem, 0), MAX_DIAS_SEM_CHECAGEM)
+    return pontos
@@ -0,0 +1,175 @@
+"""
+REPLAY DE STATUS: reaplica as regras de status às faturas gravadas
+(tabela faturas_snapshot), sem portal e sem alterar o banco.
+
+Para testar uma mudança em determinar_status_faturas, no D+3 ou na regra de
+Cliente Morto (scripts/faturas.py): roda as regras atuais sobre a última
+versão das faturas de cada contrato e lista os contratos cujo status mudaria
+em relação ao que a automação gravou, com o motivo.
+
+Os contratos são processados em lotes, em paralelo (um processo por núcleo).
+A vazão esperada está em scripts/benchmark_replay_status.py.
+
+Uso:
+    python scripts/replay_status.py
+    python scripts/replay_status.py --data 2026-02-03 --saida logs/replay.csv
+    python scripts/replay_status.py --processos 1   # sem pool (depuração)
+"""
+
+import sys
+import os
+import argparse
+import csv
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.calendario_d3 import calcular_d3_vetorizado
+from scripts.faturas import (
+    analisar_faturas, calcular_data_d3, faturas_normalizadas, status_com_regra_morto, DIAS_ATRASO_PARA_MORTO
+)
+
+TAMANHO_LOTE = 2000
+EXEMPLOS_POR_MUDANCA = 5
+
+
+def motivo_status(invoices, data, data_vigencia, resultado, status, data_d3=None, pode_checar=None):
+    """Explicação curta do status calculado (a regra que decidiu)."""
+    multa = next((i for i in invoices if "multa por rescisão" in i["ciclo"]), None)
+    if multa:
+        return f"multa rescisória na fatura {multa['referencia']}"
+    vencida = next((i for i in invoices if i["vencimento"] and i["vencimento"] <= data and not i["pagamento"]), None)
+    if vencida:
+        motivo = f"fatura {vencida['referencia']} vencida em {vencida['vencimento']:%d/%m/%Y} sem pagamento"
+        if status != resultado["status"]:
+            motivo += f"; {resultado['dias_atraso']} dias de atraso (>= {DIAS_ATRASO_PARA_MORTO})"
+        return motivo
+    if resultado["status"] == "Pago":
+        return f"D+3 passou e a mensalidade {data:%m/%Y} está paga"
+    if not data_vigencia:
+        return "sem vigência e sem fatura vencida"
+    if data_d3 is None:
+        data_d3, pode_checar = calcular_data_d3(data_vigencia, data)
+    if not pode_checar:
+        return f"sem fatura vencida; D+3 em {data_d3:%d/%m/%Y}"
+    return f"sem fatura vencida; mensalidade {data:%m/%Y} sem pagamento registrado"
+
+
+def reprocessar_lote(lote):
+    """
+    Roda as regras para um lote de contratos
+    [(contrato_id, contrato, faturas, data ISO, vigência ISO ou None, status gravado)].
+    Retorna (quantidade, [(contrato_id, contrato, status gravado, status novo, motivo)]).
+    """
+    # D+3 do lote inteiro de uma vez (NaT = sem vigência)
+    datas_d3, pode_checar = calcular_d3_vetorizado(
+        np.array([item[4] or "NaT" for item in lote], dtype="datetime64[D]"),
+        np.array([item[3] for item in lote], dtype="datetime64[D]"),
+    )
+    mudancas = []
+    for (contrato_id, contrato, linhas, data, vigencia, gravado), data_d3, pode in zip(lote, datas_d3.tolist(), pode_checar.tolist()):
+        invoices = faturas_normalizadas(linhas)
+        data = date.fromisoformat(data)
+        vigencia = date.fromisoformat(vigencia) if vigencia else None
+        resultado = analisar_faturas(invoices, data, vigencia, pode_checar_d3=pode)
+        status = status_com_regra_morto(resultado["status"], resultado["dias_atraso"])
+        if status != gravado:
+            mudancas.append((contrato_id, contrato, gravado, status,
+                             motivo_status(invoices, data, vigencia, resultado, status, data_d3, pode)))
+    return len(lote), mudancas
+
+
+def reprocessar(lotes, processos):
+    """Aplica reprocessar_lote a cada lote (em paralelo com processos > 1), na ordem."""
+    if processos <= 1:
+        for lote in lotes:
+            yield reprocessar_lote(lote)
+        return
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        # Poucos lotes em andamento por vez: a leitura do banco não passa muito à frente
+        pendentes = []
+        for lote in lotes:
+            pendentes.append(executor.submit(reprocessar_lote, lote))
+            if len(pendentes) >= processos * 2:
+                yield pendentes.pop(0).result()
+        for futuro in pendentes:
+            yield futuro.result()
+
+
+def ler_lotes(data, tamanho_lote):
+    """Última versão das faturas de cada contrato, em lotes (consulta em streaming)."""
+    from app import db, Contrato, FaturaSnapshot
+
+    ultimas = db.select(db.func.max(FaturaSnapshot.id)).group_by(FaturaSnapshot.contrato_id)
+    consulta = (
+        db.select(
+            FaturaSnapshot.contrato_id, Contrato.contrato, FaturaSnapshot.faturas,
+            FaturaSnapshot.ultima_checagem, Contrato.data_vigencia, FaturaSnapshot.status
+        )
+        .join(Contrato, Contrato.id == FaturaSnapshot.contrato_id)
+        .where(FaturaSnapshot.id.in_(ultimas))
+        .order_by(FaturaSnapshot.contrato_id)
+        .execution_options(yield_per=tamanho_lote)
+    )
+    lote = []
+    for contrato_id, contrato, faturas, ultima_checagem, vigencia, status in db.session.execute(consulta):
+        lote.append((
+            contrato_id, contrato, faturas, (data or ultima_checagem).isoformat(),
+            vigencia.isoformat() if vigencia else None, status
+        ))
+        if len(lote) >= tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reaplica as regras de status às faturas gravadas")
+    parser.add_argument("--data", type=date.fromisoformat, default=None,
+                        help="Data da análise (AAAA-MM-DD). Padrão: a data da última checagem de cada contrato")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE)
+    parser.add_argument("--saida", help="CSV com todas as mudanças (contrato, status gravado, novo, motivo)")
+    args = parser.parse_args()
+
+    from app import app
+    # As regras logam cada fatura em INFO ([DEBUG]); aqui seriam milhares de linhas
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        inicio = time.perf_counter()
+        total = 0
+        mudancas = []
+        for quantidade, mudancas_lote in reprocessar(ler_lotes(args.data, args.lote), args.processos):
+            total += quantidade
+            mudancas.extend(mudancas_lote)
+        segundos = time.perf_counter() - inicio
+
+    print(f"{total} contratos reprocessados em {segundos:.2f}s com {args.processos} processo(s) "
+          f"({total / segundos if segundos else 0:.0f} contratos/s)")
+    print(f"{len(mudancas)} contratos mudariam de status")
+
+    transicoes = Counter((gravado, novo) for _, _, gravado, novo, _ in mudancas)
+    for (gravado, novo), quantidade in transicoes.most_common():
+        print(f"\n  {gravado or '-'} -> {novo}: {quantidade}")
+        exemplos = [m for m in mudancas if (m[2], m[3]) == (gravado, novo)][:EXEMPLOS_POR_MUDANCA]
+        for _, contrato, _, _, motivo in exemplos:
+            print(f"    {contrato}: {motivo}")
+
+    if args.saida:
+        with open(args.saida, "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f, delimiter=";")
+            escritor.writerow(["contrato_id", "contrato", "status_gravado", "status_novo", "motivo"])
+            escritor.writerows(mudancas)
+        print(f"\nMudanças gravadas em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+TESTE DO CALENDÁRIO D+3 VETORIZADO: confere scripts/calendario_d3.py (e os
+atalhos de scripts/faturas.py que o usam) contra a implementação escalar
+original, para todas as vigências (dias 1 a 31 e sem vigência) em todos os
+dias de vários anos, inclusive fevereiros bissextos e viradas de ano.
+
+Não usa o banco.
+
+Uso:
+    python scripts/teste_calendario_d3.py
+    python scripts/teste_calendario_d3.py --de 2000 --ate 2040
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+from datetime import date, timedelta
+
+import numpy as np
+
+from scripts.calendario_d3 import calcular_d3_vetorizado
+from scripts.faturas import (
+    DIAS_D3, DIAS_RECHECAGEM_MORTO, HORIZONTE_BUSCA_D3, STATUS_AGENDADOS, STATUS_ATIVOS, STATUS_ATRASO,
+    STATUS_MORTO, calcular_data_d3, calcular_proxima_checagem, calcular_proximas_checagens
+)
+
+falhas = []
+
+
+def conferir(descricao, divergencias, total):
+    if not divergencias:
+        print(f"[OK] {descricao} ({total} casos)")
+    else:
+        print(f"[X] {descricao}: {len(divergencias)} de {total} casos divergentes, ex.: {divergencias[:3]}")
+        falhas.append(descricao)
+
+
+# Implementação escalar original (referência do teste)
+
+def calcular_data_d3_escalar(data_vigencia: date, hoje: date):
+    """Cópia da implementação escalar original de calcular_data_d3 (referência)."""
+    if not data_vigencia:
+        return hoje, False
+
+    dia_vencimento = data_vigencia.day
+    
+    # Calcula vencimento do mês atual
+    try:
+        vencimento_mes_atual = data_vigencia.replace(
+            year=hoje.year, 
+            month=hoje.month
+        )
+    except ValueError:
+        # Trata casos onde o dia não existe no mês atual
+        if hoje.month == 2:
+            try:
+                vencimento_mes_atual = date(hoje.year, 2, 29)
+            except ValueError:
+                vencimento_mes_atual = date(hoje.year, 2, 28)
+        elif hoje.month in [4, 6, 9, 11] and dia_vencimento == 31:
+            vencimento_mes_atual = date(hoje.year, hoje.month, 30)
+        else:
+            vencimento_mes_atual = date(hoje.year, hoje.month, dia_vencimento)
+
+    data_d3_atual = vencimento_mes_atual + timedelta(days=DIAS_D3)
+    # log_debug(f"Calculando D+3. Vigência: {data_vigencia}, Hoje: {hoje}. Vencimento Mês Atual: {vencimento_mes_atual}, D+3 Atual: {data_d3_atual}")
+    
+    # CORREÇÃO CRÍTICA: Para vigências de fim de mês (28-31)
+    if dia_vencimento >= 28:
+        # Calcula mês anterior
+        if hoje.month == 1:
+            mes_anterior = 12
+            ano_anterior = hoje.year - 1
+        else:
+            mes_anterior = hoje.month - 1
+            ano_anterior = hoje.year
+        
+        # Calcula vencimento do mês anterior
+        try:
+            vencimento_mes_anterior = date(ano_anterior, mes_anterior, dia_vencimento)
+        except ValueError:
+            if mes_anterior == 2:
+                try:
+                    vencimento_mes_anterior = date(ano_anterior, 2, 29)
+                except ValueError:
+                    vencimento_mes_anterior = date(ano_anterior, 2, 28)
+            elif mes_anterior in [4, 6, 9, 11] and dia_vencimento == 31:
+                vencimento_mes_anterior = date(ano_anterior, mes_anterior, 30)
+            else:
+                vencimento_mes_anterior = date(ano_anterior, mes_anterior, dia_vencimento)
+        
+        data_d3_anterior = vencimento_mes_anterior + timedelta(days=DIAS_D3)
+        
+        if data_d3_anterior.month == hoje.month:
+            pode_checar = hoje >= data_d3_anterior
+            return data_d3_anterior, pode_checar
+    
+    if data_d3_atual.month != hoje.month:
+        dias_desde_vencimento = (hoje - vencimento_mes_atual).days
+        pode_checar = dias_desde_vencimento >= DIAS_D3
+    else:
+        pode_checar = hoje >= data_d3_atual
+    
+    return data_d3_atual, pode_checar
+
+
+def calcular_proxima_checagem_escalar(status, data_vigencia, ultima_checagem, hoje):
+    """Cópia do cálculo escalar original de proxima_checagem (referência)."""
+    if status == STATUS_ATRASO:
+        return ultima_checagem + timedelta(days=1) if ultima_checagem else hoje
+    if status == STATUS_MORTO:
+        return ultima_checagem + timedelta(days=DIAS_RECHECAGEM_MORTO) if ultima_checagem else hoje
+    if status not in STATUS_ATIVOS or not data_vigencia:
+        return None
+
+    # Mesma regra da seleção antiga (pode checar e última checagem antes do D+3),
+    # avaliada dia a dia a partir do dia seguinte à última checagem
+    dia = ultima_checagem + timedelta(days=1) if ultima_checagem else hoje
+    for _ in range(HORIZONTE_BUSCA_D3):
+        data_d3, pode_checar = calcular_data_d3_escalar(data_vigencia, dia)
+        if pode_checar and (not ultima_checagem or ultima_checagem < data_d3):
+            return dia
+        dia += timedelta(days=1)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere o D+3 vetorizado contra o escalar original")
+    parser.add_argument("--de", type=int, default=2020, help="Primeiro ano (padrão: 2020)")
+    parser.add_argument("--ate", type=int, default=2031, help="Último ano (padrão: 2031)")
+    args = parser.parse_args()
+
+    dias = np.arange(np.datetime64(f"{args.de}-01-01"), np.datetime64(f"{args.ate + 1}-01-01"))
+    # O ano/mês da vigência não importa, só o dia; inclui vigências em meses curtos
+    vigencias = [date(2019, 1, d) for d in range(1, 32)] + [date(2020, 2, 29), date(2021, 4, 30), None]
+    print(f"Dias {dias[0]} a {dias[-1]} x {len(vigencias)} vigências")
+    print("-" * 70)
+
+    # 1. Matriz vigências x dias inteira de uma vez contra o escalar original
+    datas_d3, pode = calcular_d3_vetorizado(
+        np.array([np.datetime64(v, "D") if v else np.datetime64("NaT", "D") for v in vigencias])[:, None],
+        dias[None, :]
+    )
+    datas_d3, pode = datas_d3.astype(object), pode
+    divergencias = []
+    for i, vigencia in enumerate(vigencias):
+        for j, dia in enumerate(dias.astype(object)):
+            esperado = calcular_data_d3_escalar(vigencia, dia)
+            if (datas_d3[i, j], bool(pode[i, j])) != esperado:
+                divergencias.append((vigencia, dia, esperado, (datas_d3[i, j], bool(pode[i, j]))))
+    conferir("calcular_d3_vetorizado = escalar original", divergencias, datas_d3.size)
+
+    # 2. Atalho escalar (usado por analisar_faturas)
+    rnd = random.Random(7)
+    amostra = [(rnd.choice(vigencias), dia) for dia in rnd.sample(list(dias.astype(object)), 2000)]
+    divergencias = [(v, d) for v, d in amostra if calcular_data_d3(v, d) != calcular_data_d3_escalar(v, d)]
+    conferir("calcular_data_d3 = escalar original", divergencias, len(amostra))
+
+    # 3. Agenda (proxima_checagem) de lotes de contratos contra o cálculo escalar
+    status_possiveis = STATUS_AGENDADOS + ("Cancelado por Regra",)
+    divergencias, total = [], 0
+    for hoje in rnd.sample(list(dias.astype(object)), 60):
+        lote = [(rnd.choice(status_possiveis), rnd.choice(vigencias),
+                 rnd.choice([None, hoje - timedelta(days=rnd.randint(0, 45))])) for _ in range(100)]
+        obtido = calcular_proximas_checagens(*zip(*lote), hoje)
+        for (status, vigencia, ultima), proxima in zip(lote, obtido):
+            esperado = calcular_proxima_checagem_escalar(status, vigencia, ultima, hoje)
+            if proxima != esperado:
+                divergencias.append((status, vigencia, ultima, hoje, esperado, proxima))
+            if calcular_proxima_checagem(status, vigencia, ultima, hoje) != esperado:
+                divergencias.append(("atalho", status, vigencia, ultima, hoje))
+        total += len(lote)
+    conferir("calcular_proximas_checagens = cálculo escalar", divergencias, total)
+
+    print("-" * 70)
+    if falhas:
+        print(f"[X] {len(falhas)} verificação(ões) falharam")
+        sys.exit(1)
+    print("[OK] Todas as verificações passaram")
+
+
+if __name__ == "__main__":
+    main()
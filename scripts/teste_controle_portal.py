@@ -0,0 +1,79 @@
+"""
+TESTE DO CONTROLE DO PORTAL: confere o disjuntor de scripts/controle_portal.py
+no caminho fechado -> aberto -> meio-aberto, inclusive a vez de teste
+devolvida sem resultado (fila vazia ou contrato sem número), que não pode
+deixar o disjuntor meio-aberto para sempre.
+
+Não usa o banco nem o portal (tempos de espera reduzidos).
+
+Uso:
+    python scripts/teste_controle_portal.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+
+import scripts.controle_portal as controle_portal
+from scripts.controle_portal import ControlePortal, ABERTO, FECHADO, MEIO_ABERTO, FALHAS_SEGUIDAS_PARA_ABRIR
+
+falhas = []
+
+
+def conferir(descricao, condicao, detalhe=""):
+    if condicao:
+        print(f"[OK] {descricao}")
+    else:
+        print(f"[X] {descricao} {detalhe}")
+        falhas.append(descricao)
+
+
+def abrir(controle):
+    for _ in range(FALHAS_SEGUIDAS_PARA_ABRIR):
+        controle.aguardar_vez(time.monotonic() + 5)
+        controle.observar(False, 0.1)
+        controle.liberar()
+
+
+def main():
+    controle_portal.ESPERA_DISJUNTOR = 0.2
+    controle = ControlePortal(2)
+
+    # 1. Falhas seguidas abrem o disjuntor
+    abrir(controle)
+    conferir("falhas seguidas abrem o disjuntor", controle.estado == ABERTO, controle.estado)
+
+    # 2. Passada a espera, a vez de teste é concedida (meio-aberto) e só uma
+    conferir("vez de teste concedida após a espera", controle.aguardar_vez(time.monotonic() + 5))
+    conferir("disjuntor meio-aberto durante o teste", controle.estado == MEIO_ABERTO, controle.estado)
+    conferir("segunda vez bloqueada durante o teste", not controle.aguardar_vez(time.monotonic() + 0.3))
+
+    # 3. Vez de teste devolvida sem resultado: a próxima sessão ganha a vez
+    controle.liberar()
+    conferir("vez de teste devolvida sem resultado libera o teste", not controle._teste_em_andamento)
+    conferir("próxima vez concedida após devolução sem resultado", controle.aguardar_vez(time.monotonic() + 5))
+
+    # 4. Consulta de teste bem-sucedida fecha o disjuntor
+    controle.observar(True, 0.1)
+    controle.liberar()
+    conferir("teste bem-sucedido fecha o disjuntor", controle.estado == FECHADO, controle.estado)
+
+    # 5. Teste que falha reabre com a espera dobrada
+    abrir(controle)
+    controle.aguardar_vez(time.monotonic() + 5)
+    controle.observar(False, 0.1)
+    controle.liberar()
+    conferir("teste que falha reabre o disjuntor", controle.estado == ABERTO, controle.estado)
+    conferir("espera dobrada na reabertura", controle.espera_disjuntor == 0.4, controle.espera_disjuntor)
+
+    print("-" * 70)
+    if falhas:
+        print(f"[X] {len(falhas)} verificação(ões) falharam")
+        sys.exit(1)
+    print("[OK] Todas as verificações passaram")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from datetime import date, timedelta, datetime
 from app import app, db, Contrato
-from scripts.automacao import calcular_data_d3, DIAS_D3
+from scripts.calendario_d3 import calcular_d3_vetorizado, como_datas
 
 class TesteD3Producao:
     """Classe para testar D+3 em produção com simulação de datas."""
@@ -97,13 +97,15 @@ class TesteD3Producao:
             contratos_para_verificar = []
             contratos_nao_verificar = []
             
-            for contrato in contratos_ativos:
+            # Usa a mesma lógica da automação (calendário D+3 vetorizado, todos de uma vez)
+            datas_d3, pode = calcular_d3_vetorizado(
+                como_datas([c.data_vigencia for c in contratos_ativos]), como_datas(data_hoje_simulada)
+            )
+            
+            for contrato, data_d3, pode_checar in zip(contratos_ativos, datas_d3.tolist(), pode.tolist()):
                 if not contrato.data_vigencia:
                     continue
                 
-                # Usa a mesma lógica da automação
-                data_d3, pode_checar = calcular_data_d3(contrato.data_vigencia, data_hoje_simulada)
-                
                 if not pode_checar:
                     contratos_nao_verificar.append({
                         'contrato': contrato,
@@ -297,9 +299,12 @@ class TesteD3Producao:
                 'erros': []
             }
             
-            for contrato in contratos_encontrados:
+            datas_d3, pode = calcular_d3_vetorizado(
+                como_datas([c.data_vigencia for c in contratos_encontrados]), como_datas(data_hoje_simulada)
+            )
+            
+            for contrato, data_d3, pode_checar in zip(contratos_encontrados, datas_d3.tolist(), pode.tolist()):
                 try:
-                    data_d3, pode_checar = calcular_data_d3(contrato.data_vigencia, data_hoje_simulada)
                     
                     if not pode_checar:
                         resultados['nao_seriam_verificados'].append({
@@ -0,0 +1,115 @@
+"""
+TESTE DA CONSULTA HTTP: roda a consulta de faturas sem navegador contra o
+portal falso (scripts/portal_falso.py) com as respostas gravadas em
+scripts/fixtures/portal, e confere faturas e status.
+
+Não usa o banco nem o portal real.
+
+Uso:
+    python scripts/teste_portal_http.py
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import date
+
+from scripts.faturas import analisar_faturas
+from scripts.portal_http import ClienteFaturasHttp, FalhaConsultaHttp, ler_tabela_html
+from scripts.portal_falso import iniciar_portal_falso, formulario_esperado, cookies_sessao
+
+HOJE = date(2025, 12, 15)
+VIGENCIA = date(2024, 3, 10)  # D+3 em 13/12/2025
+
+falhas = []
+
+
+def conferir(descricao, obtido, esperado):
+    if obtido == esperado:
+        print(f"[OK] {descricao}")
+    else:
+        print(f"[X] {descricao}: esperado {esperado!r}, obtido {obtido!r}")
+        falhas.append(descricao)
+
+
+def novo_cliente(url_base):
+    cliente = ClienteFaturasHttp(timeout=5)
+    cliente.configurar(formulario_esperado(url_base), cookies_sessao())
+    return cliente
+
+
+def main():
+    servidor, url_base = iniciar_portal_falso()
+    print(f"Portal falso em {url_base}")
+    print("-" * 70)
+
+    try:
+        cliente = novo_cliente(url_base)
+
+        # 1. Todas as faturas pagas, inclusive a do mês vigente após o D+3
+        faturas = cliente.consultar("9000001", HOJE)
+        conferir("9000001: 4 faturas extraídas", len(faturas), 4)
+        conferir("9000001: valor convertido", faturas[0]["valor"], 1234.56)
+        conferir("9000001: vencimento convertido", faturas[0]["vencimento"], date(2025, 9, 10))
+        conferir("9000001: status Pago", analisar_faturas(faturas, HOJE, VIGENCIA)["status"], "Pago")
+
+        # 2. Duas mensalidades em aberto: vale a mais antiga
+        faturas = cliente.consultar("9000002", HOJE)
+        conferir("9000002: pagamento vazio (&nbsp;) vira None", faturas[2]["pagamento"], None)
+        resultado = analisar_faturas(faturas, HOJE, VIGENCIA)
+        conferir("9000002: status Em atraso", resultado["status"], "Em atraso")
+        conferir("9000002: parcela da fatura mais antiga", resultado["parcelas"], 3)
+        conferir("9000002: valor da fatura mais antiga", resultado["valor_parcela"], 987.10)
+        conferir("9000002: dias de atraso", resultado["dias_atraso"], 40)
+
+        # 3. Multa rescisória
+        resultado = analisar_faturas(cliente.consultar("9000003", HOJE), HOJE, VIGENCIA)
+        conferir("9000003: status Cancelado por Inadimplência", resultado["status"], "Cancelado por Inadimplência")
+        conferir("9000003: mês de cancelamento", resultado["mes_cancelamento"], "11/2025")
+
+        # 4. Sem fixture: alerta "nenhum registro" -> sem faturas, Em dia
+        faturas = cliente.consultar("9000999", HOJE)
+        conferir("9000999: nenhum registro", faturas, [])
+        conferir("9000999: status Em dia", analisar_faturas(faturas, HOJE, VIGENCIA)["status"], "Em dia")
+
+        # 5. Campos enviados no formulário
+        enviado = servidor.RequestHandlerClass.consultas[0]
+        conferir("Campos ocultos enviados", (enviado["acao"], enviado["cd_empresa"]), ("consultar", "001"))
+        conferir("Período enviado", (enviado["dt_ini"], enviado["dt_fim"]), ("01/2000", "12/2025"))
+
+        # 6. Sessão expirada: página de login -> falha (robô usa o navegador)
+        expirado = ClienteFaturasHttp(timeout=5)
+        expirado.configurar(formulario_esperado(url_base), [])
+        try:
+            expirado.consultar("9000001", HOJE)
+            conferir("Sessão expirada levanta FalhaConsultaHttp", False, True)
+        except FalhaConsultaHttp:
+            conferir("Sessão expirada levanta FalhaConsultaHttp", True, True)
+        conferir("Sessão expirada invalida a sincronização", expirado.pronto, False)
+
+        # 7. Formulário diferente (sem o campo oculto): desativa após falhas seguidas
+        mudado = novo_cliente(url_base)
+        for _ in range(ClienteFaturasHttp.MAX_FALHAS_SEGUIDAS):
+            mudado.configurar(dict(formulario_esperado(url_base), campos=[]), cookies_sessao())
+            try:
+                mudado.consultar("9000001", HOJE)
+            except FalhaConsultaHttp:
+                pass
+        conferir("Desativado após falhas seguidas", mudado.desativado, True)
+
+        # 8. Leitor de tabela: td sem fechamento e tabela ausente
+        conferir("td sem </td>", ler_tabela_html('<table id="tbemitida_1"><tr><td>a<td>b</tr></table>'), [["a", "b"]])
+        conferir("Tabela ausente", ler_tabela_html("<html><body>login</body></html>"), None)
+    finally:
+        servidor.shutdown()
+
+    print("-" * 70)
+    if falhas:
+        print(f"[X] {len(falhas)} verificação(ões) falharam")
+        sys.exit(1)
+    print("[OK] Todas as verificações passaram")
+
+
+if __name__ == "__main__":
+    main()
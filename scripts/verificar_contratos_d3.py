@@ -8,9 +8,12 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import app, db, Contrato
-from datetime import datetime, date, timedelta
+from datetime import datetime, timedelta
 import pytz
 import csv
+import numpy as np
+
+from scripts.calendario_d3 import DIAS_D3, calcular_d3_vetorizado, como_datas
 
 # Lista de contratos fornecida pelo usuário
 contratos_afetados = [
@@ -756,38 +759,36 @@ contratos_afetados = [
 ]
 
 
-def calcular_d3_correto(contrato, hoje):
+def calcular_d3_correto(contratos, hoje):
     """
-    Calcula a lógica D+3 correta conforme implementada em automacao.py
+    Calcula a lógica D+3 da automação (scripts/calendario_d3.py) para todos
+    os contratos de uma vez. Retorna um dicionário por contrato, na mesma ordem.
     """
-    dia_vencimento = contrato.data_vigencia.day
-    
-    try:
-        vencimento_mes_atual = contrato.data_vigencia.replace(year=hoje.year, month=hoje.month)
-    except ValueError:
-        if hoje.month == 2:
-            vencimento_mes_atual = date(hoje.year, 2, 28)
-        elif hoje.month in [4, 6, 9, 11] and dia_vencimento == 31:
-            vencimento_mes_atual = date(hoje.year, hoje.month, 30)
-        else:
-            vencimento_mes_atual = date(hoje.year, hoje.month, dia_vencimento)
-    
-    data_para_checar = vencimento_mes_atual + timedelta(days=3)
-    
-    # CORREÇÃO D+3: Se D+3 cai no próximo mês, calcula quantos dias já se passaram
-    if data_para_checar.month != hoje.month:
-        dias_desde_vencimento = (hoje - vencimento_mes_atual).days
-        pode_checar = dias_desde_vencimento >= 3
-    else:
-        pode_checar = hoje >= data_para_checar
+    datas_d3, pode = calcular_d3_vetorizado(como_datas([c.data_vigencia for c in contratos]), np.datetime64(hoje, "D"))
     
-    return {
-        'vencimento_mes_atual': vencimento_mes_atual,
-        'data_para_checar': data_para_checar,
-        'dias_desde_vencimento': (hoje - vencimento_mes_atual).days if data_para_checar.month != hoje.month else None,
-        'pode_checar': pode_checar,
-        'd3_cai_proximo_mes': data_para_checar.month != hoje.month
-    }
+    calculos = []
+    for contrato, data_para_checar, pode_checar in zip(contratos, datas_d3.tolist(), pode.tolist()):
+        if not contrato.data_vigencia:
+            calculos.append({
+                'vencimento_mes_atual': None,
+                'data_para_checar': None,
+                'dias_desde_vencimento': None,
+                'pode_checar': False,
+                'd3_cai_proximo_mes': False
+            })
+            continue
+        
+        # Vencimento do mês (ou do mês anterior, para vigências de fim de mês)
+        vencimento = data_para_checar - timedelta(days=DIAS_D3)
+        d3_cai_proximo_mes = data_para_checar.month != vencimento.month
+        calculos.append({
+            'vencimento_mes_atual': vencimento,
+            'data_para_checar': data_para_checar,
+            'dias_desde_vencimento': (hoje - vencimento).days if d3_cai_proximo_mes else None,
+            'pode_checar': pode_checar,
+            'd3_cai_proximo_mes': d3_cai_proximo_mes
+        })
+    return calculos
 
 
 def verificar_contratos():
@@ -808,6 +809,7 @@ def verificar_contratos():
         print(f"Total de contratos na lista: {len(contratos_afetados)}")
         print(f"{'='*80}\n")
         
+        contratos = []
         for num_contrato in contratos_afetados:
             contrato = Contrato.query.filter_by(contrato=num_contrato).first()
             
@@ -816,9 +818,13 @@ def verificar_contratos():
                 continue
             
             contratos_encontrados.append(num_contrato)
-            
-            # Calcula a lógica D+3 correta
-            calc_d3 = calcular_d3_correto(contrato, hoje)
+            contratos.append(contrato)
+        
+        # Calcula a lógica D+3 correta (todos os contratos de uma vez)
+        calculos_d3 = calcular_d3_correto(contratos, hoje)
+        
+        for contrato, calc_d3 in zip(contratos, calculos_d3):
+            num_contrato = contrato.contrato
             
             # Determina se deveria ser checado hoje
             deve_checar_hoje = False